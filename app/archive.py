@@ -0,0 +1,99 @@
+import argparse
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete, insert
+from sqlmodel import Session, select
+from app.config import ARCHIVE_HORIZON_DAYS, ARCHIVE_BATCH_SIZE, MULTI_WORKER
+from app.database import begin_immediate
+from app.models import Booking, BookingArchive, to_local_naive
+from app.interval_index import booking_index
+from app.cache import table_versions
+from app.changelog import change_feed
+
+# Archivace minulých rezervací: přesun z booking do booking_archive po dávkách.
+# Kontrola kolizí i limitu uživatele pracují jen s hlavní tabulkou, takže
+# historie nezvětšuje jejich indexy ani in-memory index rezervací.
+
+ARCHIVE_COLUMNS = ("id", "room_id", "user_id", "start_time", "end_time", "attendees")
+
+
+def archive_horizon(now: Optional[datetime] = None) -> datetime:
+    """Hranice archivace – rezervace skončené před ní jsou minulost."""
+    return (now or datetime.now()) - timedelta(days=ARCHIVE_HORIZON_DAYS)
+
+
+def archive_batch_statement(before: datetime, batch_size: int):
+    """Dávka nejstarších rezervací skončených před `before` (index ix_booking_end)."""
+    return select(Booking.id, Booking.room_id, Booking.user_id, Booking.start_time, Booking.end_time,
+                  Booking.attendees).where(
+        Booking.end_time < before
+    ).order_by(Booking.end_time).limit(batch_size)
+
+
+def archive_bookings(session: Session, before: datetime, batch_size: int = ARCHIVE_BATCH_SIZE):
+    """
+    Přesune rezervace skončené před `before` do booking_archive.
+    Každá dávka je vlastní krátká transakce (INSERT … SELECT + DELETE), takže
+    zámek pro zápis se mezi dávkami uvolní a vytváření rezervací neblokuje.
+    Vrací počet přesunutých rezervací a dávek.
+    """
+    before = to_local_naive(before)  # hranice se zónou (API, --before) na lokální čas rezervací
+    if before > datetime.now():
+        raise ValueError("Only past bookings can be archived")
+    if batch_size <= 0:
+        raise ValueError("Batch size must be positive")
+
+    archived = batches = 0
+    while True:
+        begin_immediate(session)
+        rows = session.execute(archive_batch_statement(before, batch_size)).all()
+        if not rows:
+            session.rollback()
+            break
+
+        ids = [row.id for row in rows]
+        columns = [getattr(Booking, name) for name in ARCHIVE_COLUMNS]
+        session.execute(insert(BookingArchive).from_select(ARCHIVE_COLUMNS,
+                                                           select(*columns).where(Booking.id.in_(ids))))
+        session.execute(delete(Booking).where(Booking.id.in_(ids)))
+        change_feed.record_bookings(session, "archived", rows)
+        session.commit()
+
+        for row in rows:
+            booking_index.remove(row.room_id, row.start_time, row.end_time, row.id)
+        table_versions.bump(Booking.__tablename__, BookingArchive.__tablename__)
+        archived += len(rows)
+        batches += 1
+        if len(rows) < batch_size:
+            break
+
+    return {"archived": archived, "batches": batches, "before": before}
+
+
+def main():
+    """
+    Archivace z příkazové řádky (např. z cronu): python -m app.archive
+    S MULTI_WORKER=1 zapisuje do change_log jako další worker, takže běžící
+    server přesun převezme. Server s jedním procesem (MULTI_WORKER=0) změny
+    jiných procesů nesleduje – za běhu archivujte přes POST /bookings/archive.
+    """
+    from app.database import engine, create_db_and_tables
+
+    parser = argparse.ArgumentParser(description="Přesune minulé rezervace do booking_archive.")
+    parser.add_argument("--before", type=datetime.fromisoformat, help="výchozí: dnes - ARCHIVE_HORIZON_DAYS")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    if MULTI_WORKER:
+        change_feed.start(engine)
+    try:
+        with Session(engine) as session:
+            result = archive_bookings(session, args.before or archive_horizon(), args.batch_size)
+    finally:
+        change_feed.stop()
+    print(f"Archived {result['archived']} bookings in {result['batches']} batches")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import hashlib
+import threading
+import time
+import uuid
+from bisect import bisect_right, insort
+from collections import OrderedDict
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import datetime, timedelta, timezone
+from typing import Optional, TYPE_CHECKING
+from sqlmodel import Session, select
+from app.config import (ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL, RESPONSE_CACHE_SIZE, IDEMPOTENCY_CACHE_SIZE,
+                        IDEMPOTENCY_TTL_HOURS)
+from app.models import Booking, Room, User
+from app.interval_index import booking_index
+
+if TYPE_CHECKING:
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+class FutureBookingCounter:
+    """
+    Počítadlo budoucích rezervací po uživatelích pro pravidlo limitu.
+
+    Pro každého uživatele drží seřazené začátky jeho budoucích rezervací.
+    Při prvním dotazu se načtou z DB (index user_id, start_time), pak se jen
+    udržují při vytvoření/smazání rezervace. Začátky, které už uplynuly,
+    se při dotazu odříznou binárním hledáním – počet je pak len() seznamu.
+    """
+
+    def __init__(self):
+        self._starts: dict[int, list[datetime]] = {}
+        self._lock = threading.Lock()
+
+    def count(self, session: Session, user_id: int, now: Optional[datetime] = None) -> int:
+        """Počet budoucích rezervací uživatele (start_time > now)."""
+        now = now or datetime.now()
+        with self._lock:
+            starts = self._starts.get(user_id)
+            if starts is not None:
+                return self._expire(starts, now)
+
+        loaded = list(session.exec(self._starts_statement(user_id, now)))
+        return self._store(user_id, loaded, now)
+
+    async def count_async(self, session: "AsyncSession", user_id: int, now: Optional[datetime] = None) -> int:
+        """Varianta count() nad AsyncSession (DATABASE_MODE=async)."""
+        now = now or datetime.now()
+        with self._lock:
+            starts = self._starts.get(user_id)
+            if starts is not None:
+                return self._expire(starts, now)
+
+        loaded = list(await session.exec(self._starts_statement(user_id, now)))
+        return self._store(user_id, loaded, now)
+
+    @staticmethod
+    def _starts_statement(user_id: int, now: datetime):
+        return select(Booking.start_time).where(
+            Booking.user_id == user_id,
+            Booking.start_time > now
+        ).order_by(Booking.start_time)
+
+    def _store(self, user_id: int, loaded: list[datetime], now: datetime) -> int:
+        with self._lock:
+            # mezitím mohl seznam založit jiný požadavek – ten má přednost
+            starts = self._starts.setdefault(user_id, loaded)
+            return self._expire(starts, now)
+
+    @staticmethod
+    def _expire(starts: list[datetime], now: datetime) -> int:
+        del starts[:bisect_right(starts, now)]
+        return len(starts)
+
+    def add(self, user_id: int, start_time: datetime):
+        """Započítá nově uloženou rezervaci (jen pokud už uživatele známe)."""
+        with self._lock:
+            starts = self._starts.get(user_id)
+            if starts is not None:
+                insort(starts, start_time)
+
+    def remove(self, user_id: int, start_time: datetime):
+        """Odečte smazanou rezervaci."""
+        with self._lock:
+            starts = self._starts.get(user_id)
+            if starts is not None and start_time in starts:
+                starts.remove(start_time)
+
+    def clear(self):
+        with self._lock:
+            self._starts = {}
+
+
+class LRUCache:
+    """
+    Velikostně omezená LRU cache s TTL a počítadly zásahů.
+    Při překročení `maxsize` vyhazuje nejdéle nepoužitou položku,
+    položky starší než `ttl` sekund se považují za chybějící.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, self._MISSING)
+            if entry is not self._MISSING and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not self._MISSING:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl,
+                    "hits": self.hits, "misses": self.misses}
+
+
+class EntityCache:
+    """
+    Read-through cache místností (kapacita) a existence uživatelů pro create_booking.
+    Kešuje i „nenalezeno“, proto create_room/create_user (a budoucí úpravy
+    a mazání) musí dotčené id zneplatnit.
+    """
+
+    _NOT_FOUND = False
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.rooms = LRUCache(maxsize, ttl)
+        self.users = LRUCache(maxsize, ttl)
+
+    def get_room(self, session: Session, room_id: int) -> Optional[Room]:
+        """Vrátí odpojenou kopii místnosti (nebo None, pokud neexistuje)."""
+        cached = self.rooms.get(room_id)
+        if cached is None:
+            room = session.get(Room, room_id)
+            cached = Room(id=room.id, name=room.name, capacity=room.capacity) if room else self._NOT_FOUND
+            self.rooms.set(room_id, cached)
+        return cached or None
+
+    def user_exists(self, session: Session, user_id: int) -> bool:
+        cached = self.users.get(user_id)
+        if cached is None:
+            cached = session.get(User, user_id) is not None
+            self.users.set(user_id, cached)
+        return cached
+
+    def invalidate_room(self, room_id: int):
+        self.rooms.invalidate(room_id)
+
+    def invalidate_user(self, user_id: int):
+        self.users.invalidate(user_id)
+
+    def clear(self):
+        self.rooms.clear()
+        self.users.clear()
+
+    def stats(self):
+        return {"rooms": self.rooms.stats(), "users": self.users.stats()}
+
+
+class TableVersions:
+    """
+    Monotónně rostoucí verze tabulek pro HTTP cache výpisů.
+    Každý zápis do tabulky verzi zvýší; ETag = tabulka + verze + dotaz.
+    Součástí ETagu je i náhodné id běhu procesu, aby se po restartu
+    (verze znovu od nuly) nepotkal se starým ETagem klienta. Přesný čas
+    poslední změny tabulky slouží pro Last-Modified (před první změnou čas startu).
+    """
+
+    def __init__(self):
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.started = datetime.now(timezone.utc)
+        self._versions: dict[str, int] = {}
+        self._modified: dict[str, datetime] = {}
+        self._lock = threading.Lock()
+
+    def get(self, table: str) -> int:
+        with self._lock:
+            return self._versions.get(table, 0)
+
+    def bump(self, *tables: str):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+                self._modified[table] = now
+
+    def bump_all(self):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            for table in self._versions:
+                self._versions[table] += 1
+                self._modified[table] = now
+
+    def last_modified(self, table: str) -> datetime:
+        with self._lock:
+            return self._modified.get(table, self.started)
+
+    def etag(self, table: str, query: str = "") -> str:
+        digest = hashlib.sha1(query.encode()).hexdigest()[:12]
+        return f'"{table}-{self.boot_id}-{self.get(table)}-{digest}"'
+
+
+def last_modified_header(last_modified: datetime, now: Optional[datetime] = None) -> Optional[str]:
+    """
+    Hodnota Last-Modified (HTTP-date, přesnost na sekundy), nebo None, dokud
+    sekunda poslední změny neskončila. Jinak by změna později ve stejné
+    sekundě měla stejné Last-Modified a If-Modified-Since by ji schoval (304).
+    """
+    second = last_modified.replace(microsecond=0)
+    if (now or datetime.now(timezone.utc)) < second + timedelta(seconds=1):
+        return None
+    return format_datetime(second, usegmt=True)
+
+
+def not_modified_since(if_modified_since: Optional[str], last_modified: datetime) -> bool:
+    """Vyhodnotí hlavičku If-Modified-Since (HTTP-date, přesnost na sekundy)."""
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return last_modified.replace(microsecond=0) <= since
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Vyhodnotí hlavičku If-None-Match (seznam ETagů, W/ prefix i `*`)."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+# Sdílené instance pro celou aplikaci
+user_counter = FutureBookingCounter()
+entity_cache = EntityCache(ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL)
+table_versions = TableVersions()
+# Serializované odpovědi výpisů podle ETagu – staré verze vypadnou z LRU samy
+response_cache = LRUCache(RESPONSE_CACHE_SIZE, ttl=float("inf"))
+# Odpovědi podle Idempotency-Key (před tabulkou idempotency_key)
+idempotency_cache = LRUCache(IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL_HOURS * 3600)
+
+
+def reset_caches():
+    """Zahodí veškerý in-memory stav odvozený z DB (testy, výměna databáze)."""
+    booking_index.clear()
+    user_counter.clear()
+    entity_cache.clear()
+    table_versions.bump_all()
+    response_cache.clear()
+    idempotency_cache.clear()
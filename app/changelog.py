@@ -0,0 +1,209 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+from sqlalchemy import delete, insert
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+from app.config import CHANGE_LOG_RETENTION_HOURS, CHANGE_LOG_PRUNE_MINUTES
+from app.models import Booking, BookingArchive, ChangeLog, Room, User
+from app.interval_index import RoomIntervalIndex, booking_index
+from app.cache import (FutureBookingCounter, EntityCache, TableVersions, LRUCache, user_counter, entity_cache,
+                       table_versions, response_cache)
+from app.events import EventBus, event_bus, booking_event
+
+# Sdílení změn mezi workery (MULTI_WORKER=1, např. uvicorn --workers N).
+# Každý proces drží vlastní index rezervací, počítadlo limitu, cache entit
+# a verze tabulek. Zápis proto ve stejné transakci přidá řádek do change_log
+# a ostatní procesy ho převezmou: před každým požadavkem a pod BEGIN IMMEDIATE
+# před kontrolou kolizí se podívají na PRAGMA data_version (mění se jen po
+# commitu jiného spojení) a teprve když se změnil, přečtou nové řádky logu.
+
+
+class ChangeFeed:
+    """
+    Zapisuje změny do change_log a aplikuje změny ostatních procesů na
+    in-memory stav. Dokud není spuštěný (start), record_* i poll nic nedělají.
+    """
+
+    def __init__(self, index: RoomIntervalIndex = booking_index, counter: FutureBookingCounter = user_counter,
+                 entities: EntityCache = entity_cache, versions: TableVersions = table_versions,
+                 responses: LRUCache = response_cache, bus: EventBus = event_bus):
+        self.index = index
+        self.counter = counter
+        self.entities = entities
+        self.versions = versions
+        self.responses = responses
+        self.bus = bus
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.enabled = False
+        self.last_id = 0
+        self.applied = 0
+        self.resyncs = 0
+        self.last_pruned: Optional[datetime] = None
+        self.prune_interval = timedelta(minutes=CHANGE_LOG_PRUNE_MINUTES)
+        self._engine: Optional[Engine] = None
+        self._watch: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def start(self, engine: Engine):
+        """
+        Zapne sdílení změn. Volá se před načtením indexu – změny zapsané mezi
+        startem a načtením se pak aplikují podruhé, což index ani cache nerozbije.
+        """
+        self._engine = engine
+        # Vlastní spojení jen pro data_version – hodnota je per spojení, pool by ji míchal
+        self._watch = sqlite3.connect(engine.url.database, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._data_version = self._read_data_version()
+            self.last_id = self._watch.execute("SELECT COALESCE(MAX(id), 0) FROM change_log").fetchone()[0]
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+        if self._watch is not None:
+            self._watch.close()
+            self._watch = None
+
+    def _read_data_version(self) -> int:
+        return self._watch.execute("PRAGMA data_version").fetchone()[0]
+
+    # === Zápis (ve stejné transakci jako změna) ===
+
+    def record(self, session: Session, table: str, action: str, entity_id: Optional[int] = None):
+        if self.enabled:
+            session.add(ChangeLog(table_name=table, action=action, entity_id=entity_id, origin=self.origin))
+
+    def record_bookings(self, session: Session, action: str, bookings: Iterable,
+                        previous: Optional[Iterable] = None):
+        """
+        Zapíše změnu rezervací (objekty Booking nebo řádky se stejnými sloupci) jedním executemany.
+        U úprav je `previous` původní podoba rezervací (ostatní ji musí vyřadit z indexu).
+        """
+        if not self.enabled:
+            return
+        bookings = list(bookings)
+        if any(booking.id is None for booking in bookings):
+            session.flush()  # id nově vložených rezervací
+        payloads = [booking_event(booking) for booking in bookings]
+        if previous is not None:
+            for payload, before in zip(payloads, previous):
+                payload["previous"] = booking_event(before)
+        rows = [{"table_name": Booking.__tablename__, "action": action, "entity_id": booking.id,
+                 "origin": self.origin, "payload": json.dumps(payload)}
+                for booking, payload in zip(bookings, payloads)]
+        if rows:
+            session.execute(insert(ChangeLog), rows)
+
+    # === Převzetí změn ostatních procesů ===
+
+    def poll(self) -> int:
+        """Aplikuje nové změny ostatních procesů; bez commitu jinde stojí jen PRAGMA data_version."""
+        if not self.enabled:
+            return 0
+        with self._lock:
+            data_version = self._read_data_version()
+            if data_version == self._data_version:
+                return 0
+            self._data_version = data_version
+            rows = self._watch.execute(
+                "SELECT id, table_name, action, entity_id, origin, payload FROM change_log "
+                "WHERE id > ? ORDER BY id", (self.last_id,)
+            ).fetchall()
+            if not rows:
+                return 0
+            if rows[0][0] != self.last_id + 1:
+                # nepřevzaté změny mezitím promazal prune() – stav se načte znovu
+                self._resync()
+                self.last_id = rows[-1][0]
+                return len(rows)
+
+            applied, tables = 0, set()
+            for change_id, table, action, entity_id, origin, payload in rows:
+                self.last_id = change_id
+                if origin == self.origin:
+                    continue  # vlastní změny už v paměti jsou
+                self._apply(table, action, entity_id, payload)
+                tables.add(table)
+                applied += 1
+            if Booking.__tablename__ in tables:
+                tables.add(BookingArchive.__tablename__)
+            if tables:
+                self.versions.bump(*tables)
+            self.applied += applied
+            return applied
+
+    def _apply(self, table: str, action: str, entity_id: Optional[int], payload: Optional[str]):
+        if table == Room.__tablename__:
+            self.entities.invalidate_room(entity_id)
+        elif table == User.__tablename__:
+            self.entities.invalidate_user(entity_id)
+        elif table == Booking.__tablename__:
+            data = json.loads(payload)
+            booking = _booking(entity_id, data)
+            previous = _booking(entity_id, data["previous"]) if "previous" in data else None
+            if action in ("deleted", "archived"):
+                self.index.remove(booking.room_id, booking.start_time, booking.end_time, booking.id)
+                self.counter.remove(booking.user_id, booking.start_time)
+            else:
+                if previous is not None:
+                    self.index.remove(previous.room_id, previous.start_time, previous.end_time, previous.id)
+                    self.counter.remove(previous.user_id, previous.start_time)
+                self.index.add(booking)
+                self.counter.add(booking.user_id, booking.start_time)
+            if action != "archived":
+                self.bus.publish(f"booking.{action}", booking.room_id, data,
+                                 previous_room_id=previous.room_id if previous is not None else None)
+
+    def _resync(self):
+        """Zahodí odvozený stav a index načte znovu z DB."""
+        with Session(self._engine) as session:
+            self.index.load(session)
+        self.counter.clear()
+        self.entities.clear()
+        self.versions.bump_all()
+        self.responses.clear()
+        self.resyncs += 1
+
+    def prune(self, session: Session, now: Optional[datetime] = None) -> int:
+        """Smaže záznamy starší než CHANGE_LOG_RETENTION_HOURS (proces, který je nepřevzal, se resynchronizuje)."""
+        now = now or datetime.now()
+        self.last_pruned = now
+        before = now - timedelta(hours=CHANGE_LOG_RETENTION_HOURS)
+        result = session.execute(delete(ChangeLog).where(ChangeLog.created_at < before))
+        session.commit()
+        return result.rowcount
+
+    def prune_due(self, now: Optional[datetime] = None) -> bool:
+        return self.enabled and (self.last_pruned is None
+                                 or (now or datetime.now()) - self.last_pruned >= self.prune_interval)
+
+    def prune_if_due(self, now: Optional[datetime] = None) -> int:
+        """
+        Promaže change_log, pokud od posledního promazání uplynul CHANGE_LOG_PRUNE_MINUTES
+        (volá se mimo poll – ten běží i pod BEGIN IMMEDIATE jiného spojení).
+        """
+        with self._lock:
+            if not self.prune_due(now):
+                return 0
+            self.last_pruned = now or datetime.now()  # souběžné požadavky už nemažou znovu
+        with Session(self._engine) as session:
+            return self.prune(session, now)
+
+    def stats(self):
+        return {"enabled": self.enabled, "origin": self.origin, "last_id": self.last_id,
+                "applied": self.applied, "resyncs": self.resyncs, "last_pruned": self.last_pruned}
+
+
+def _booking(booking_id: int, data: dict) -> Booking:
+    return Booking(id=booking_id, room_id=data["room_id"], user_id=data["user_id"],
+                   start_time=datetime.fromisoformat(data["start_time"]),
+                   end_time=datetime.fromisoformat(data["end_time"]), attendees=data["attendees"])
+
+
+# Sdílená instance pro celou aplikaci
+change_feed = ChangeFeed()
@@ -0,0 +1,59 @@
+import os
+
+# Konfigurace aplikace – čte se z proměnných prostředí při importu.
+
+# Soubor SQLite databáze (vytvoří se sám)
+SQLITE_FILE = os.getenv("SQLITE_FILE", "database.db")
+
+# Režim databázové vrstvy pro rezervace: "sync" (výchozí) nebo "async" (aiosqlite)
+DATABASE_MODE = os.getenv("DATABASE_MODE", "sync")
+
+# Velikost poolu spojení async enginu
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "5"))
+
+# Profil SQLite nastavovaný na každém novém spojení (PRAGMA)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-64000"))  # záporné = v KiB
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # ms
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+
+# Cache místností a uživatelů pro create_booking (počet položek, TTL v sekundách)
+ENTITY_CACHE_SIZE = int(os.getenv("ENTITY_CACHE_SIZE", "1024"))
+ENTITY_CACHE_TTL = float(os.getenv("ENTITY_CACHE_TTL", "300"))
+
+# Cache serializovaných odpovědí výpisů (počet položek)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+
+# Materializované denní souhrny obsazenosti pro /stats/utilization ("1" = zapnuto)
+USAGE_ROLLUPS = os.getenv("USAGE_ROLLUPS", "0") == "1"
+
+# Měření doby požadavků, kroků rezervace a SQL dotazů pro GET /metrics ("0" = vypnuto)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Archivace: rezervace skončené před více než N dny se přesouvají do booking_archive
+ARCHIVE_HORIZON_DAYS = int(os.getenv("ARCHIVE_HORIZON_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+
+# ICS kalendáře: kolik dní zpět zahrnout a počet kešovaných VEVENT fragmentů
+ICS_PAST_DAYS = int(os.getenv("ICS_PAST_DAYS", "30"))
+ICS_FRAGMENT_CACHE_SIZE = int(os.getenv("ICS_FRAGMENT_CACHE_SIZE", "10000"))
+
+# Události GET /events: délka fronty odběratele (pak je odpojen) a interval heartbeatu v sekundách
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+
+# Více workerů nad jednou DB ("1" = změny se zapisují do change_log a ostatní procesy
+# je před požadavkem převezmou), jak dlouho (hodiny) se záznamy v change_log drží
+# a jak často (minuty) je každý proces promazává
+MULTI_WORKER = os.getenv("MULTI_WORKER", "0") == "1"
+CHANGE_LOG_RETENTION_HOURS = float(os.getenv("CHANGE_LOG_RETENTION_HOURS", "24"))
+CHANGE_LOG_PRUNE_MINUTES = float(os.getenv("CHANGE_LOG_PRUNE_MINUTES", "60"))
+
+# Idempotency-Key u POST /bookings/, /rooms/ a /users/: jak dlouho (hodiny) se uložená
+# odpověď vrací místo nového provedení, kolik odpovědí držet v paměti a jak dlouho
+# (sekundy) opakování čeká na dokončení rozpracovaného požadavku se stejným klíčem
+IDEMPOTENCY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "1024"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
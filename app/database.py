@@ -1,17 +1,136 @@
+from sqlalchemy import event, text
 from sqlmodel import SQLModel, create_engine, Session
+from app.config import (SQLITE_FILE, DATABASE_MODE, DATABASE_POOL_SIZE, SQLITE_JOURNAL_MODE,
+                        SQLITE_SYNCHRONOUS, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE, SQLITE_BUSY_TIMEOUT,
+                        SQLITE_TEMP_STORE)
+from app.models import Booking, BookingArchive
 
 # Název souboru databáze (vytvoří se sám)
-sqlite_file_name = "database.db"
+sqlite_file_name = SQLITE_FILE
 sqlite_url = f"sqlite:///{sqlite_file_name}"
 
+# Ladicí profil SQLite: WAL (čtenáři neblokují zápis a naopak), synchronous=NORMAL
+# (ve WAL bezpečné, fsync jen při checkpointu), mmap a větší cache pro čtení,
+# busy_timeout místo okamžité chyby "database is locked", dočasné tabulky v paměti.
+SQLITE_PRAGMAS = {
+    "journal_mode": SQLITE_JOURNAL_MODE,
+    "synchronous": SQLITE_SYNCHRONOUS,
+    "mmap_size": SQLITE_MMAP_SIZE,
+    "cache_size": SQLITE_CACHE_SIZE,
+    "busy_timeout": SQLITE_BUSY_TIMEOUT,
+    "temp_store": SQLITE_TEMP_STORE,
+}
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Listener `connect` – nastaví profil na každém novém DBAPI spojení."""
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+def read_sqlite_pragmas(connection):
+    """Vrátí aktuální hodnoty profilových PRAGMA na daném spojení."""
+    return {
+        name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+        for name in SQLITE_PRAGMAS
+    }
+
 # check_same_thread=False je potřeba pro SQLite ve FastAPI
 engine = create_engine(sqlite_url, connect_args={"check_same_thread": False})
+event.listen(engine, "connect", apply_sqlite_pragmas)
+
+# Async engine (aiosqlite) se vytváří jen v režimu DATABASE_MODE=async,
+# aby sync nasazení nepotřebovalo aiosqlite nainstalované.
+async_engine = None
+if DATABASE_MODE == "async":
+    from sqlalchemy.ext.asyncio import create_async_engine
+    async_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{sqlite_file_name}",
+        pool_size=DATABASE_POOL_SIZE,
+    )
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
 
 def create_db_and_tables():
-    """Vytvoří tabulky v databázi podle modelů."""
-    SQLModel.metadata.create_all(engine)
+    """
+    Vytvoří tabulky v databázi podle modelů.
+    Při více workerech startuje každý proces zvlášť – schéma se proto vytváří
+    v jedné transakci pod BEGIN IMMEDIATE: první proces ho vytvoří, ostatní
+    počkají na zámek (busy_timeout) a najdou hotové tabulky i indexy.
+    """
+    with engine.connect() as connection:
+        if connection.dialect.name == "sqlite":
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        SQLModel.metadata.create_all(connection)
+        migrate_booking_autoincrement(connection)
+        migrate_indexes(connection)
+        connection.commit()
+
+def migrate_booking_autoincrement(connection):
+    """
+    Přestaví tabulku booking ze starší databáze na AUTOINCREMENT.
+    Bez něj SQLite po archivaci nejvyšší rezervace přidělí její id znovu.
+    SQLite AUTOINCREMENT dodatečně přidat neumí, proto se tabulka přejmenuje,
+    vytvoří znovu podle modelu a řádky se zkopírují. Čítač sqlite_sequence
+    začne za nejvyšším id z booking i booking_archive. Volá se v transakci
+    create_db_and_tables; je idempotentní.
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    sql = connection.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'booking'"
+    )).scalar()
+    if sql is None or "AUTOINCREMENT" in sql.upper():
+        return
+
+    table = Booking.__table__
+    columns = ", ".join(column.name for column in table.columns)
+    connection.exec_driver_sql("ALTER TABLE booking RENAME TO booking_old")
+    # indexy zůstaly u přejmenované tabulky – nová je vytvoří pod stejnými názvy
+    for index in table.indexes:
+        connection.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+    table.create(connection)
+    connection.exec_driver_sql(f"INSERT INTO booking ({columns}) SELECT {columns} FROM booking_old")
+    connection.exec_driver_sql("DROP TABLE booking_old")
+    last_id = connection.execute(text(
+        f"SELECT max(coalesce((SELECT max(id) FROM booking), 0), "
+        f"coalesce((SELECT max(id) FROM {BookingArchive.__tablename__}), 0))"
+    )).scalar()
+    connection.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = 'booking'")
+    connection.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('booking', :seq)"),
+                       {"seq": last_id})
+
+def migrate_indexes(bind):
+    """
+    Doplní chybějící indexy do existující databáze.
+    create_all() indexy vytváří jen spolu s novou tabulkou, takže starší
+    database.db by je jinak nikdy nedostala. Volání je idempotentní.
+    """
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+
+def begin_immediate(session: Session):
+    """
+    Zahájí zápisovou transakci hned (BEGIN IMMEDIATE), ne až prvním INSERTem.
+    Zámek pro zápis se tak získá před kontrolami kolizí a limitu, takže jiný
+    proces nemůže mezi kontrolou a vložením uložit kolidující rezervaci.
+    """
+    connection = session.connection()
+    if connection.dialect.name != "sqlite":
+        return
+    dbapi_connection = connection.connection.dbapi_connection
+    # aiosqlite adaptér drží sqlite3 spojení o úroveň níž
+    raw = getattr(dbapi_connection, "_connection", dbapi_connection)
+    if not raw.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
 
 def get_session():
     """Dependency pro FastAPI - dává nám session pro práci s DB."""
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+async def get_async_session():
+    """Async varianta get_session (jen v režimu DATABASE_MODE=async)."""
+    from sqlmodel.ext.asyncio.session import AsyncSession
+    async with AsyncSession(async_engine) as session:
+        yield session
@@ -0,0 +1,133 @@
+import asyncio
+import itertools
+import json
+import threading
+from typing import AsyncIterator, Optional
+from app.config import EVENTS_QUEUE_SIZE, EVENTS_HEARTBEAT
+
+# Události o změnách rezervací pro GET /events (Server-Sent Events).
+# Zápisy běží ve vláknech threadpoolu, odběratelé v event loopu – publish()
+# proto předá událost do loopu přes call_soon_threadsafe. Každý odběratel má
+# omezenou frontu; kdo nestíhá, dostane "dropped" a spojení se ukončí.
+
+
+class Subscriber:
+    def __init__(self, room_id: Optional[int], queue_size: int):
+        self.room_id = room_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = False
+
+
+# Značka ve frontě: odběratel nestíhal a bude odpojen
+DROPPED = object()
+
+
+class EventBus:
+    """
+    In-process pub/sub nad asyncio frontami.
+    Odběratelé jsou rozdělení podle místnosti, takže událost se doručí jen
+    odběratelům dané místnosti a těm bez filtru. Bez odběratelů je publish()
+    jen kontrola prázdného slovníku.
+    """
+
+    def __init__(self, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: dict[Optional[int], set[Subscriber]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.dropped_total = 0
+
+    def subscribe(self, room_id: Optional[int] = None) -> Subscriber:
+        """Zaregistruje odběratele (volá se z event loopu)."""
+        subscriber = Subscriber(room_id, self.queue_size)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._subscribers.setdefault(room_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            group = self._subscribers.get(subscriber.room_id)
+            if group is not None:
+                group.discard(subscriber)
+                if not group:
+                    del self._subscribers[subscriber.room_id]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(group) for group in self._subscribers.values())
+
+    def publish(self, event_type: str, room_id: int, data: dict, previous_room_id: Optional[int] = None):
+        """
+        Pošle událost odběratelům (bezpečné volat z libovolného vlákna, po commitu).
+        Při přesunu rezervace do jiné místnosti ji dostanou i odběratelé původní.
+        """
+        with self._lock:
+            if not self._subscribers or self._loop is None:
+                return
+            loop = self._loop
+        # serializuje se jednou pro všechny odběratele
+        frame = (f"id: {next(self._ids)}\nevent: {event_type}\n"
+                 f"data: {json.dumps(data, default=str, separators=(',', ':'))}\n\n").encode()
+        try:
+            loop.call_soon_threadsafe(self._deliver, room_id, frame, previous_room_id)
+        except RuntimeError:
+            pass  # loop už neběží (vypínání serveru)
+
+    def _deliver(self, room_id: int, frame: bytes, previous_room_id: Optional[int] = None):
+        with self._lock:
+            targets = {*self._subscribers.get(room_id, ()), *self._subscribers.get(None, ())}
+            if previous_room_id is not None:
+                targets.update(self._subscribers.get(previous_room_id, ()))
+        for subscriber in targets:
+            if subscriber.dropped:
+                continue
+            try:
+                subscriber.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                # backpressure: pomalého odběratele odpojíme místo čekání na něj
+                subscriber.dropped = True
+                self.dropped_total += 1
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait(DROPPED)
+
+    def clear(self):
+        with self._lock:
+            self._subscribers = {}
+            self._loop = None
+
+
+async def event_stream(bus: EventBus, room_id: Optional[int] = None,
+                       heartbeat: float = EVENTS_HEARTBEAT) -> AsyncIterator[bytes]:
+    """
+    SSE stream jednoho odběratele. Odběr vzniká až se začátkem streamu a končí
+    v finally (i při odpojení klienta). Při nečinnosti posílá komentář jako
+    heartbeat (udrží spojení přes proxy a odhalí odpojené klienty).
+    """
+    subscriber = bus.subscribe(room_id)
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                frame = await asyncio.wait_for(subscriber.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if frame is DROPPED:
+                yield b"event: dropped\ndata: {\"reason\":\"slow consumer\"}\n\n"
+                return
+            yield frame
+    finally:
+        bus.unsubscribe(subscriber)
+
+
+def booking_event(booking) -> dict:
+    return {"id": booking.id, "room_id": booking.room_id, "user_id": booking.user_id,
+            "start_time": booking.start_time.isoformat(), "end_time": booking.end_time.isoformat(),
+            "attendees": booking.attendees}
+
+
+# Sdílená instance pro celou aplikaci
+event_bus = EventBus()
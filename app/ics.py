@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+from app.config import ICS_FRAGMENT_CACHE_SIZE
+from app.cache import LRUCache, entity_cache
+from app.queries import STREAM_CHUNK_SIZE
+
+# iCalendar (RFC 5545) feedy rezervací pro kalendářové klienty.
+# Každá rezervace je jeden VEVENT fragment; fragmenty se kešují podle obsahu
+# rezervace, takže opakované generování feedu jen skládá hotové bajty.
+
+PRODID = "-//spravce-zasedacek//Rezervacni system//CS"
+UID_DOMAIN = "spravce-zasedacek"
+
+# Klíč = obsah fragmentu (id, místnost a její název, časy, účastníci) – změna = nový fragment
+fragment_cache = LRUCache(ICS_FRAGMENT_CACHE_SIZE, ttl=float("inf"))
+
+
+def escape_text(value: str) -> str:
+    """Escapování hodnoty typu TEXT (\\, ;, , a konce řádků)."""
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def fold_line(line: str) -> bytes:
+    """Zalomí řádek po 75 oktetech (pokračování začíná mezerou) a přidá CRLF."""
+    data = line.encode()
+    if len(data) <= 75:
+        return data + b"\r\n"
+    parts, start, limit = [], 0, 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        # nerozdělit vícebajtový UTF-8 znak
+        while end < len(data) and data[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(data[start:end])
+        start, limit = end, 74
+    return b"\r\n ".join(parts) + b"\r\n"
+
+
+def format_time(moment: datetime) -> str:
+    """Plovoucí místní čas (bez zóny) – stejně jako se časy ukládají v DB."""
+    return moment.strftime("%Y%m%dT%H%M%S")
+
+
+def vevent(booking_id: int, room_id: int, start_time: datetime, end_time: datetime, attendees: int,
+           room_name: Optional[str]) -> bytes:
+    """VEVENT jedné rezervace (z cache, pokud se rezervace nezměnila)."""
+    key = (booking_id, room_id, room_name, start_time, end_time, attendees)
+    fragment = fragment_cache.get(key)
+    if fragment is None:
+        room = room_name or f"Room {room_id}"
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:booking-{booking_id}@{UID_DOMAIN}",
+            f"DTSTAMP:{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}",
+            f"DTSTART:{format_time(start_time)}",
+            f"DTEND:{format_time(end_time)}",
+            f"SUMMARY:{escape_text(room)}",
+            f"LOCATION:{escape_text(room)}",
+            f"DESCRIPTION:{escape_text(f'Attendees: {attendees}')}",
+            "END:VEVENT",
+        ]
+        fragment = b"".join(fold_line(line) for line in lines)
+        fragment_cache.set(key, fragment)
+    return fragment
+
+
+def stream_calendar(engine: Engine, statement, name: str,
+                    chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Streamuje VCALENDAR nad dotazem na rezervace (booking_page_statement).
+    Řádky čte po dávkách jako stream_ndjson; názvy místností bere z entity cache.
+    """
+    yield b"".join(fold_line(line) for line in (
+        "BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}", "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{escape_text(name)}",
+    ))
+    with Session(engine) as session:
+        results = session.execute(statement.execution_options(yield_per=chunk_size))
+        for chunk in results.partitions():
+            parts = []
+            for row in chunk:
+                room = entity_cache.get_room(session, row.room_id)
+                parts.append(vevent(row.id, row.room_id, row.start_time, row.end_time, row.attendees,
+                                    room.name if room else None))
+            yield b"".join(parts)
+    yield b"END:VCALENDAR\r\n"
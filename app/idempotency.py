@@ -0,0 +1,162 @@
+import hashlib
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session
+from app.config import IDEMPOTENCY_TTL_HOURS, IDEMPOTENCY_WAIT_SECONDS
+from app.cache import LRUCache, idempotency_cache
+from app.locks import KeyedLock
+from app.models import IdempotencyRecord
+
+# Idempotency-Key pro POST endpointy: klient při opakování (timeout, výpadek sítě)
+# pošle stejný klíč a dostane uloženou odpověď – bez pipeline pravidel a bez
+# „Room is already booked“ proti vlastní rezervaci. Ukládají se jen úspěšné
+# odpovědi; odmítnutý požadavek nic nezměnil, takže jeho opakování je bezpečné.
+#
+# Klíč se rezervuje (řádek bez odpovědi) ve stejné transakci jako zápis, hned
+# po BEGIN IMMEDIATE – souběžné opakování v jiném workeru proto buď najde
+# rezervaci a počká na odpověď, nebo čeká na zámek pro zápis a pak ji najde.
+# Odpověď se doplní v téže transakci těsně před commitem, takže potvrzený
+# zápis má vždy uloženou odpověď a rezervace klíče nikdy nezůstane viset.
+
+MAX_KEY_LENGTH = 255
+
+# Klíč požadavku v session.info, který si claim() vyzvedne v transakci zápisu
+SESSION_INFO_KEY = "idempotency"
+
+# Odpověď uložená respond(); po commitu ji volající vrátí a dá do cache
+RESPONSE_INFO_KEY = "idempotency_response"
+
+# Jak často se při čekání na rozpracovaný požadavek znovu čte idempotency_key (s)
+WAIT_INTERVAL = 0.05
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status_code: Optional[int]  # None – požadavek se právě provádí
+    body: Optional[bytes]
+    created_at: datetime
+
+    @property
+    def pending(self) -> bool:
+        return self.status_code is None
+
+
+class IdempotencyKeyReusedError(ValueError):
+    """Klíč už byl použit pro požadavek s jinou cestou nebo tělem."""
+
+
+class IdempotencyKeyTakenError(Exception):
+    """
+    Klíč si v transakci zápisu rezervoval jiný požadavek (typicky jiný worker).
+    Transakce je vrácená; volající počká na uloženou odpověď. Záměrně není
+    ValueError, aby ho handlery nepřevedly na 400.
+    """
+
+
+def request_fingerprint(path: str, body: str) -> str:
+    """Hash cesty a (validovaného) těla požadavku."""
+    return hashlib.sha256(f"{path}\n{body}".encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Uložené odpovědi podle klíče: LRU v paměti před tabulkou idempotency_key
+    (sdílenou mezi workery i restarty). Záznamy starší než TTL se ignorují
+    a mažou při ukládání nových. Stejný klíč se v procesu zpracovává
+    postupně (locks), mezi procesy ho rezervuje claim() v transakci zápisu.
+    """
+
+    def __init__(self, cache: LRUCache = idempotency_cache, ttl_hours: float = IDEMPOTENCY_TTL_HOURS,
+                 wait_seconds: float = IDEMPOTENCY_WAIT_SECONDS):
+        self.cache = cache
+        self.ttl = timedelta(hours=ttl_hours)
+        self.wait = timedelta(seconds=wait_seconds)
+        self.locks = KeyedLock()
+        self.replays = 0
+
+    @staticmethod
+    def validate_key(key: str):
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise ValueError(f"Idempotency-Key must have 1 to {MAX_KEY_LENGTH} characters")
+
+    def lookup(self, session: Session, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        """
+        Uložená (nebo rozpracovaná – pending) odpověď pro klíč, jinak None.
+        Jiný požadavek pod stejným klíčem je chyba.
+        """
+        stored = self.cache.get(key)
+        if stored is None:
+            record = session.get(IdempotencyRecord, key, populate_existing=True)
+            if record is not None:
+                stored = StoredResponse(record.fingerprint, record.status_code, record.body, record.created_at)
+                session.expunge(record)
+                if not stored.pending:
+                    self.cache.set(key, stored)
+        if stored is None or stored.created_at < datetime.now() - self.ttl:
+            return None
+        if stored.fingerprint != fingerprint:
+            raise IdempotencyKeyReusedError("Idempotency-Key was already used for a different request")
+        if not stored.pending:
+            self.replays += 1
+        return stored
+
+    def claim(self, session: Session):
+        """
+        Rezervuje klíč z session.info[SESSION_INFO_KEY] v právě otevřené transakci
+        zápisu (volá se hned po BEGIN IMMEDIATE). Prošlý záznam se přepíše; platný
+        znamená, že klíč už zpracoval jiný požadavek – transakce se vrátí a vyhodí
+        IdempotencyKeyTakenError. Bez klíče v session.info nic nedělá.
+        """
+        claim = session.info.get(SESSION_INFO_KEY)
+        if claim is None:
+            return
+        key, fingerprint = claim
+        now = datetime.now()
+        statement = sqlite_insert(IdempotencyRecord).values(
+            key=key, fingerprint=fingerprint, status_code=None, body=None, created_at=now
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["key"],
+            set_={"fingerprint": fingerprint, "status_code": None, "body": None, "created_at": now},
+            where=IdempotencyRecord.created_at < now - self.ttl,
+        )
+        if session.execute(statement).rowcount == 0:
+            session.rollback()
+            raise IdempotencyKeyTakenError(key)
+
+    def respond(self, session: Session, result) -> Optional[StoredResponse]:
+        """
+        Uloží odpověď (výsledek handleru jako JSON) ke klíči z session.info
+        v právě otevřené transakci zápisu – volá se těsně před commitem, po
+        flush() je známé id nového záznamu. Smaže přitom prošlé záznamy. Uloženou
+        odpověď nechá v session.info[RESPONSE_INFO_KEY]. Bez klíče nic nedělá.
+        """
+        claim = session.info.get(SESSION_INFO_KEY)
+        if claim is None:
+            return None
+        key, fingerprint = claim
+        session.flush()
+        response = JSONResponse(jsonable_encoder(result))
+        now = datetime.now()
+        session.execute(delete(IdempotencyRecord).where(
+            IdempotencyRecord.created_at < now - self.ttl, IdempotencyRecord.key != key
+        ))
+        session.execute(update(IdempotencyRecord).where(IdempotencyRecord.key == key).values(
+            status_code=response.status_code, body=response.body
+        ))
+        stored = StoredResponse(fingerprint, response.status_code, response.body, now)
+        session.info[RESPONSE_INFO_KEY] = stored
+        return stored
+
+    def complete(self, key: str, stored: StoredResponse) -> StoredResponse:
+        """Po commitu zápisu: uloženou odpověď zpřístupní v cache."""
+        self.cache.set(key, stored)
+        return stored
+
+
+# Sdílená instance pro celou aplikaci
+idempotency_store = IdempotencyStore()
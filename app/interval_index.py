@@ -0,0 +1,102 @@
+import threading
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlmodel import Session, select
+from app.models import Booking
+
+
+class RoomIntervalIndex:
+    """
+    In-memory index rezervací po místnostech.
+
+    Pro každou místnost drží seřazený seznam intervalů (start, end, id)
+    a nejdelší trvání rezervace v místnosti. Při kontrole se binárně najde
+    poslední interval začínající před koncem nového a odtud se prochází
+    zpět jen intervaly začínající později než (start − nejdelší trvání) –
+    starší už skončily. Běžně jsou to jeden nebo dva intervaly, takže
+    O(log n) bez dotazu do DB, a výsledek odpovídá SQL dotazu i u dat,
+    kde se rezervace už překrývají (import, ruční zásah do DB).
+    """
+
+    def __init__(self):
+        self._rooms: dict[int, list[tuple[datetime, datetime, int]]] = {}
+        self._longest: dict[int, timedelta] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def load(self, session: Session):
+        """Načte všechny rezervace z DB (volá se při startu aplikace)."""
+        statement = select(
+            Booking.room_id, Booking.start_time, Booking.end_time, Booking.id
+        ).order_by(Booking.room_id, Booking.start_time, Booking.end_time, Booking.id)
+
+        rooms: dict[int, list[tuple[datetime, datetime, int]]] = {}
+        longest: dict[int, timedelta] = {}
+        for room_id, start_time, end_time, booking_id in session.exec(statement):
+            rooms.setdefault(room_id, []).append((start_time, end_time, booking_id))
+            longest[room_id] = max(longest.get(room_id, timedelta(0)), end_time - start_time)
+
+        with self._lock:
+            self._rooms = rooms
+            self._longest = longest
+            self.loaded = True
+
+    def clear(self):
+        """Zahodí obsah indexu a vrátí ho do nenačteného stavu."""
+        with self._lock:
+            self._rooms = {}
+            self._longest = {}
+            self.loaded = False
+
+    def add(self, booking: Booking):
+        """Zařadí nově uloženou rezervaci (volá se až po commitu, opakované volání nic nezmění)."""
+        if not self.loaded:
+            return
+        with self._lock:
+            intervals = self._rooms.setdefault(booking.room_id, [])
+            entry = (booking.start_time, booking.end_time, booking.id)
+            i = bisect_left(intervals, entry)
+            if i == len(intervals) or intervals[i] != entry:
+                intervals.insert(i, entry)
+            # po odebrání se nesnižuje – delší horizont je jen o pár porovnání pomalejší
+            length = booking.end_time - booking.start_time
+            if length > self._longest.get(booking.room_id, timedelta(0)):
+                self._longest[booking.room_id] = length
+
+    def remove(self, room_id: int, start_time: datetime, end_time: datetime, booking_id: int):
+        """Vyřadí smazanou (nebo archivovanou) rezervaci (volá se až po commitu)."""
+        if not self.loaded:
+            return
+        with self._lock:
+            intervals = self._rooms.get(room_id)
+            if not intervals:
+                return
+            entry = (start_time, end_time, booking_id)
+            i = bisect_left(intervals, entry)
+            if i < len(intervals) and intervals[i] == entry:
+                del intervals[i]
+
+    def find_overlap(self, room_id: int, start_time: datetime, end_time: datetime,
+                     exclude: Optional[int] = None) -> Optional[int]:
+        """
+        Vrátí id rezervace, která se překrývá s daným časem, jinak None.
+        `exclude` je id přesouvané rezervace – s původním časem sama sebe neblokuje.
+        """
+        with self._lock:
+            intervals = self._rooms.get(room_id)
+            if not intervals:
+                return None
+            # první interval, který začíná až v end_time nebo později
+            i = bisect_left(intervals, (end_time,))
+            # interval začínající v horizon nebo dřív skončil nejpozději ve start_time
+            horizon = start_time - self._longest.get(room_id, timedelta(0))
+            while i > 0 and intervals[i - 1][0] > horizon:
+                i -= 1
+                if intervals[i][1] > start_time and intervals[i][2] != exclude:
+                    return intervals[i][2]
+        return None
+
+
+# Sdílená instance pro celou aplikaci
+booking_index = RoomIntervalIndex()
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+
+class KeyedLock:
+    """
+    Zámky podle klíče (např. ("room", 5)) v rámci jednoho procesu.
+
+    Požadavky na různé místnosti se navzájem neblokují, na stejnou místnost
+    se seřadí. Zámky vznikají na požádání a po uvolnění posledním držitelem
+    se zahodí, takže slovník neroste s počtem místností a uživatelů.
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks: dict = {}  # klíč -> [zámek, počet držitelů/čekajících]
+
+    def _register(self, keys) -> list:
+        entries = []
+        with self._guard:
+            for key in sorted(set(keys)):
+                entry = self._locks.setdefault(key, [threading.Lock(), 0])
+                entry[1] += 1
+                entries.append((key, entry))
+        return entries
+
+    def _release(self, entries, acquired):
+        for entry in reversed(acquired):
+            entry[0].release()
+        with self._guard:
+            for key, entry in entries:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    @contextmanager
+    def hold(self, *keys):
+        """Získá zámky všech klíčů (v pevném pořadí, aby nevznikl deadlock)."""
+        entries = self._register(keys)
+        acquired = []
+        try:
+            for _, entry in entries:
+                entry[0].acquire()
+                acquired.append(entry)
+            yield
+        finally:
+            self._release(entries, acquired)
+
+    @asynccontextmanager
+    async def hold_async(self, *keys):
+        """
+        Varianta hold pro async kód – stejné zámky, takže se seřadí i se sync
+        požadavky. Volný zámek se vezme hned, na obsazený se čeká ve vlákně
+        (event loop zůstane volný).
+        """
+        entries = self._register(keys)
+        acquired = []
+        try:
+            for _, entry in entries:
+                await _acquire_async(entry[0])
+                acquired.append(entry)
+            yield
+        finally:
+            self._release(entries, acquired)
+
+
+async def _acquire_async(lock: threading.Lock):
+    if lock.acquire(blocking=False):
+        return
+    waiting = asyncio.get_running_loop().run_in_executor(None, lock.acquire)
+    try:
+        await asyncio.shield(waiting)
+    except asyncio.CancelledError:
+        # zrušený požadavek: vlákno zámek stejně získá – hned ho uvolní
+        waiting.add_done_callback(lambda _: lock.release())
+        raise
+
+
+# Zámky pro kontrolu a vložení rezervace (klíče ("room", id) a ("user", id))
+booking_locks = KeyedLock()
@@ -1,90 +1,797 @@
-from fastapi import FastAPI, Depends, HTTPException
+import asyncio
+import json
+import time
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, Query, Header
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from contextlib import asynccontextmanager
+from pydantic import ValidationError
+from sqlalchemy import insert
 from sqlmodel import Session, select
-from datetime import datetime
-from app.database import create_db_and_tables, get_session
-from app.models import Room, Booking, User, RoomCreate, BookingCreate, UserCreate
-from app.services import BookingService
+from sqlmodel.ext.asyncio.session import AsyncSession
+from datetime import datetime, timedelta
+from typing import Optional
+from app.config import DATABASE_MODE, METRICS_ENABLED, MULTI_WORKER, ARCHIVE_BATCH_SIZE, ICS_PAST_DAYS
+from app.database import (engine, create_db_and_tables, get_session, get_async_session, begin_immediate,
+                          SQLITE_PRAGMAS, read_sqlite_pragmas)
+from app.models import (Room, Booking, User, RoomCreate, BookingCreate, BookingUpdate, UserCreate,
+                        RecurringBookingCreate, AutoBookingCreate, to_local_naive)
+from app.services import (BookingService, BookingCheck, BOOKING_RULES, NotFoundError, ConflictError,
+                          PURE, CACHED, DB)
+from app.interval_index import booking_index
+from app.locks import booking_locks
+from app.cache import (user_counter, entity_cache, table_versions, response_cache, etag_matches,
+                       last_modified_header, not_modified_since, reset_caches)
+from app.queries import (DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, page_statement, booking_page_statement,
+                         stream_ndjson, encode_rows, RowsJSONResponse)
+from app import stats, metrics
+from app.archive import archive_bookings, archive_horizon
+from app.ics import stream_calendar
+from app.events import event_bus, event_stream, booking_event
+from app.changelog import change_feed
+from app.idempotency import (idempotency_store, request_fingerprint, StoredResponse, IdempotencyKeyReusedError,
+                             IdempotencyKeyTakenError, SESSION_INFO_KEY, RESPONSE_INFO_KEY, WAIT_INTERVAL)
 
 app = FastAPI(title="Rezervační Systém", version="1.0.0")
 
-# Při startu aplikace vytvoříme tabulky (pokud neexistují)
+# Kolikrát POST /bookings/auto zkusí další místnost, když mu termín obsadí souběžný požadavek
+MAX_AUTO_ATTEMPTS = 5
+
+# Při startu aplikace vytvoříme tabulky (pokud neexistují) a načteme index rezervací
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_db_and_tables()
+    if MULTI_WORKER:
+        change_feed.start(engine)  # před načtením indexu, aby se žádná změna neztratila
+    with Session(engine) as session:
+        booking_index.load(session)
+        stats.ensure_rollups(session)
+        if MULTI_WORKER:
+            change_feed.prune(session)
     yield
+    change_feed.stop()
+    event_bus.clear()
+    reset_caches()
 
-app = FastAPI(title="Rezervační Systém", version="1.0.0", lifespan=lifespan)
+# Při více workerech převezme každý požadavek nejdřív změny ostatních procesů
+# a jednou za CHANGE_LOG_PRUNE_MINUTES promaže staré záznamy change_log
+async def sync_workers():
+    if change_feed.enabled:
+        await run_in_threadpool(change_feed.poll)
+        if change_feed.prune_due():
+            await run_in_threadpool(change_feed.prune_if_due)
 
-# Endpoint pro vytvoření rezervace
-@app.post("/bookings/")
-def create_booking(data: BookingCreate, session: Session = Depends(get_session)):
-    room = session.get(Room, data.room_id)
-    if not room:
+app = FastAPI(title="Rezervační Systém", version="1.0.0", lifespan=lifespan,
+              dependencies=[Depends(sync_workers)])
+
+if METRICS_ENABLED:
+    metrics.install_sql_listeners()
+    app.add_middleware(metrics.TimingMiddleware)
+
+def insert_booking(session: Session, data: BookingCreate) -> Booking:
+    """
+    Ověří rezervaci pipeline pravidel a uloží ji. Chyby pravidel propadnou
+    jako ValueError (NotFoundError, ConflictError) – HTTP kódy určuje volající.
+    """
+    check = BookingCheck(data, session, entities=entity_cache, counter=user_counter, index=booking_index)
+    # Čisté kontroly a místnost/uživatel z cache – nevalidní vstup neotevře transakci
+    BOOKING_RULES.run(check, max_cost=CACHED)
+
+    # Kontrola limitu a kolizí + vložení musí být atomické: zámek místnosti
+    # a uživatele v procesu, BEGIN IMMEDIATE proti ostatním procesům.
+    with booking_locks.hold(("room", data.room_id), ("user", data.user_id)):
+        with metrics.stage("begin"):
+            begin_immediate(session)
+            change_feed.poll()  # pod zámkem pro zápis už index nemůže zastarat
+            idempotency_store.claim(session)  # Idempotency-Key se rezervuje se zápisem
+        try:
+            BOOKING_RULES.run(check, min_cost=DB)
+        except ValueError:
+            session.rollback()  # hned uvolnit zámek pro zápis
+            raise
+
+        with metrics.stage("commit"):
+            booking = Booking(**data.model_dump())
+            session.add(booking)
+            stats.record_usage(session, booking.room_id, booking.start_time, booking.end_time)
+            change_feed.record_bookings(session, "created", [booking])
+            idempotency_store.respond(session, booking)  # odpověď se uloží se zápisem
+            session.commit()
+            session.refresh(booking)
+        booking_index.add(booking)
+        user_counter.add(booking.user_id, booking.start_time)
+        table_versions.bump(Booking.__tablename__)
+    event_bus.publish("booking.created", booking.room_id, booking_event(booking))
+    return booking
+
+# === Idempotency-Key ===
+# Opakovaný POST se stejným klíčem vrátí uloženou odpověď bez nového provedení.
+
+def idempotency_fingerprint(key: str, path: str, data) -> str:
+    try:
+        idempotency_store.validate_key(key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return request_fingerprint(path, data.model_dump_json())
+
+def lookup_idempotent(session: Session, key: str, fingerprint: str) -> Optional[StoredResponse]:
+    try:
+        return idempotency_store.lookup(session, key, fingerprint)
+    except IdempotencyKeyReusedError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def replayed_response(stored: StoredResponse) -> Response:
+    return Response(content=stored.body, status_code=stored.status_code, media_type="application/json",
+                    headers={"Idempotent-Replayed": "true"})
+
+def stored_response(key: str, stored: Optional[StoredResponse], result) -> Response:
+    """
+    Odpověď právě provedeného požadavku. Handler ji uložil v transakci zápisu
+    (idempotency_store.respond); po commitu se jen zpřístupní v cache.
+    """
+    if stored is None:
+        return JSONResponse(jsonable_encoder(result))
+    idempotency_store.complete(key, stored)
+    return Response(content=stored.body, status_code=stored.status_code, media_type="application/json")
+
+def key_in_progress() -> HTTPException:
+    return HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress",
+                         headers={"Retry-After": "1"})
+
+def replay_or_wait(session: Session, key: str, fingerprint: str) -> Optional[Response]:
+    """
+    Uložená odpověď pro klíč (s hlavičkou Idempotent-Replayed), jinak None.
+    Na rozpracovaný požadavek (klíč rezervovaný jiným workerem) se čeká
+    nejvýš IDEMPOTENCY_WAIT_SECONDS, pak 409.
+    """
+    deadline = time.monotonic() + idempotency_store.wait.total_seconds()
+    while True:
+        stored = lookup_idempotent(session, key, fingerprint)
+        if stored is None:
+            return None
+        if not stored.pending:
+            return replayed_response(stored)
+        if time.monotonic() >= deadline:
+            raise key_in_progress()
+        time.sleep(WAIT_INTERVAL)
+
+async def replay_or_wait_async(session: AsyncSession, key: str, fingerprint: str) -> Optional[Response]:
+    """Varianta replay_or_wait nad AsyncSession (čekání neblokuje event loop)."""
+    deadline = time.monotonic() + idempotency_store.wait.total_seconds()
+    while True:
+        stored = await session.run_sync(lookup_idempotent, key, fingerprint)
+        if stored is None:
+            return None
+        if not stored.pending:
+            return replayed_response(stored)
+        if time.monotonic() >= deadline:
+            raise key_in_progress()
+        await asyncio.sleep(WAIT_INTERVAL)
+
+def idempotent(session: Session, key: Optional[str], path: str, data, handler) -> Response:
+    """
+    Provede `handler` nejvýš jednou pro daný Idempotency-Key. Souběžné
+    požadavky se stejným klíčem se v procesu seřadí (locks); mezi workery
+    rozhodne rezervace klíče v transakci zápisu (idempotency_store.claim) –
+    kdo ji nezíská, počká na uloženou odpověď. Úspěšný handler uloží odpověď
+    před commitem (idempotency_store.respond). Chyby (HTTPException) se
+    neukládají: rezervace se vrátí spolu se zápisem.
+    """
+    if key is None:
+        return handler()
+    fingerprint = idempotency_fingerprint(key, path, data)
+    with idempotency_store.locks.hold(key):
+        replay = replay_or_wait(session, key, fingerprint)
+        if replay is not None:
+            return replay
+        session.info[SESSION_INFO_KEY] = (key, fingerprint)
+        try:
+            result = handler()
+        except IdempotencyKeyTakenError:
+            replay = replay_or_wait(session, key, fingerprint)
+            if replay is None:
+                raise key_in_progress()
+            return replay
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.info.pop(SESSION_INFO_KEY, None)
+            stored = session.info.pop(RESPONSE_INFO_KEY, None)
+        return stored_response(key, stored, result)
+
+# Endpoint pro vytvoření rezervace (registruje se níže podle DATABASE_MODE)
+def create_booking(data: BookingCreate, session: Session = Depends(get_session),
+                   idempotency_key: Optional[str] = Header(None)):
+    def handler():
+        try:
+            return insert_booking(session, data)
+        except NotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return idempotent(session, idempotency_key, "/bookings/", data, handler)
+
+async def insert_booking_async(session: AsyncSession, data: BookingCreate) -> Booking:
+    """Varianta insert_booking nad AsyncSession (aiosqlite)."""
+    check = BookingCheck(data, entities=entity_cache, counter=user_counter, index=booking_index)
+    BOOKING_RULES.run(check, max_cost=PURE)
+    await BOOKING_RULES.run_async(check, session, min_cost=CACHED, max_cost=CACHED)
+    # Stejné zámky jako sync cesta: mezi commitem a zápisem do indexu (await)
+    # by jinak jiný požadavek zkontroloval kolize proti zastaralému indexu
+    async with booking_locks.hold_async(("room", data.room_id), ("user", data.user_id)):
+        with metrics.stage("begin"):
+            await session.run_sync(begin_immediate)
+            await run_in_threadpool(change_feed.poll)
+            await session.run_sync(idempotency_store.claim)
+        try:
+            await BOOKING_RULES.run_async(check, session, min_cost=DB)
+        except ValueError:
+            await session.rollback()
+            raise
+
+        with metrics.stage("commit"):
+            booking = Booking(**data.model_dump())
+            session.add(booking)
+            await session.run_sync(stats.record_usage, booking.room_id, booking.start_time, booking.end_time)
+            await session.run_sync(change_feed.record_bookings, "created", [booking])
+            await session.run_sync(idempotency_store.respond, booking)
+            await session.commit()
+            await session.refresh(booking)
+        booking_index.add(booking)
+        user_counter.add(booking.user_id, booking.start_time)
+        table_versions.bump(Booking.__tablename__)
+    event_bus.publish("booking.created", booking.room_id, booking_event(booking))
+    return booking
+
+# Async varianta vytvoření rezervace nad AsyncSession (aiosqlite)
+async def create_booking_async(data: BookingCreate, session: AsyncSession = Depends(get_async_session),
+                               idempotency_key: Optional[str] = Header(None)):
+    async def handler():
+        try:
+            return await insert_booking_async(session, data)
+        except NotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if idempotency_key is None:
+        return await handler()
+    # Stejný průběh jako idempotent(), jen se zámkem klíče a čekáním bez blokování event loopu
+    fingerprint = idempotency_fingerprint(idempotency_key, "/bookings/", data)
+    async with idempotency_store.locks.hold_async(idempotency_key):
+        replay = await replay_or_wait_async(session, idempotency_key, fingerprint)
+        if replay is not None:
+            return replay
+        session.info[SESSION_INFO_KEY] = (idempotency_key, fingerprint)
+        try:
+            booking = await handler()
+        except IdempotencyKeyTakenError:
+            replay = await replay_or_wait_async(session, idempotency_key, fingerprint)
+            if replay is None:
+                raise key_in_progress()
+            return replay
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            session.info.pop(SESSION_INFO_KEY, None)
+            stored = session.info.pop(RESPONSE_INFO_KEY, None)
+        return stored_response(idempotency_key, stored, booking)
+
+app.post("/bookings/")(create_booking_async if DATABASE_MODE == "async" else create_booking)
+
+# Automatický výběr místnosti: nejmenší vyhovující volná místnost v okně
+@app.post("/bookings/auto")
+def create_booking_auto(data: AutoBookingCreate, session: Session = Depends(get_session)):
+    """
+    Najde nejmenší místnost s dostatečnou kapacitou, která je v okně volná
+    na požadovanou délku, a rezervuje nejdřívější termín. Rezervace jde přes
+    stejná pravidla jako POST /bookings/; pokud termín mezitím obsadí jiný
+    požadavek, zkusí se další místnost.
+    """
+    try:
+        BookingService.validate_auto_request(data)
+        if not entity_cache.user_exists(session, data.user_id):
+            raise NotFoundError("User not found")
+
+        tried = set()
+        for _ in range(MAX_AUTO_ATTEMPTS):
+            candidate = BookingService.find_best_slot(session, data, exclude=tried)
+            if candidate is None:
+                break
+            room, start_time = candidate
+            booking_data = BookingCreate(room_id=room.id, user_id=data.user_id, attendees=data.attendees,
+                                         start_time=start_time,
+                                         end_time=start_time + timedelta(minutes=data.duration))
+            try:
+                return insert_booking(session, booking_data)
+            except ConflictError:
+                tried.add(room.id)
+        raise ConflictError("No room with enough capacity is free in the requested window")
+
+    except NotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def load_booking(session: Session, booking_id: int) -> Booking:
+    """Aktuální stav rezervace z DB (ne z identity mapy session)."""
+    booking = session.get(Booking, booking_id, populate_existing=True)
+    if booking is None:
+        raise NotFoundError("Booking not found")
+    return booking
+
+def update_booking(session: Session, booking_id: int, changes: BookingUpdate) -> Booking:
+    """
+    Upraví rezervaci (místnost, čas, účastníci) přes stejná pravidla jako
+    vytvoření. Kolize se kontroluje bez rezervace samotné a kontrola i zápis
+    běží v jedné transakci pod zámky původní i nové místnosti.
+    """
+    before = Booking(**load_booking(session, booking_id).model_dump())
+    data = BookingCreate(**{**before.model_dump(exclude={"id"}),
+                            **changes.model_dump(exclude_unset=True, exclude_none=True)})
+    check = BookingCheck(data, session, entities=entity_cache, counter=user_counter, index=booking_index,
+                         booking=before)
+    BOOKING_RULES.run(check, max_cost=CACHED)
+
+    with booking_locks.hold(("room", before.room_id), ("room", data.room_id), ("user", before.user_id)):
+        with metrics.stage("begin"):
+            begin_immediate(session)
+            change_feed.poll()
+        try:
+            booking = load_booking(session, booking_id)
+            if booking.model_dump() != before.model_dump():
+                raise ConflictError("Booking was modified concurrently")
+            BOOKING_RULES.run(check, min_cost=DB)
+        except ValueError:
+            session.rollback()
+            raise
+
+        with metrics.stage("commit"):
+            stats.record_usage(session, before.room_id, before.start_time, before.end_time, sign=-1)
+            for name, value in data.model_dump().items():
+                setattr(booking, name, value)
+            stats.record_usage(session, booking.room_id, booking.start_time, booking.end_time)
+            change_feed.record_bookings(session, "updated", [booking], previous=[before])
+            session.commit()
+            session.refresh(booking)
+        booking_index.remove(before.room_id, before.start_time, before.end_time, before.id)
+        booking_index.add(booking)
+        user_counter.remove(before.user_id, before.start_time)
+        user_counter.add(booking.user_id, booking.start_time)
+        table_versions.bump(Booking.__tablename__)
+    event_bus.publish("booking.updated", booking.room_id,
+                      {**booking_event(booking), "previous": booking_event(before)},
+                      previous_room_id=before.room_id)
+    return booking
+
+def delete_booking(session: Session, booking_id: int):
+    """Smaže rezervaci a uvolní termín v indexu, limit uživatele i souhrny obsazenosti."""
+    booking = load_booking(session, booking_id)
+    with booking_locks.hold(("room", booking.room_id), ("user", booking.user_id)):
+        begin_immediate(session)
+        change_feed.poll()
+        try:
+            booking = load_booking(session, booking_id)
+        except NotFoundError:
+            session.rollback()
+            raise
+        deleted = Booking(**booking.model_dump())
+        session.delete(booking)
+        stats.record_usage(session, deleted.room_id, deleted.start_time, deleted.end_time, sign=-1)
+        change_feed.record_bookings(session, "deleted", [deleted])
+        session.commit()
+        booking_index.remove(deleted.room_id, deleted.start_time, deleted.end_time, deleted.id)
+        user_counter.remove(deleted.user_id, deleted.start_time)
+        table_versions.bump(Booking.__tablename__)
+    event_bus.publish("booking.deleted", deleted.room_id, booking_event(deleted))
+
+# Endpoint pro přesun / úpravu rezervace
+@app.patch("/bookings/{booking_id}")
+def patch_booking(booking_id: int, changes: BookingUpdate, session: Session = Depends(get_session)):
+    try:
+        return update_booking(session, booking_id, changes)
+    except NotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Endpoint pro zrušení rezervace
+@app.delete("/bookings/{booking_id}", status_code=204)
+def cancel_booking(booking_id: int, session: Session = Depends(get_session)):
+    try:
+        delete_booking(session, booking_id)
+    except NotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return Response(status_code=204)
+
+# Endpoint pro hromadný import rezervací (JSON pole nebo NDJSON)
+@app.post("/bookings/bulk")
+async def create_bookings_bulk(request: Request, session: Session = Depends(get_session)):
+    """
+    Přijme JSON pole nebo NDJSON (application/x-ndjson) rezervací a uloží
+    všechny platné v jedné transakci. Vrací report přijato/odmítnuto pro každou položku.
+    """
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            raw_items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            raw_items = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    if not isinstance(raw_items, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array or NDJSON stream of bookings")
+
+    return await run_in_threadpool(import_bookings, session, raw_items)
+
+def import_bookings(session: Session, raw_items: list):
+    """Ověří dávku a přijaté rezervace vloží jedním executemany v jedné transakci."""
+    report = [{"index": i, "status": "accepted"} for i in range(len(raw_items))]
+    items, positions = [], []
+    for i, raw in enumerate(raw_items):
+        try:
+            items.append(BookingCreate.model_validate(raw))
+            positions.append(i)
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(str(part) for part in error["loc"])
+            report[i] = {"index": i, "status": "rejected",
+                         "detail": f"Invalid booking data: {field}: {error['msg']}" if field
+                                   else f"Invalid booking data: {error['msg']}"}
+
+    results = store_bookings(session, items)
+    for position, (error, booking_id) in zip(positions, results):
+        if error is None:
+            report[position]["id"] = booking_id
+        else:
+            report[position] = {"index": position, "status": "rejected", "detail": error}
+
+    accepted = sum(1 for error, _ in results if error is None)
+    return {
+        "accepted": accepted,
+        "rejected": len(raw_items) - accepted,
+        "items": report,
+    }
+
+def store_bookings(session: Session, items: list[BookingCreate]):
+    """
+    Ověří dávku rezervací (validate_bulk) a přijaté vloží jedním executemany
+    v jedné transakci pod zámky dotčených místností a uživatelů.
+    Vrací dvojice (chyba, id) zarovnané s položkami.
+    """
+    keys = [("room", item.room_id) for item in items] + [("user", item.user_id) for item in items]
+    with booking_locks.hold(*keys):
+        begin_immediate(session)
+        change_feed.poll()
+        errors = BookingService.validate_bulk(session, items)
+        accepted = [item for item, error in zip(items, errors) if error is None]
+        ids = []
+        if accepted:
+            statement = insert(Booking).returning(Booking.id, sort_by_parameter_order=True)
+            ids = session.execute(statement, [item.model_dump() for item in accepted]).scalars().all()
+            stored = [Booking(id=booking_id, **item.model_dump()) for item, booking_id in zip(accepted, ids)]
+            for item in accepted:
+                stats.record_usage(session, item.room_id, item.start_time, item.end_time)
+            change_feed.record_bookings(session, "created", stored)
+            session.commit()
+            for booking in stored:
+                booking_index.add(booking)
+                user_counter.add(booking.user_id, booking.start_time)
+            table_versions.bump(Booking.__tablename__)
+            for booking in stored:
+                event_bus.publish("booking.created", booking.room_id, booking_event(booking))
+        else:
+            session.rollback()
+
+    new_ids = iter(ids)
+    return [(error, next(new_ids) if error is None else None) for error in errors]
+
+# Endpoint pro opakovanou rezervaci (denně / týdně)
+@app.post("/bookings/recurring")
+def create_recurring_booking(data: RecurringBookingCreate, session: Session = Depends(get_session)):
+    """
+    Rozvine opakovanou rezervaci na výskyty, každý ověří stejnými pravidly
+    jako jednotlivou rezervaci a všechny přijaté uloží v jedné transakci.
+    """
+    try:
+        occurrences, skipped = BookingService.expand_recurrence(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not entity_cache.get_room(session, data.room_id):
         raise HTTPException(status_code=404, detail="Room not found")
-    
-    user = session.get(User, data.user_id)
-    if not user:
+    if not entity_cache.user_exists(session, data.user_id):
         raise HTTPException(status_code=404, detail="User not found")
 
+    results = store_bookings(session, occurrences) if occurrences else []
+    items = []
+    for occurrence, (error, booking_id) in zip(occurrences, results):
+        item = {"start_time": occurrence.start_time, "end_time": occurrence.end_time}
+        if error is None:
+            items.append({**item, "status": "accepted", "id": booking_id})
+        else:
+            items.append({**item, "status": "rejected", "detail": error})
+
+    accepted = sum(1 for item in items if item["status"] == "accepted")
+    return {
+        "accepted": accepted,
+        "rejected": len(items) - accepted,
+        "skipped_weekends": skipped,
+        "items": items,
+    }
+
+# Volné termíny místností (jen pracovní dny)
+@app.get("/availability")
+def get_availability(start_time: datetime = Query(alias="from"),
+                     end_time: datetime = Query(alias="to"),
+                     min_capacity: int = Query(1, ge=1),
+                     duration: int = Query(30, ge=1, description="Minimální délka termínu v minutách"),
+                     session: Session = Depends(get_session)):
+    """Vrátí volné termíny po místnostech, seřazené od nejmenší vyhovující místnosti."""
     try:
-        BookingService.validate_booking_attendees(data.attendees)        # Pravidlo 0 (vstup)
-        BookingService.validate_capacity(room, data.attendees)           # Pravidlo 1
-        BookingService.validate_times(data.start_time, data.end_time)    # Pravidlo 2
-        BookingService.validate_working_days(data.start_time)            # Pravidlo 3 (Víkend)
-        BookingService.validate_user_limit(session, data.user_id)        # Pravidlo 4 (Limit)
-        BookingService.check_availability(session, room.id, data.start_time, data.end_time) # Pravidlo 5 (Kolize)
-        
-        booking = Booking(**data.model_dump())
-        session.add(booking)
-        session.commit()
-        session.refresh(booking)
-        return booking
+        return BookingService.find_free_slots(session, to_local_naive(start_time), to_local_naive(end_time),
+                                              min_capacity, timedelta(minutes=duration))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+# Archivace minulých rezervací
+@app.post("/bookings/archive")
+def archive_past_bookings(before: Optional[datetime] = None,
+                          batch_size: int = Query(ARCHIVE_BATCH_SIZE, ge=1, le=100_000),
+                          session: Session = Depends(get_session)):
+    """Přesune rezervace skončené před `before` (výchozí: dnes - ARCHIVE_HORIZON_DAYS) do archivu."""
+    try:
+        return archive_bookings(session, before or archive_horizon(), batch_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Stream změn rezervací (Server-Sent Events)
+@app.get("/events", response_class=StreamingResponse)
+async def booking_events(room_id: Optional[int] = None):
+    """
+    Události booking.created, booking.updated a booking.deleted jako text/event-stream,
+    volitelně jen pro jednu místnost. Pomalý odběratel dostane `dropped`
+    a spojení se ukončí – klient se má znovu připojit a načíst stav.
+    """
+    return StreamingResponse(event_stream(event_bus, room_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Statistiky obsazenosti místností
+@app.get("/stats/utilization")
+def get_utilization(start_time: datetime = Query(alias="from"),
+                    end_time: datetime = Query(alias="to"),
+                    bucket: str = Query("day", pattern="^(hour|day|week)$"),
+                    session: Session = Depends(get_session)):
+    """Obsazenost po místnostech a hodinách/dnech/týdnech (s bucket=hour i hodinové špičky)."""
+    try:
+        return stats.utilization(session, to_local_naive(start_time), to_local_naive(end_time), bucket,
+                                 use_rollups=stats.ROLLUPS_ENABLED)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # Endpoint pro vytvoření místnosti
 @app.post("/rooms/")
-def create_room(data: RoomCreate, session: Session = Depends(get_session)):
+def create_room(data: RoomCreate, session: Session = Depends(get_session),
+                idempotency_key: Optional[str] = Header(None)):
+    return idempotent(session, idempotency_key, "/rooms/", data, lambda: insert_room(session, data))
+
+def insert_room(session: Session, data: RoomCreate) -> Room:
     try:
         BookingService.validate_room_data(data.name, data.capacity)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     room = Room(**data.model_dump())
+    begin_immediate(session)
+    idempotency_store.claim(session)
     session.add(room)
+    session.flush()
+    change_feed.record(session, Room.__tablename__, "created", room.id)
+    idempotency_store.respond(session, room)
     session.commit()
     session.refresh(room)
+    entity_cache.invalidate_room(room.id)
+    table_versions.bump(Room.__tablename__)
     return room
 
 
 # Endpoint pro vytvoření uživatele
 @app.post("/users/")
-def create_user(data: UserCreate, session: Session = Depends(get_session)):
-    # Kontrola duplicitního emailu
+def create_user(data: UserCreate, session: Session = Depends(get_session),
+                idempotency_key: Optional[str] = Header(None)):
+    return idempotent(session, idempotency_key, "/users/", data, lambda: insert_user(session, data))
+
+def insert_user(session: Session, data: UserCreate) -> User:
+    # Zámek pro zápis před kontrolou duplicitního emailu (a rezervace Idempotency-Key)
+    begin_immediate(session)
+    idempotency_store.claim(session)
     existing = session.exec(select(User).where(User.email == data.email)).first()
     if existing:
         raise HTTPException(status_code=409, detail="User with this email already exists")
     user = User(**data.model_dump())
     session.add(user)
+    session.flush()
+    change_feed.record(session, User.__tablename__, "created", user.id)
+    idempotency_store.respond(session, user)
     session.commit()
     session.refresh(user)
+    entity_cache.invalidate_user(user.id)
+    table_versions.bump(User.__tablename__)
     return user
 
 
+# === Diagnostika ===
+
+@app.get("/diagnostics/sqlite")
+def sqlite_diagnostics(session: Session = Depends(get_session)):
+    """Nakonfigurovaný SQLite profil a hodnoty skutečně aktivní na spojení."""
+    return {
+        "configured": SQLITE_PRAGMAS,
+        "active": read_sqlite_pragmas(session.connection()),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Histogramy dob požadavků, kroků rezervace a SQL dotazů ve formátu Prometheus."""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/diagnostics/rules")
+def rules_diagnostics():
+    """Pravidla rezervace v pořadí spouštění s počty vyhodnocení a podílem odmítnutí."""
+    return BOOKING_RULES.stats()
+
+@app.get("/diagnostics/workers")
+def workers_diagnostics():
+    """Stav sdílení změn mezi workery (MULTI_WORKER): poslední převzatá změna a počty."""
+    return change_feed.stats()
+
+@app.get("/diagnostics/cache")
+def cache_diagnostics():
+    """Velikost a počty zásahů/minutí cache místností a uživatelů."""
+    return entity_cache.stats()
+
 # === GET endpointy (výpis záznamů) ===
+# Výpisy jsou stránkované podle id (keyset): ?limit=&after=<id posledního záznamu>.
+# Odkaz na další stránku je v hlavičce Link, ?format=ndjson místo stránky
+# streamuje všechny záznamy od `after` po dávkách.
 
-@app.get("/rooms/")
-def list_rooms(session: Session = Depends(get_session)):
-    """Vrátí seznam všech místností."""
-    return session.exec(select(Room)).all()
+def paginate(statement, model, request: Request, session: Session, limit: int, output: str):
+    """
+    Vrátí jednu stránku záznamů nebo NDJSON stream.
+    Stránka nese ETag podle verze tabulky; shodné If-None-Match → 304 a
+    serializovaný JSON se pro danou verzi a dotaz drží v cache. Řádky jsou
+    sloupcové n-tice kódované rovnou do JSON (bez Pydantic validace po řádcích).
+    """
+    if output == "ndjson":
+        return StreamingResponse(stream_ndjson(session.get_bind(), statement),
+                                 media_type="application/x-ndjson")
 
-@app.get("/users/")
-def list_users(session: Session = Depends(get_session)):
-    """Vrátí seznam všech uživatelů."""
-    return session.exec(select(User)).all()
+    # verzi čteme před dotazem – data v cache jsou tak vždy alespoň tak nová jako ETag
+    etag = table_versions.etag(model.__tablename__, f"{request.url.path}?{request.url.query}")
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
 
-@app.get("/bookings/")
-def list_bookings(session: Session = Depends(get_session)):
-    """Vrátí seznam všech rezervací."""
-    return session.exec(select(Booking)).all()
\ No newline at end of file
+    cached = response_cache.get(etag)
+    if cached is None:
+        # o jeden řádek navíc, abychom věděli, jestli existuje další stránka
+        rows = session.execute(statement.limit(limit + 1)).all()
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_url = request.url.include_query_params(after=rows[-1].id, limit=limit)
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        cached = (encode_rows(rows), headers)
+        response_cache.set(etag, cached)
+
+    body, headers = cached
+    return RowsJSONResponse(content=body, headers=headers)
+
+@app.get("/rooms/", response_model=list[Room], response_class=RowsJSONResponse)
+def list_rooms(request: Request,
+               limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+               after: int = Query(0, ge=0),
+               output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+               session: Session = Depends(get_session)):
+    """Vrátí stránku místností."""
+    return paginate(page_statement(Room, after), Room, request, session, limit, output)
+
+@app.get("/users/", response_model=list[User], response_class=RowsJSONResponse)
+def list_users(request: Request,
+               limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+               after: int = Query(0, ge=0),
+               output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+               session: Session = Depends(get_session)):
+    """Vrátí stránku uživatelů."""
+    return paginate(page_statement(User, after), User, request, session, limit, output)
+
+@app.get("/bookings/", response_model=list[Booking], response_class=RowsJSONResponse)
+def list_bookings(request: Request,
+                  room_id: Optional[int] = None,
+                  user_id: Optional[int] = None,
+                  start_time: Optional[datetime] = Query(None, alias="from"),
+                  end_time: Optional[datetime] = Query(None, alias="to"),
+                  include_archive: bool = False,
+                  limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                  after: int = Query(0, ge=0),
+                  output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+                  session: Session = Depends(get_session)):
+    """
+    Vrátí stránku rezervací, volitelně jen pro místnost, uživatele a časové okno (from/to).
+    S include_archive=true včetně archivovaných rezervací.
+    """
+    statement = booking_page_statement(after, room_id, user_id, start_time, end_time, include_archive)
+    return paginate(statement, Booking, request, session, limit, output)
+
+@app.get("/rooms/{room_id}/bookings", response_model=list[Booking], response_class=RowsJSONResponse)
+def list_room_bookings(room_id: int, request: Request,
+                       start_time: Optional[datetime] = Query(None, alias="from"),
+                       end_time: Optional[datetime] = Query(None, alias="to"),
+                       limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                       after: int = Query(0, ge=0),
+                       output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+                       session: Session = Depends(get_session)):
+    """Vrátí rezervace jedné místnosti (např. pro kalendář)."""
+    if not session.get(Room, room_id):
+        raise HTTPException(status_code=404, detail="Room not found")
+    statement = booking_page_statement(after, room_id=room_id, start_time=start_time, end_time=end_time)
+    return paginate(statement, Booking, request, session, limit, output)
+
+@app.get("/users/{user_id}/bookings", response_model=list[Booking], response_class=RowsJSONResponse)
+def list_user_bookings(user_id: int, request: Request,
+                       start_time: Optional[datetime] = Query(None, alias="from"),
+                       end_time: Optional[datetime] = Query(None, alias="to"),
+                       limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                       after: int = Query(0, ge=0),
+                       output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+                       session: Session = Depends(get_session)):
+    """Vrátí rezervace jednoho uživatele."""
+    if not session.get(User, user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    statement = booking_page_statement(after, user_id=user_id, start_time=start_time, end_time=end_time)
+    return paginate(statement, Booking, request, session, limit, output)
+
+# === iCalendar feedy (odběr z kalendářových klientů) ===
+
+def calendar_feed(request: Request, session: Session, name: str, **filters):
+    """
+    Streamovaný ICS feed rezervací (posledních ICS_PAST_DAYS dní a budoucích).
+    ETag a Last-Modified se odvozují z verze tabulky booking, takže
+    opakovaný dotaz bez změny skončí 304 bez čtení rezervací.
+    """
+    since = datetime.combine(datetime.now().date() - timedelta(days=ICS_PAST_DAYS), datetime.min.time())
+    etag = table_versions.etag(Booking.__tablename__, f"{request.url.path}?since={since.date()}")
+    last_modified = table_versions.last_modified(Booking.__tablename__)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    # Last-Modified až po skončení sekundy poslední změny (If-Modified-Since má přesnost na sekundy)
+    last_modified_value = last_modified_header(last_modified)
+    if last_modified_value is not None:
+        headers["Last-Modified"] = last_modified_value
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, etag) or (
+            if_none_match is None
+            and not_modified_since(request.headers.get("if-modified-since"), last_modified)):
+        return Response(status_code=304, headers=headers)
+
+    statement = booking_page_statement(start_time=since, **filters)
+    return StreamingResponse(stream_calendar(session.get_bind(), statement, name),
+                             media_type="text/calendar; charset=utf-8", headers=headers)
+
+@app.get("/rooms/{room_id}/calendar.ics", response_class=StreamingResponse)
+def room_calendar(room_id: int, request: Request, session: Session = Depends(get_session)):
+    """ICS kalendář rezervací jedné místnosti."""
+    room = entity_cache.get_room(session, room_id)
+    if not room:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return calendar_feed(request, session, room.name, room_id=room_id)
+
+@app.get("/users/{user_id}/calendar.ics", response_class=StreamingResponse)
+def user_calendar(user_id: int, request: Request, session: Session = Depends(get_session)):
+    """ICS kalendář rezervací jednoho uživatele."""
+    user = session.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return calendar_feed(request, session, user.username, user_id=user_id)
@@ -0,0 +1,199 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.config import METRICS_ENABLED
+
+# Metriky ve formátu Prometheus (GET /metrics): doby HTTP požadavků, jednotlivých
+# kroků create_booking a SQL dotazů, počty dotazů na požadavek a odmítnutí po pravidlech.
+# Při METRICS_ENABLED=0 se nic neměří – stage() vrací sdílený no-op kontext
+# a middleware ani SQL listenery se vůbec nezaregistrují.
+
+# Hranice histogramů v sekundách (SQL dotazy bývají pod milisekundu)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, label_values)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Kumulativní histogram s pevnými hranicemi (le) po kombinacích labelů."""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}  # labely -> [počty po bucketech (+Inf), součet]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1
+            series[1] += value
+
+    def count(self, *label_values) -> int:
+        with self._lock:
+            series = self._series.get(label_values)
+            return sum(series[0]) if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, "+Inf"), counts):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_labels((*self.labels, 'le'), (*label_values, le))} "
+                                 f"{cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {total:.6f}")
+                lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Doba zpracování HTTP požadavku.", ("method", "route", "status"))
+http_request_sql_statements = Histogram(
+    "http_request_sql_statements", "Počet SQL dotazů na jeden HTTP požadavek.", ("method", "route"),
+    buckets=COUNT_BUCKETS)
+booking_stage_duration = Histogram(
+    "booking_stage_duration_seconds", "Doba jednotlivých kroků vytvoření rezervace.", ("stage",))
+booking_rejections = Counter(
+    "booking_rejections_total", "Odmítnuté rezervace podle pravidla.", ("rule",))
+sql_statement_duration = Histogram(
+    "sql_statement_duration_seconds", "Doba SQL dotazů podle typu.", ("operation",))
+
+REGISTRY = (http_request_duration, http_request_sql_statements, booking_stage_duration,
+            booking_rejections, sql_statement_duration)
+
+# Počítadlo SQL dotazů aktuálního požadavku (sdílené i do threadpoolu – kontext se kopíruje)
+_request_statements: ContextVar[list | None] = ContextVar("request_statements", default=None)
+
+_DISABLED = nullcontext()
+
+
+def stage(name: str):
+    """
+    Změří krok vytvoření rezervace (pravidlo, commit, …). ValueError z pravidla
+    se započítá jako odmítnutí tímto pravidlem a propadne dál.
+    """
+    if not METRICS_ENABLED:
+        return _DISABLED
+    return _timed_stage(name)
+
+
+@contextmanager
+def _timed_stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except ValueError:
+        booking_rejections.inc(name)
+        raise
+    finally:
+        booking_stage_duration.observe(time.perf_counter() - started, name)
+
+
+def render() -> str:
+    """Všechny metriky v textovém formátu Prometheus (text/plain; version=0.0.4)."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# === SQL listenery (na třídě Engine – platí pro sync i async engine) ===
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    sql_statement_duration.observe(time.perf_counter() - started, operation)
+    counter = _request_statements.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def install_sql_listeners():
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware: doba a počet SQL dotazů každého HTTP požadavku.
+    Route je šablona cesty (/rooms/{room_id}/bookings), ne konkrétní URL,
+    aby počet časových řad nerostl s počtem záznamů.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+        statements = [0]
+        token = _request_statements.set(statements)
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_statements.reset(token)
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            http_request_duration.observe(time.perf_counter() - started, scope["method"], path, status[0])
+            http_request_sql_statements.observe(statements[0], scope["method"], path)
@@ -1,15 +1,38 @@
-from typing import Optional
-from datetime import datetime
-from sqlmodel import SQLModel, Field
+from typing import Annotated, Optional
+from datetime import datetime, date
+from pydantic import AfterValidator
+from sqlmodel import SQLModel, Field, Index
+
+
+def to_local_naive(value: datetime) -> datetime:
+    """Čas s časovou zónou převede na lokální bez zóny (tak se ukládá i porovnává s now())."""
+    if value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+# Vstupní čas z API – "2025-01-06T09:00:00+01:00" i "...Z" se normalizuje hned při validaci
+LocalDatetime = Annotated[datetime, AfterValidator(to_local_naive)]
 
 # === DB entity (tabulky) ===
 
 class Room(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
-    capacity: int
+    capacity: int = Field(index=True)  # výběr nejmenší vyhovující místnosti
 
 class Booking(SQLModel, table=True):
+    # Složené indexy pro kontrolu kolizí (místnost + čas) a limit uživatele
+    __table_args__ = (
+        Index("ix_booking_room_start_end", "room_id", "start_time", "end_time"),
+        Index("ix_booking_user_start", "user_id", "start_time"),
+        # Archivace vybírá dávky podle konce rezervace
+        Index("ix_booking_end", "end_time"),
+        # Id archivovaných rezervací se nesmí znovu přidělit (SQLite jinak
+        # použije nejvyšší zbývající rowid + 1 a archiv by měl duplicitní id)
+        {"sqlite_autoincrement": True},
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     room_id: int = Field(foreign_key="room.id")
     user_id: int = Field(foreign_key="user.id")
@@ -17,10 +40,55 @@ class Booking(SQLModel, table=True):
     end_time: datetime
     attendees: int
 
+# Archiv minulých rezervací – stejné sloupce i id jako booking, aby šel
+# výpis spojit s hlavní tabulkou (UNION ALL seřazený podle id)
+class BookingArchive(SQLModel, table=True):
+    __tablename__ = "booking_archive"
+    __table_args__ = (
+        Index("ix_booking_archive_room_start", "room_id", "start_time"),
+        Index("ix_booking_archive_user_start", "user_id", "start_time"),
+    )
+
+    id: int = Field(primary_key=True)
+    room_id: int = Field(foreign_key="room.id")
+    user_id: int = Field(foreign_key="user.id")
+    start_time: datetime
+    end_time: datetime
+    attendees: int
+
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     username: str
-    email: str
+    email: str = Field(index=True)
+
+# Denní souhrn obsazenosti místnosti (materializovaný, udržovaný po každé rezervaci)
+class RoomUsageDaily(SQLModel, table=True):
+    day: date = Field(primary_key=True)
+    room_id: int = Field(primary_key=True, foreign_key="room.id")
+    booked_seconds: int = 0
+
+class ChangeLog(SQLModel, table=True):
+    # Změny pro ostatní procesy (MULTI_WORKER); AUTOINCREMENT – id se nikdy nepoužije znovu,
+    # takže mezera na začátku čtení znamená, že se mezitím promazaly nepřevzaté záznamy
+    __tablename__ = "change_log"
+    __table_args__ = {"sqlite_autoincrement": True}
+    id: Optional[int] = Field(default=None, primary_key=True)
+    table_name: str
+    action: str                    # "created", "updated", "deleted", "archived"
+    entity_id: Optional[int] = None
+    origin: str                    # proces, který změnu zapsal (své změny už má aplikované)
+    payload: Optional[str] = None  # JSON řádku rezervace (aby ostatní nemuseli číst DB)
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+
+class IdempotencyRecord(SQLModel, table=True):
+    # Odpověď POST požadavku uložená pod hlavičkou Idempotency-Key (opakování ji jen vrátí).
+    # Bez status_code/body je klíč jen rezervovaný – požadavek se právě provádí.
+    __tablename__ = "idempotency_key"
+    key: str = Field(primary_key=True)
+    fingerprint: str               # hash cesty a těla požadavku
+    status_code: Optional[int] = None
+    body: Optional[bytes] = None
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
 
 # === Request schémata (bez id – pro API vstup) ===
 
@@ -31,9 +99,32 @@ class RoomCreate(SQLModel):
 class BookingCreate(SQLModel):
     room_id: int
     user_id: int
-    start_time: datetime
-    end_time: datetime
+    start_time: LocalDatetime
+    end_time: LocalDatetime
+    attendees: int
+
+class BookingUpdate(SQLModel):
+    # PATCH /bookings/{id} – vynechaná pole zůstávají, uživatel se nemění
+    room_id: Optional[int] = None
+    start_time: Optional[LocalDatetime] = None
+    end_time: Optional[LocalDatetime] = None
+    attendees: Optional[int] = None
+
+class RecurringBookingCreate(SQLModel):
+    room_id: int
+    user_id: int
+    start_time: LocalDatetime  # začátek prvního výskytu
+    end_time: LocalDatetime    # konec prvního výskytu
+    attendees: int
+    frequency: str        # "daily" nebo "weekly"
+    count: int            # počet opakování (víkendové výskyty se vynechají)
+
+class AutoBookingCreate(SQLModel):
+    user_id: int
     attendees: int
+    earliest_start: LocalDatetime  # okno, ve kterém se hledá termín
+    latest_end: LocalDatetime
+    duration: int             # délka schůzky v minutách
 
 class UserCreate(SQLModel):
     username: str
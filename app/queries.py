@@ -0,0 +1,116 @@
+import json
+from datetime import datetime
+from typing import Iterator, Optional
+from fastapi.responses import JSONResponse
+from sqlalchemy.engine import Engine
+from sqlalchemy import union_all
+from sqlmodel import SQLModel, Session, select
+from app.models import Booking, BookingArchive, to_local_naive
+
+# orjson je výrazně rychlejší než json; bez něj se použije standardní knihovna
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# Velikost stránky pro výpisy (keyset stránkování podle id)
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Počet řádků načítaných z kurzoru najednou při streamování
+STREAM_CHUNK_SIZE = 500
+
+
+def page_statement(model: type[SQLModel], after: int = 0):
+    """
+    Dotaz na záznamy s id > after seřazené podle id (jde po primárním klíči).
+    Vybírá přímo sloupce, ne ORM instance – výpisy řádky nevalidují přes Pydantic,
+    jen je zakódují do JSON (encode_rows).
+    """
+    return select(*model.__table__.columns).where(model.id > after).order_by(model.id)
+
+
+def booking_page_statement(after: int = 0, room_id: Optional[int] = None, user_id: Optional[int] = None,
+                           start_time: Optional[datetime] = None, end_time: Optional[datetime] = None,
+                           include_archive: bool = False):
+    """
+    Stránka rezervací s filtry po místnosti, uživateli a časovém okně.
+    Okno vybírá rezervace, které se s ním překrývají (start < to, end > from);
+    filtr místnosti a uživatele jde přes složené indexy rezervací.
+    S include_archive se přidají i archivované rezervace (UNION ALL, id jsou
+    v obou tabulkách jedinečná, takže keyset stránkování funguje dál).
+    """
+    statement = _filtered_bookings(Booking, after, room_id, user_id, start_time, end_time)
+    if not include_archive:
+        return statement
+    archived = _filtered_bookings(BookingArchive, after, room_id, user_id, start_time, end_time)
+    combined = union_all(statement.order_by(None), archived.order_by(None)).subquery()
+    return select(*combined.columns).order_by(combined.c.id)
+
+
+def _filtered_bookings(model, after, room_id, user_id, start_time, end_time):
+    statement = page_statement(model, after)
+    if room_id is not None:
+        statement = statement.where(model.room_id == room_id)
+    if user_id is not None:
+        statement = statement.where(model.user_id == user_id)
+    # okno se zónou (from=…+05:00) na lokální čas, ve kterém jsou uložené rezervace
+    if end_time is not None:
+        statement = statement.where(model.start_time < to_local_naive(end_time))
+    if start_time is not None:
+        statement = statement.where(model.end_time > to_local_naive(start_time))
+    return statement
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_rows(rows) -> bytes:
+    """Zakóduje řádky (sloupcové n-tice) jako JSON pole objektů."""
+    if not rows:
+        return b"[]"
+    keys = tuple(rows[0]._fields)
+    objects = [dict(zip(keys, row)) for row in rows]
+    if orjson is not None:
+        return orjson.dumps(objects)
+    return json.dumps(objects, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+
+
+def encode_ndjson(rows) -> bytes:
+    """Zakóduje řádky jako NDJSON (jeden objekt na řádek)."""
+    if not rows:
+        return b""
+    keys = tuple(rows[0]._fields)
+    if orjson is not None:
+        return b"".join(orjson.dumps(dict(zip(keys, row)), option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+    return b"".join(json.dumps(dict(zip(keys, row)), ensure_ascii=False, default=_default).encode() + b"\n"
+                    for row in rows)
+
+
+class RowsJSONResponse(JSONResponse):
+    """
+    JSON odpověď z již zakódovaných bajtů nebo ze sloupcových řádků.
+    Endpointy s ní deklarují `response_model` jen kvůli OpenAPI schématu –
+    vrácená Response obchází validaci i serializaci FastAPI.
+    """
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return encode_rows(content)
+
+
+def stream_ndjson(engine: Engine, statement, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Streamuje výsledek dotazu jako NDJSON (jeden JSON objekt na řádek).
+    Řádky se čtou z kurzoru po dávkách (yield_per), takže paměť nezávisí
+    na velikosti tabulky. Používá vlastní session – ta z dependency
+    se zavírá dřív, než se odpověď dostreamuje.
+    """
+    with Session(engine) as session:
+        results = session.execute(statement.execution_options(yield_per=chunk_size))
+        for chunk in results.partitions():
+            yield encode_ndjson(chunk)
@@ -1,7 +1,37 @@
-from datetime import datetime
-from app.models import Room, Booking
+import threading
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, NamedTuple, Optional, TYPE_CHECKING
+from app.models import Room, Booking, User, BookingCreate, RecurringBookingCreate, AutoBookingCreate
+from app.interval_index import RoomIntervalIndex
+from app import metrics
 from sqlmodel import Session, select, func
 
+if TYPE_CHECKING:
+    from sqlmodel.ext.asyncio.session import AsyncSession
+    from app.cache import FutureBookingCounter, EntityCache
+
+# Maximální počet budoucích rezervací jednoho uživatele
+MAX_FUTURE_BOOKINGS = 2
+
+# Nejdelší časové okno, ve kterém se hledají volné termíny
+MAX_AVAILABILITY_WINDOW = timedelta(days=31)
+
+# Opakované rezervace: krok podle frekvence a max. počet opakování
+RECURRENCE_STEPS = {"daily": timedelta(days=1), "weekly": timedelta(weeks=1)}
+MAX_OCCURRENCES = 366
+
+# Cenové třídy pravidel – pipeline je spouští v tomto pořadí
+PURE, CACHED, DB = 0, 1, 2
+
+
+class NotFoundError(ValueError):
+    """Odkazovaná místnost nebo uživatel neexistuje (v API 404, ne 400)."""
+
+
+class ConflictError(ValueError):
+    """Místnost je v daném čase obsazená."""
+
+
 class BookingService:
 
     @staticmethod
@@ -39,23 +69,40 @@ class BookingService:
         return True
     
     @staticmethod
-    def check_availability(session: Session, room_id: int, start_time: datetime, end_time: datetime):
+    def availability_statement(room_id: int, start_time: datetime, end_time: datetime,
+                               exclude_id: Optional[int] = None):
+        """Dotaz na rezervace místnosti překrývající se s daným časem (index room_id, start_time, end_time)."""
+        statement = select(Booking).where(
+            Booking.room_id == room_id,
+            Booking.start_time < end_time,
+            Booking.end_time > start_time
+        )
+        if exclude_id is not None:
+            statement = statement.where(Booking.id != exclude_id)
+        return statement
+
+    @staticmethod
+    def check_availability(session: Session, room_id: int, start_time: datetime, end_time: datetime,
+                           index: Optional[RoomIntervalIndex] = None, exclude_id: Optional[int] = None):
         """
         Ověří, zda je místnost v daném čase volná.
         Hledáme jakoukoli rezervaci, která se překrývá s požadovaným časem.
+        Pokud je k dispozici načtený in-memory index, použije se místo DB;
+        SQL dotaz zůstává jako záložní (a ověřovací) cesta. Při úpravě
+        rezervace se `exclude_id` (ona sama) za kolizi nepovažuje.
         """
-        statement = select(Booking).where(
-            Booking.room_id == room_id,
-            Booking.start_time < end_time,  
-            Booking.end_time > start_time 
-        )
-        
+        if index is not None and index.loaded:
+            if index.find_overlap(room_id, start_time, end_time, exclude=exclude_id) is not None:
+                raise ConflictError("Room is already booked")
+            return True
+
+        statement = BookingService.availability_statement(room_id, start_time, end_time, exclude_id)
         results = session.exec(statement)
         #pokud toto něco vrátí, máme kolizi
         existing_booking = results.first()
 
         if existing_booking:
-            raise ValueError("Room is already booked")
+            raise ConflictError("Room is already booked")
         
         return True
     
@@ -67,14 +114,486 @@ class BookingService:
         return True
 
     @staticmethod
-    def validate_user_limit(session: Session, user_id: int):
-        """Uživatel nesmí mít více než 2 budoucí rezervace."""
-        statement = select(func.count(Booking.id)).where(
+    def user_limit_statement(user_id: int, now: datetime):
+        """Dotaz na počet budoucích rezervací uživatele (index user_id, start_time)."""
+        return select(func.count(Booking.id)).where(
             Booking.user_id == user_id,
-            Booking.start_time > datetime.now()
+            Booking.start_time > now
         )
-        count = session.exec(statement).one()
+
+    @staticmethod
+    def validate_user_limit(session: Session, user_id: int, counter: Optional["FutureBookingCounter"] = None):
+        """
+        Uživatel nesmí mít více než 2 budoucí rezervace.
+        S počítadlem budoucích rezervací jde o vyhledání ve slovníku, jinak COUNT v DB.
+        """
+        if counter is not None:
+            count = counter.count(session, user_id)
+        else:
+            statement = BookingService.user_limit_statement(user_id, datetime.now())
+            count = session.exec(statement).one()
         
-        if count >= 2:
-            raise ValueError("User creates too many bookings (max 2)")
-        return True
\ No newline at end of file
+        if count >= MAX_FUTURE_BOOKINGS:
+            raise ValueError(f"User creates too many bookings (max {MAX_FUTURE_BOOKINGS})")
+        return True
+
+    # === Async varianty DB pravidel (DATABASE_MODE=async) ===
+
+    @staticmethod
+    async def check_availability_async(session: "AsyncSession", room_id: int, start_time: datetime,
+                                       end_time: datetime, index: Optional[RoomIntervalIndex] = None,
+                                       exclude_id: Optional[int] = None):
+        """Async varianta check_availability (stejný index i dotaz, AsyncSession)."""
+        if index is not None and index.loaded:
+            return BookingService.check_availability(None, room_id, start_time, end_time, index=index,
+                                                     exclude_id=exclude_id)
+
+        statement = BookingService.availability_statement(room_id, start_time, end_time, exclude_id)
+        results = await session.exec(statement)
+        if results.first():
+            raise ConflictError("Room is already booked")
+        return True
+
+    @staticmethod
+    async def validate_user_limit_async(session: "AsyncSession", user_id: int,
+                                        counter: Optional["FutureBookingCounter"] = None):
+        """Async varianta validate_user_limit."""
+        if counter is not None:
+            count = await counter.count_async(session, user_id)
+        else:
+            statement = BookingService.user_limit_statement(user_id, datetime.now())
+            count = (await session.exec(statement)).one()
+
+        if count >= MAX_FUTURE_BOOKINGS:
+            raise ValueError(f"User creates too many bookings (max {MAX_FUTURE_BOOKINGS})")
+        return True
+
+    # === Hromadný import ===
+
+    @staticmethod
+    def future_counts_statement(user_ids, now: datetime):
+        """Počty budoucích rezervací pro více uživatelů najednou (index user_id, start_time)."""
+        return select(Booking.user_id, func.count(Booking.id)).where(
+            Booking.user_id.in_(user_ids),
+            Booking.start_time > now
+        ).group_by(Booking.user_id)
+
+    @staticmethod
+    def intervals_statement(room_ids, start_time: datetime, end_time: datetime):
+        """Intervaly rezervací vybraných místností v časovém okně, seřazené po místnostech a začátku."""
+        return select(Booking.room_id, Booking.start_time, Booking.end_time).where(
+            Booking.room_id.in_(room_ids),
+            Booking.start_time < end_time,
+            Booking.end_time > start_time
+        ).order_by(Booking.room_id, Booking.start_time)
+
+    @staticmethod
+    def validate_bulk(session: Session, items: list[BookingCreate], now: Optional[datetime] = None):
+        """
+        Ověří dávku rezervací stejnými pravidly jako jednotlivou rezervaci.
+        Místnosti, uživatele, počty budoucích rezervací i existující intervaly
+        načte vždy jedním dotazem; kolize (s DB i uvnitř dávky) hledá jedním
+        průchodem přes rezervace seřazené podle začátku – při konfliktu v dávce
+        vyhrává dřívější začátek, při shodě dřívější položka.
+        Vrací seznam chyb zarovnaný s položkami (None = položka přijata).
+        """
+        now = now or datetime.now()
+        errors: list[Optional[str]] = [None] * len(items)
+
+        # Pravidla bez DB
+        for i, item in enumerate(items):
+            try:
+                BOOKING_RULES.run(BookingCheck(item), max_cost=PURE)
+            except ValueError as e:
+                errors[i] = str(e)
+
+        pending = [i for i, error in enumerate(errors) if error is None]
+        if not pending:
+            return errors
+
+        room_ids = {items[i].room_id for i in pending}
+        user_ids = {items[i].user_id for i in pending}
+        rooms = {room.id: room for room in session.exec(select(Room).where(Room.id.in_(room_ids)))}
+        existing_users = set(session.exec(select(User.id).where(User.id.in_(user_ids))))
+
+        for i in pending:
+            item = items[i]
+            room = rooms.get(item.room_id)
+            if room is None:
+                errors[i] = "Room not found"
+            elif item.user_id not in existing_users:
+                errors[i] = "User not found"
+            else:
+                try:
+                    BookingService.validate_capacity(room, item.attendees)
+                except ValueError as e:
+                    errors[i] = str(e)
+
+        pending = sorted(
+            (i for i in pending if errors[i] is None),
+            key=lambda i: (items[i].start_time, i)
+        )
+        if not pending:
+            return errors
+
+        future_counts = dict(session.exec(BookingService.future_counts_statement(
+            {items[i].user_id for i in pending}, now
+        )).all())
+
+        window_start = min(items[i].start_time for i in pending)
+        window_end = max(items[i].end_time for i in pending)
+        existing: dict[int, list[tuple[datetime, datetime]]] = {}
+        for room_id, start_time, end_time in session.exec(BookingService.intervals_statement(
+            {items[i].room_id for i in pending}, window_start, window_end
+        )):
+            existing.setdefault(room_id, []).append((start_time, end_time))
+
+        # Stav průchodu pro každou místnost: pozice v existujících intervalech
+        # a nejpozdější konec všeho, co začíná před aktuální položkou.
+        position: dict[int, int] = {}
+        last_end: dict[int, datetime] = {}
+
+        for i in pending:
+            item = items[i]
+            if item.start_time > now and future_counts.get(item.user_id, 0) >= MAX_FUTURE_BOOKINGS:
+                errors[i] = f"User creates too many bookings (max {MAX_FUTURE_BOOKINGS})"
+                continue
+
+            intervals = existing.get(item.room_id, [])
+            p = position.get(item.room_id, 0)
+            end = last_end.get(item.room_id, window_start)
+            while p < len(intervals) and intervals[p][0] <= item.start_time:
+                end = max(end, intervals[p][1])
+                p += 1
+            position[item.room_id] = p
+            last_end[item.room_id] = end
+
+            if end > item.start_time or (p < len(intervals) and intervals[p][0] < item.end_time):
+                errors[i] = "Room is already booked"
+                continue
+
+            last_end[item.room_id] = max(end, item.end_time)
+            if item.start_time > now:
+                future_counts[item.user_id] = future_counts.get(item.user_id, 0) + 1
+
+        return errors
+
+    # === Opakované rezervace ===
+
+    @staticmethod
+    def expand_recurrence(data: RecurringBookingCreate):
+        """
+        Rozvine opakovanou rezervaci na jednotlivé výskyty.
+        Výskyty o víkendu vynechá (stejně jako validate_working_days).
+        Vrací (seznam BookingCreate seřazený podle začátku, počet vynechaných).
+        """
+        step = RECURRENCE_STEPS.get(data.frequency)
+        if step is None:
+            raise ValueError("Frequency must be 'daily' or 'weekly'")
+        if not 1 <= data.count <= MAX_OCCURRENCES:
+            raise ValueError(f"Occurrence count must be between 1 and {MAX_OCCURRENCES}")
+        BookingService.validate_times(data.start_time, data.end_time)
+        duration = data.end_time - data.start_time
+        if duration > step:
+            raise ValueError("Occurrence must not be longer than the recurrence interval")
+
+        starts = [data.start_time + k * step for k in range(data.count)]
+        working = [start for start in starts if start.weekday() < 5]
+        occurrences = [
+            BookingCreate(room_id=data.room_id, user_id=data.user_id, attendees=data.attendees,
+                          start_time=start, end_time=start + duration)
+            for start in working
+        ]
+        return occurrences, len(starts) - len(working)
+
+    # === Hledání volných termínů ===
+
+    @staticmethod
+    def working_spans(start_time: datetime, end_time: datetime):
+        """
+        Rozdělí okno na souvislé úseky pracovních dnů (Po–Pá), víkendy vynechá.
+        Navazující pracovní dny tvoří jeden úsek, aby termín mohl přejít přes půlnoc.
+        """
+        spans = []
+        day = datetime.combine(start_time.date(), datetime.min.time())
+        while day < end_time:
+            next_day = day + timedelta(days=1)
+            if day.weekday() < 5:
+                span_start, span_end = max(day, start_time), min(next_day, end_time)
+                if spans and spans[-1][1] == span_start:
+                    spans[-1] = (spans[-1][0], span_end)
+                else:
+                    spans.append((span_start, span_end))
+            day = next_day
+        return spans
+
+    @staticmethod
+    def free_slots(intervals, spans, min_duration: timedelta):
+        """
+        Volné úseky místnosti v pracovních úsecích `spans`.
+        `intervals` jsou rezervace místnosti seřazené podle začátku; oba seznamy
+        se projdou jedním společným průchodem (merge), bez dotazu na každý termín.
+        """
+        slots = []
+        i = 0
+        for span_start, span_end in spans:
+            cursor = span_start
+            while i < len(intervals) and intervals[i][1] <= cursor:
+                i += 1
+            j = i
+            while j < len(intervals) and intervals[j][0] < span_end:
+                booked_start, booked_end = intervals[j]
+                if booked_start - cursor >= min_duration:
+                    slots.append((cursor, booked_start))
+                cursor = max(cursor, booked_end)
+                j += 1
+            if span_end - cursor >= min_duration:
+                slots.append((cursor, span_end))
+        return slots
+
+    @staticmethod
+    def rooms_by_capacity_statement(min_capacity: int, after: Optional[tuple[int, int]] = None):
+        """
+        Místnosti s kapacitou >= min_capacity od nejmenší (index ix_room_capacity).
+        `after` = (kapacita, id) poslední prohledané místnosti – pokračování po dávkách.
+        """
+        statement = select(Room).where(Room.capacity >= min_capacity)
+        if after is not None:
+            capacity, room_id = after
+            statement = statement.where(
+                (Room.capacity > capacity) | ((Room.capacity == capacity) & (Room.id > room_id))
+            )
+        return statement.order_by(Room.capacity, Room.id)
+
+    @staticmethod
+    def find_best_slot(session: Session, data: AutoBookingCreate, exclude=(), batch_size: int = 50):
+        """
+        Nejmenší místnost s kapacitou >= attendees, která má v okně volný termín
+        dané délky; vrací (místnost, nejdřívější začátek) nebo None.
+        Místnosti prochází od nejmenší po dávkách – intervaly dávky načte jedním
+        dotazem a volné úseky spočítá stejně jako find_free_slots.
+        """
+        duration = timedelta(minutes=data.duration)
+        spans = BookingService.working_spans(data.earliest_start, data.latest_end)
+        after = None
+        while True:
+            rooms = session.exec(BookingService.rooms_by_capacity_statement(data.attendees, after)
+                                 .limit(batch_size)).all()
+            if not rooms:
+                return None
+            intervals: dict[int, list[tuple[datetime, datetime]]] = {}
+            for room_id, booked_start, booked_end in session.exec(BookingService.intervals_statement(
+                [room.id for room in rooms], data.earliest_start, data.latest_end
+            )):
+                intervals.setdefault(room_id, []).append((booked_start, booked_end))
+            for room in rooms:
+                if room.id in exclude:
+                    continue
+                slots = BookingService.free_slots(intervals.get(room.id, []), spans, duration)
+                if slots:
+                    return room, slots[0][0]
+            after = (rooms[-1].capacity, rooms[-1].id)
+
+    @staticmethod
+    def validate_auto_request(data: AutoBookingCreate):
+        """Vstup automatického výběru místnosti (bez DB)."""
+        BookingService.validate_booking_attendees(data.attendees)
+        BookingService.validate_times(data.earliest_start, data.latest_end)
+        if data.latest_end - data.earliest_start > MAX_AVAILABILITY_WINDOW:
+            raise ValueError(f"Availability window too long (max {MAX_AVAILABILITY_WINDOW.days} days)")
+        if data.duration <= 0:
+            raise ValueError("Duration must be positive")
+        if timedelta(minutes=data.duration) > data.latest_end - data.earliest_start:
+            raise ValueError("Duration does not fit into the requested window")
+        return True
+
+    @staticmethod
+    def find_free_slots(session: Session, start_time: datetime, end_time: datetime,
+                        min_capacity: int, duration: timedelta):
+        """
+        Najde volné termíny všech místností s kapacitou >= min_capacity.
+        Rezervace všech kandidátních místností načte jedním dotazem
+        (seřazené po místnostech a začátku) a každou místnost projde jednou.
+        """
+        BookingService.validate_times(start_time, end_time)
+        if end_time - start_time > MAX_AVAILABILITY_WINDOW:
+            raise ValueError(f"Availability window too long (max {MAX_AVAILABILITY_WINDOW.days} days)")
+        if duration <= timedelta(0):
+            raise ValueError("Duration must be positive")
+
+        rooms = session.exec(BookingService.rooms_by_capacity_statement(min_capacity)).all()
+        if not rooms:
+            return []
+
+        intervals: dict[int, list[tuple[datetime, datetime]]] = {}
+        for room_id, booked_start, booked_end in session.exec(BookingService.intervals_statement(
+            [room.id for room in rooms], start_time, end_time
+        )):
+            intervals.setdefault(room_id, []).append((booked_start, booked_end))
+
+        spans = BookingService.working_spans(start_time, end_time)
+        result = []
+        for room in rooms:
+            slots = BookingService.free_slots(intervals.get(room.id, []), spans, duration)
+            if slots:
+                result.append({
+                    "room_id": room.id,
+                    "name": room.name,
+                    "capacity": room.capacity,
+                    "slots": [{"start_time": start, "end_time": end} for start, end in slots],
+                })
+        return result
+
+
+# === Pipeline pravidel pro vytvoření rezervace ===
+
+class BookingCheck:
+    """
+    Stav jednoho ověřování rezervace předávaný pravidlům pipeline.
+    Pravidla s cenou CACHED/DB potřebují session, levnější pravidla ji nikdy nepoužijí.
+    Při úpravě nese `booking` původní podobu upravované rezervace.
+    """
+
+    def __init__(self, data: BookingCreate, session: Optional[Session] = None,
+                 entities: Optional["EntityCache"] = None,
+                 counter: Optional["FutureBookingCounter"] = None,
+                 index: Optional[RoomIntervalIndex] = None,
+                 booking: Optional[Booking] = None):
+        self.data = data
+        self.session = session
+        self.entities = entities
+        self.counter = counter
+        self.index = index
+        self.booking = booking
+        self.room: Optional[Room] = None
+
+    def bind(self, session: Session) -> "BookingCheck":
+        """Připojí session (např. sync session z AsyncSession.run_sync)."""
+        self.session = session
+        return self
+
+
+class BookingRule(NamedTuple):
+    name: str
+    cost: int
+    check: Callable[[BookingCheck], object]
+    # Varianta nad AsyncSession; bez ní běží pravidlo v async cestě přes run_sync
+    check_async: Optional[Callable[[BookingCheck, "AsyncSession"], Awaitable[object]]] = None
+
+
+def _load_room(check: BookingCheck):
+    if check.entities is not None:
+        check.room = check.entities.get_room(check.session, check.data.room_id)
+    else:
+        check.room = check.session.get(Room, check.data.room_id)
+    if check.room is None:
+        raise NotFoundError("Room not found")
+
+
+def _check_user(check: BookingCheck):
+    if check.entities is not None:
+        exists = check.entities.user_exists(check.session, check.data.user_id)
+    else:
+        exists = check.session.get(User, check.data.user_id) is not None
+    if not exists:
+        raise NotFoundError("User not found")
+
+
+def _check_user_limit(check: BookingCheck):
+    # Přesun budoucí rezervace počet budoucích rezervací uživatele nezvýší
+    if check.booking is not None and check.booking.start_time > datetime.now():
+        return
+    BookingService.validate_user_limit(check.session, check.data.user_id, counter=check.counter)
+
+
+async def _check_user_limit_async(check: BookingCheck, session: "AsyncSession"):
+    if check.booking is not None and check.booking.start_time > datetime.now():
+        return
+    await BookingService.validate_user_limit_async(session, check.data.user_id, counter=check.counter)
+
+
+class RulePipeline:
+    """
+    Pravidla seřazená podle ceny (PURE → CACHED → DB), vyhodnocovaná do první chyby.
+    Nevalidní vstup tak odmítne čistá kontrola dřív, než se sáhne do cache nebo DB.
+    `run()` lze omezit na rozsah cen – DB pravidla se spouští až pod zámkem
+    a v transakci. Pro každé pravidlo počítá vyhodnocení a odmítnutí.
+    """
+
+    def __init__(self, rules):
+        self.rules = tuple(sorted(rules, key=lambda rule: rule.cost))
+        self._counts = {rule.name: [0, 0] for rule in self.rules}  # [vyhodnoceno, odmítnuto]
+        self._lock = threading.Lock()
+
+    def run(self, check: BookingCheck, min_cost: int = PURE, max_cost: int = DB):
+        for rule in self.rules:
+            if not min_cost <= rule.cost <= max_cost:
+                continue
+            try:
+                with metrics.stage(rule.name):
+                    rule.check(check)
+            except ValueError:
+                self._record(rule.name, rejected=True)
+                raise
+            self._record(rule.name, rejected=False)
+        return True
+
+    async def run_async(self, check: BookingCheck, session: "AsyncSession", min_cost: int = PURE,
+                        max_cost: int = DB):
+        """
+        Varianta run() nad AsyncSession: pravidla s check_async se awaitují,
+        ostatní běží přes session.run_sync se sync session.
+        """
+        for rule in self.rules:
+            if not min_cost <= rule.cost <= max_cost:
+                continue
+            try:
+                with metrics.stage(rule.name):
+                    if rule.check_async is not None:
+                        await rule.check_async(check, session)
+                    else:
+                        await session.run_sync(lambda sync_session: rule.check(check.bind(sync_session)))
+            except ValueError:
+                self._record(rule.name, rejected=True)
+                raise
+            self._record(rule.name, rejected=False)
+        return True
+
+    def _record(self, name: str, rejected: bool):
+        with self._lock:
+            counts = self._counts[name]
+            counts[0] += 1
+            counts[1] += rejected
+
+    def stats(self):
+        """Počty vyhodnocení a podíl odmítnutí pro každé pravidlo (v pořadí spouštění)."""
+        with self._lock:
+            return [
+                {"rule": rule.name, "cost": ("pure", "cached", "db")[rule.cost],
+                 "evaluated": self._counts[rule.name][0], "rejected": self._counts[rule.name][1],
+                 "rejection_rate": round(self._counts[rule.name][1] / self._counts[rule.name][0], 4)
+                                   if self._counts[rule.name][0] else 0.0}
+                for rule in self.rules
+            ]
+
+    def reset(self):
+        with self._lock:
+            for counts in self._counts.values():
+                counts[:] = [0, 0]
+
+
+BOOKING_RULES = RulePipeline([
+    BookingRule("attendees", PURE, lambda c: BookingService.validate_booking_attendees(c.data.attendees)),
+    BookingRule("times", PURE, lambda c: BookingService.validate_times(c.data.start_time, c.data.end_time)),
+    BookingRule("working_days", PURE, lambda c: BookingService.validate_working_days(c.data.start_time)),
+    BookingRule("room", CACHED, _load_room),
+    BookingRule("capacity", CACHED, lambda c: BookingService.validate_capacity(c.room, c.data.attendees)),
+    BookingRule("user", CACHED, _check_user),
+    BookingRule("user_limit", DB, _check_user_limit, _check_user_limit_async),
+    BookingRule("availability", DB, lambda c: BookingService.check_availability(
+        c.session, c.data.room_id, c.data.start_time, c.data.end_time, index=c.index,
+        exclude_id=c.booking.id if c.booking is not None else None),
+        lambda c, session: BookingService.check_availability_async(
+            session, c.data.room_id, c.data.start_time, c.data.end_time, index=c.index,
+            exclude_id=c.booking.id if c.booking is not None else None)),
+])
@@ -0,0 +1,225 @@
+from datetime import datetime, date, time, timedelta
+from sqlalchemy import DateTime, delete, func, type_coerce, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+from app.config import USAGE_ROLLUPS
+from app.models import Room, Booking, BookingArchive, RoomUsageDaily
+from app.services import BookingService
+
+# Statistiky obsazenosti místností (/stats/utilization). Počítají se z booking
+# i booking_archive – archivace přesouvá jen řádky, obsazenost místnosti v minulosti
+# se tím nemění (stejně jako denní souhrny, které se při archivaci nepřepočítávají).
+
+BUCKET_LENGTHS = {"hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(weeks=1)}
+
+# Posun na další bucket (modifikátor SQLite datetime())
+BUCKET_STEPS = {"hour": "+1 hours", "day": "+1 days", "week": "+7 days"}
+
+# Maximální počet bucketů na místnost v jedné odpovědi
+MAX_BUCKETS = 5000
+
+# Zapnuté materializované denní souhrny (RoomUsageDaily)
+ROLLUPS_ENABLED = USAGE_ROLLUPS
+
+
+def bucket_start(moment: datetime, bucket: str) -> datetime:
+    """Začátek bucketu, do kterého okamžik patří (týden začíná v pondělí)."""
+    if bucket == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = datetime.combine(moment.date(), time.min)
+    if bucket == "day":
+        return day
+    return day - timedelta(days=day.weekday())
+
+
+def split_interval(start: datetime, end: datetime, bucket: str):
+    """Rozdělí interval podle hranic bucketů na dvojice (začátek bucketu, sekundy)."""
+    length = BUCKET_LENGTHS[bucket]
+    parts = []
+    current = bucket_start(start, bucket)
+    while current < end:
+        following = current + length
+        seconds = (min(end, following) - max(start, current)).total_seconds()
+        if seconds > 0:
+            parts.append((current, seconds))
+        current = following
+    return parts
+
+
+def _bucket_sql(moment, bucket: str):
+    """SQL obdoba bucket_start() – výsledek je text 'YYYY-MM-DD HH:MM:SS'."""
+    if bucket == "hour":
+        return func.strftime("%Y-%m-%d %H:00:00", moment)
+    if bucket == "day":
+        return func.datetime(moment, "start of day")
+    return func.datetime(moment, "start of day", "-6 days", "weekday 1")  # pondělí v týdnu
+
+
+def usage_statement(room_ids, start: datetime, end: datetime, bucket: str):
+    """
+    Obsazené sekundy po (místnost, bucket) spočítané v SQLite. Rekurzivní CTE
+    rozřeže rezervace z okna (booking i archiv, indexy místnost + čas) na hranicích bucketů
+    a GROUP BY je sečte, takže do Pythonu jde jeden řádek na bucket, ne na
+    rezervaci. Časy uvnitř jsou julianday (dny jako REAL), rozdíl × 86400 = sekundy.
+    """
+    step = BUCKET_STEPS[bucket]
+    source = union_all(*(
+        select(model.room_id, model.start_time, model.end_time).where(
+            model.room_id.in_(room_ids),
+            model.start_time < end,
+            model.end_time > start
+        ) for model in (Booking, BookingArchive)
+    )).subquery()
+    piece_start = func.max(source.c.start_time, start)
+    parts = select(
+        source.c.room_id.label("room_id"),
+        _bucket_sql(piece_start, bucket).label("slot"),
+        func.julianday(piece_start).label("lo"),
+        func.julianday(func.min(source.c.end_time, end)).label("hi"),
+    ).cte("parts", recursive=True)
+    following = func.datetime(parts.c.slot, step)
+    parts = parts.union_all(
+        select(parts.c.room_id, following, func.julianday(following), parts.c.hi)
+        .where(func.julianday(following) < parts.c.hi)
+    )
+
+    seconds = func.sum((func.min(parts.c.hi, func.julianday(func.datetime(parts.c.slot, step))) - parts.c.lo)
+                       * 86400)
+    return select(
+        parts.c.room_id, type_coerce(parts.c.slot, DateTime), func.round(seconds, 3)
+    ).group_by(parts.c.room_id, parts.c.slot)
+
+
+def _add_raw_usage(session: Session, totals: dict, peaks: dict, room_ids,
+                   start: datetime, end: datetime, bucket: str):
+    """Přičte obsazenost z rezervací v okně (součty po bucketech z usage_statement)."""
+    for room_id, slot, seconds in session.exec(usage_statement(room_ids, start, end, bucket)):
+        if seconds <= 0:
+            continue
+        totals[(room_id, slot)] = totals.get((room_id, slot), 0) + seconds
+        if bucket == "hour":
+            peaks[slot.hour] = peaks.get(slot.hour, 0) + seconds
+
+
+def rollup_statement(first_day: date, last_day: date):
+    """Denní souhrny v rozsahu dnů [first_day, last_day) – jde po primárním klíči (day, room_id)."""
+    return select(RoomUsageDaily.room_id, RoomUsageDaily.day, RoomUsageDaily.booked_seconds).where(
+        RoomUsageDaily.day >= first_day,
+        RoomUsageDaily.day < last_day
+    )
+
+
+def utilization(session: Session, start: datetime, end: datetime, bucket: str, use_rollups: bool = False):
+    """
+    Obsazené minuty po místnostech a bucketech (hour/day/week) v okně [start, end).
+    Pro day/week s denními souhrny se celé dny čtou ze souhrnů a z rezervací
+    se počítají jen neúplné krajní dny, takže cena nezávisí na délce historie.
+    Pro bucket=hour vrací i součty po hodinách dne (špičky).
+    """
+    if bucket not in BUCKET_LENGTHS:
+        raise ValueError("Bucket must be one of: hour, day, week")
+    BookingService.validate_times(start, end)
+    if (end - start) / BUCKET_LENGTHS[bucket] > MAX_BUCKETS:
+        raise ValueError(f"Too many buckets (max {MAX_BUCKETS} per room)")
+
+    room_ids = list(session.exec(select(Room.id)))
+    totals: dict[tuple[int, datetime], float] = {}
+    peaks: dict[int, float] = {}
+
+    if use_rollups and bucket != "hour":
+        first_full = datetime.combine(start.date(), time.min)
+        if first_full < start:
+            first_full += timedelta(days=1)
+        last_full = max(datetime.combine(end.date(), time.min), first_full)
+        if first_full >= end:
+            _add_raw_usage(session, totals, peaks, room_ids, start, end, bucket)
+        else:
+            if start < first_full:
+                _add_raw_usage(session, totals, peaks, room_ids, start, first_full, bucket)
+            for room_id, day, seconds in session.exec(rollup_statement(first_full.date(), last_full.date())):
+                slot = bucket_start(datetime.combine(day, time.min), bucket)
+                totals[(room_id, slot)] = totals.get((room_id, slot), 0) + seconds
+            if last_full < end:
+                _add_raw_usage(session, totals, peaks, room_ids, last_full, end, bucket)
+    else:
+        _add_raw_usage(session, totals, peaks, room_ids, start, end, bucket)
+
+    rooms: dict[int, list] = {}
+    for (room_id, slot), seconds in sorted(totals.items()):
+        span = (min(end, slot + BUCKET_LENGTHS[bucket]) - max(start, slot)).total_seconds()
+        rooms.setdefault(room_id, []).append({
+            "start": slot,
+            "booked_minutes": round(seconds / 60, 2),
+            "occupancy": round(seconds / span, 4),
+        })
+
+    result = {
+        "bucket": bucket,
+        "from": start,
+        "to": end,
+        "rooms": [{"room_id": room_id, "buckets": buckets} for room_id, buckets in rooms.items()],
+    }
+    if bucket == "hour":
+        result["peak_hours"] = [
+            {"hour": hour, "booked_minutes": round(seconds / 60, 2)}
+            for hour, seconds in sorted(peaks.items(), key=lambda item: (-item[1], item[0]))
+        ]
+    return result
+
+
+# === Materializované denní souhrny ===
+
+def record_usage(session: Session, room_id: int, start_time: datetime, end_time: datetime, sign: int = 1):
+    """
+    Přičte (sign=1) nebo odečte (sign=-1) rezervaci v denních souhrnech.
+    Volá se ve stejné transakci jako zápis rezervace, takže souhrny nikdy
+    nepředběhnou ani nezaostanou za tabulkou booking.
+    """
+    if not ROLLUPS_ENABLED:
+        return
+    days = []
+    for day, seconds in split_interval(start_time, end_time, "day"):
+        statement = sqlite_insert(RoomUsageDaily).values(
+            day=day.date(), room_id=room_id, booked_seconds=sign * int(seconds)
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["day", "room_id"],
+            set_={"booked_seconds": RoomUsageDaily.booked_seconds + statement.excluded.booked_seconds},
+        )
+        session.execute(statement)
+        days.append(day.date())
+    if sign < 0 and days:
+        # vyprázdněné dny smazat, ať souhrny odpovídají rebuild_rollups()
+        session.execute(delete(RoomUsageDaily).where(
+            RoomUsageDaily.room_id == room_id, RoomUsageDaily.day.in_(days), RoomUsageDaily.booked_seconds <= 0))
+
+
+def rebuild_rollups(session: Session):
+    """Přepočítá denní souhrny z tabulek booking a booking_archive (proudově, po dávkách)."""
+    totals: dict[tuple[date, int], int] = {}
+    statement = union_all(*(
+        select(model.room_id, model.start_time, model.end_time) for model in (Booking, BookingArchive)
+    )).execution_options(yield_per=5000)
+    for room_id, start_time, end_time in session.exec(statement):
+        for day, seconds in split_interval(start_time, end_time, "day"):
+            key = (day.date(), room_id)
+            totals[key] = totals.get(key, 0) + int(seconds)
+
+    session.execute(delete(RoomUsageDaily))
+    if totals:
+        session.execute(sqlite_insert(RoomUsageDaily), [
+            {"day": day, "room_id": room_id, "booked_seconds": seconds}
+            for (day, room_id), seconds in totals.items()
+        ])
+    session.commit()
+
+
+def ensure_rollups(session: Session):
+    """Při startu se zapnutými souhrny je dopočítá, pokud chybí (např. starší database.db)."""
+    if not ROLLUPS_ENABLED:
+        return
+    has_rollups = session.exec(select(func.count()).select_from(RoomUsageDaily)).one() > 0
+    has_bookings = any(session.exec(select(model.id).limit(1)).first() is not None
+                       for model in (Booking, BookingArchive))
+    if has_bookings and not has_rollups:
+        rebuild_rollups(session)
@@ -0,0 +1,202 @@
+"""
+Benchmark a zátěžový test rezervačního API.
+
+Naplní dočasnou SQLite DB (`--rooms`, `--users`, `--bookings`) a změří:
+
+* služby přímo v procesu – `check_availability` a `validate_user_limit`
+  (SQL i in-memory varianta) sekvenčně i z `--concurrency` vláken,
+* HTTP scénáře – POST /bookings/ a výpisy (/rooms/, /bookings/?room_id=,
+  /rooms/{id}/bookings) v procesu (ASGI transport, bez sítě) i přes lokální
+  uvicorn, vždy s jedním a s `--concurrency` souběžnými klienty.
+
+Výsledky (propustnost, p50/p99) vypíše jako JSON včetně commitu; s `--baseline`
+k nim přidá poměr proti dřívějšímu reportu, aby šly regrese porovnat mezi commity.
+
+    python -m benchmarks.bench_api --bookings 100000 --requests 2000 --output bench.json
+    python -m benchmarks.bench_api --baseline bench.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+from sqlalchemy import event
+from sqlmodel import Session, create_engine
+
+from app.cache import FutureBookingCounter
+from app.database import apply_sqlite_pragmas
+from app.interval_index import RoomIntervalIndex, booking_index
+from app.main import app, get_session
+from app.services import BookingService
+from benchmarks.common import (seed_database, past_slots, booking_payloads, fire, latency_summary,
+                               uvicorn_server, write_report)
+
+# Zápisy jdou do minulosti (před seed, který začíná 2020) – nepočítají se do limitu uživatele
+FIRST_WRITE_DAY = datetime(2015, 1, 5, 8, 0)
+
+
+def service_calls(args):
+    """Dvojice (název, funkce(session, i)) pro služby měřené přímo v procesu."""
+    slots = past_slots(2000)
+    index, counter = RoomIntervalIndex(), FutureBookingCounter()
+
+    def availability(session, i, index=None):
+        start = slots[i % len(slots)] + timedelta(minutes=30)
+        try:
+            BookingService.check_availability(session, 1 + i % args.rooms, start, start + timedelta(hours=1),
+                                              index=index)
+        except ValueError:
+            pass
+
+    def user_limit(session, i, counter=None):
+        try:
+            BookingService.validate_user_limit(session, 1 + i % args.users, counter=counter)
+        except ValueError:
+            pass
+
+    return index, [
+        ("check_availability_sql", availability),
+        ("check_availability_index", lambda session, i: availability(session, i, index)),
+        ("validate_user_limit_sql", user_limit),
+        ("validate_user_limit_counter", lambda session, i: user_limit(session, i, counter)),
+    ]
+
+
+def run_service(engine, call, requests: int, concurrency: int):
+    """Zavolá službu `requests`-krát z `concurrency` vláken (každé s vlastní session)."""
+    latencies = []
+
+    def worker(offset):
+        with Session(engine) as session:
+            for i in range(offset, requests, concurrency):
+                started = time.perf_counter()
+                call(session, i)
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return latency_summary(latencies, time.perf_counter() - started)
+
+
+def http_scenarios(args):
+    """
+    Scénáře HTTP: název → funkce(běh) vracející seznam požadavků (method, url, json).
+    Každý běh zápisů dostane vlastní rok v minulosti, aby nekolidoval s předchozími.
+    """
+    def create_booking(run: int):
+        first_day = FIRST_WRITE_DAY - timedelta(weeks=52 * run)
+        return [("POST", "/bookings/", payload)
+                for payload in booking_payloads(args.requests, args.rooms, args.users, first_day=first_day)]
+
+    def reads(url):
+        def build(run: int):
+            rnd = random.Random(run)
+            return [("GET", url(rnd), None) for _ in range(args.requests)]
+        return build
+
+    return {
+        "create_booking": create_booking,
+        "list_rooms": reads(lambda rnd: f"/rooms/?limit=50&after={rnd.randrange(args.rooms)}"),
+        "list_bookings_by_room": reads(lambda rnd: f"/bookings/?room_id={rnd.randint(1, args.rooms)}&limit=50"
+                                                   f"&after={rnd.randrange(max(args.bookings, 1))}"),
+        "list_room_bookings": reads(lambda rnd: f"/rooms/{rnd.randint(1, args.rooms)}/bookings?limit=50"),
+    }
+
+
+async def run_http(client: httpx.AsyncClient, scenarios, levels, runs):
+    results = {}
+    for name, build in scenarios.items():
+        for concurrency in levels:
+            results[f"{name}@{concurrency}"] = await fire(client, build(next(runs)), concurrency)
+    return results
+
+
+def inprocess_client(engine):
+    """ASGI klient nad aplikací s session přesměrovanou na benchmarkovou DB."""
+    def get_bench_session():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_bench_session
+    with Session(engine) as session:
+        booking_index.load(session)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60.0)
+
+
+def compare(results: dict, baseline: dict):
+    """Poměr propustnosti a p99 proti dřívějšímu reportu (>1 = rychlejší / horší p99)."""
+    comparison = {}
+    for section, scenarios in results.items():
+        for name, summary in scenarios.items():
+            before = baseline.get("results", {}).get(section, {}).get(name)
+            if not before or not before.get("throughput_rps") or not before.get("p99_ms"):
+                continue
+            comparison[f"{section}/{name}"] = {
+                "throughput_ratio": round(summary["throughput_rps"] / before["throughput_rps"], 3),
+                "p99_ratio": round(summary["p99_ms"] / before["p99_ms"], 3),
+            }
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--bookings", type=int, default=50_000)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--skip-uvicorn", action="store_true", help="měřit jen v procesu")
+    parser.add_argument("--baseline", type=Path, help="dřívější JSON report k porovnání")
+    parser.add_argument("--output", type=Path, help="kam uložit JSON výsledky")
+    args = parser.parse_args()
+    levels = sorted({1, args.concurrency})
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = Path(tmp) / "bench.db"
+        seed_database(db_file, args.rooms, args.users, args.bookings)
+        engine = create_engine(f"sqlite:///{db_file}", connect_args={"check_same_thread": False})
+        event.listen(engine, "connect", apply_sqlite_pragmas)
+
+        index, calls = service_calls(args)
+        with Session(engine) as session:
+            index.load(session)
+        results["services"] = {
+            f"{name}@{concurrency}": run_service(engine, call, args.requests, concurrency)
+            for name, call in calls for concurrency in levels
+        }
+
+        scenarios = http_scenarios(args)
+        runs = itertools.count()
+
+        async def inprocess():
+            async with inprocess_client(engine) as client:
+                return await run_http(client, scenarios, levels, runs)
+        results["inprocess"] = asyncio.run(inprocess())
+        engine.dispose()
+
+        if not args.skip_uvicorn:
+            async def over_network(base_url):
+                limits = httpx.Limits(max_connections=args.concurrency)
+                async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+                    return await run_http(client, scenarios, levels, runs)
+
+            with uvicorn_server(db_file) as base_url:
+                results["uvicorn"] = asyncio.run(over_network(base_url))
+
+    report = write_report("api", args, results)
+    if args.baseline:
+        print(json.dumps({"baseline": compare(report["results"], json.loads(args.baseline.read_text()))},
+                         indent=2))
+
+
+if __name__ == "__main__":
+    main()
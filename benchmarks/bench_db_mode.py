@@ -0,0 +1,49 @@
+"""
+Porovnání sync a async (aiosqlite) databázové vrstvy pod souběžnou zátěží.
+
+Pro každý režim spustí uvicorn nad čerstvě naplněnou dočasnou DB a pošle
+`--requests` požadavků POST /bookings/ s `--concurrency` souběžnými klienty.
+Výsledek (p50/p99 latence, propustnost) vypíše jako JSON.
+
+    python -m benchmarks.bench_db_mode --requests 2000 --concurrency 32
+"""
+import argparse
+import asyncio
+import tempfile
+from pathlib import Path
+
+import httpx
+
+from benchmarks.common import seed_database, booking_payloads, fire, uvicorn_server, write_report
+
+
+async def run_mode(base_url: str, payloads, concurrency: int):
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        return await fire(client, [("POST", "/bookings/", payload) for payload in payloads], concurrency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--bookings", type=int, default=50_000)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--output", type=Path, help="kam uložit JSON výsledky")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("sync", "async"):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = Path(tmp) / "bench.db"
+            seed_database(db_file, args.rooms, args.users, args.bookings)
+            with uvicorn_server(db_file, env={"DATABASE_MODE": mode}) as base_url:
+                payloads = booking_payloads(args.requests, args.rooms, args.users)
+                results[mode] = asyncio.run(run_mode(base_url, payloads, args.concurrency))
+
+    write_report("db_mode", args, results)
+
+
+if __name__ == "__main__":
+    main()
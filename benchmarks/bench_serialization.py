@@ -0,0 +1,98 @@
+"""
+Serializace výpisů: ORM instance + Pydantic/jsonable_encoder vs. sloupcové n-tice + orjson.
+
+Nad dočasnou DB s `--bookings` rezervacemi (výchozí 1 milion) změří čas
+sestavení stránky GET /bookings/ (`--page-sizes`) na náhodných pozicích
+a NDJSON export celé tabulky oběma cestami. Výsledek vypíše jako JSON
+včetně zrychlení (speedup = původní / nová cesta).
+
+    python -m benchmarks.bench_serialization --bookings 1000000 --pages 200
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+from sqlmodel import Session, create_engine, select
+
+from app.models import Booking
+from app.queries import page_statement, encode_rows, stream_ndjson, STREAM_CHUNK_SIZE
+from benchmarks.common import seed_database, latency_summary, write_report
+
+
+def orm_page(session: Session, after: int, limit: int) -> bytes:
+    """Původní cesta: ORM instance, jsonable_encoder (Pydantic) a json.dumps."""
+    rows = session.exec(select(Booking).where(Booking.id > after).order_by(Booking.id).limit(limit)).all()
+    return json.dumps(jsonable_encoder(rows), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def lean_page(session: Session, after: int, limit: int) -> bytes:
+    """Nová cesta: sloupcové n-tice zakódované rovnou (orjson)."""
+    return encode_rows(session.execute(page_statement(Booking, after).limit(limit)).all())
+
+
+def orm_ndjson(engine):
+    with Session(engine) as session:
+        results = session.exec(select(Booking).order_by(Booking.id).execution_options(yield_per=STREAM_CHUNK_SIZE))
+        for chunk in results.partitions():
+            yield b"".join(json.dumps(row.model_dump(mode="json")).encode() + b"\n" for row in chunk)
+
+
+def measure_pages(engine, build, positions, limit: int):
+    latencies = []
+    with Session(engine) as session:
+        started = time.perf_counter()
+        for after in positions:
+            began = time.perf_counter()
+            build(session, after, limit)
+            latencies.append(time.perf_counter() - began)
+        elapsed = time.perf_counter() - started
+    return latency_summary(latencies, elapsed)
+
+
+def measure_export(stream):
+    started = time.perf_counter()
+    size = sum(len(chunk) for chunk in stream)
+    return {"seconds": round(time.perf_counter() - started, 3), "bytes": size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--bookings", type=int, default=1_000_000)
+    parser.add_argument("--pages", type=int, default=200, help="počet měřených stránek na velikost")
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--skip-export", action="store_true", help="neměřit NDJSON export celé tabulky")
+    parser.add_argument("--output", type=Path, help="kam uložit JSON výsledky")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = Path(tmp) / "bench.db"
+        seed_database(db_file, args.rooms, args.users, args.bookings)
+        engine = create_engine(f"sqlite:///{db_file}")
+        rnd = random.Random(42)
+
+        for limit in args.page_sizes:
+            positions = [rnd.randrange(max(args.bookings - limit, 1)) for _ in range(args.pages)]
+            orm = measure_pages(engine, orm_page, positions, limit)
+            lean = measure_pages(engine, lean_page, positions, limit)
+            results[f"page_{limit}"] = {"orm": orm, "lean": lean,
+                                        "speedup_p50": round(orm["p50_ms"] / lean["p50_ms"], 2)}
+
+        if not args.skip_export:
+            orm = measure_export(orm_ndjson(engine))
+            lean = measure_export(stream_ndjson(engine, page_statement(Booking)))
+            results["ndjson_export"] = {"orm": orm, "lean": lean,
+                                        "speedup": round(orm["seconds"] / lean["seconds"], 2)}
+        engine.dispose()
+
+    write_report("serialization", args, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Propustnost čtení při souběžných zápisech: výchozí SQLite vs. ladicí profil.
+
+Pro každý profil spustí uvicorn nad naplněnou dočasnou DB, na `--duration`
+sekund pustí `--writers` klientů vytvářejících rezervace a `--readers`
+klientů čtoucích GET /bookings/?room_id=… a vypíše JSON s propustností
+a latencemi čtení i zápisu.
+
+    python -m benchmarks.bench_sqlite_profile --duration 10 --readers 16 --writers 4
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+
+from benchmarks.common import seed_database, past_slots, latency_summary, uvicorn_server, write_report
+
+# Výchozí chování SQLite (rollback journal) – proti němu se měří ladicí profil
+PROFILES = {
+    "default": {
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_MMAP_SIZE": "0",
+        "SQLITE_CACHE_SIZE": "-2000",
+        "SQLITE_TEMP_STORE": "DEFAULT",
+    },
+    "tuned": {},
+}
+
+
+async def run_load(base_url: str, args):
+    deadline = time.monotonic() + args.duration
+    reads, writes = [], []
+    slots = iter(past_slots(200_000, first_day=datetime(2015, 1, 5, 8, 0)))
+
+    async def reader(client):
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            await client.get("/bookings/", params={"room_id": random.randint(1, args.rooms), "limit": 50})
+            reads.append(time.perf_counter() - started)
+
+    async def writer(client, room_id):
+        while time.monotonic() < deadline:
+            start = next(slots)
+            payload = {"room_id": room_id, "user_id": random.randint(1, args.users), "attendees": 2,
+                       "start_time": start.isoformat(), "end_time": (start + timedelta(hours=1)).isoformat()}
+            started = time.perf_counter()
+            await client.post("/bookings/", json=payload)
+            writes.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=args.readers + args.writers)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(reader(client) for _ in range(args.readers)),
+            *(writer(client, 1 + i % args.rooms) for i in range(args.writers)),
+        )
+        elapsed = time.perf_counter() - started
+    return {"reads": latency_summary(reads, elapsed), "writes": latency_summary(writes, elapsed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--bookings", type=int, default=100_000)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--output", type=Path, help="kam uložit JSON výsledky")
+    args = parser.parse_args()
+
+    results = {}
+    for name, env in PROFILES.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = Path(tmp) / "bench.db"
+            seed_database(db_file, args.rooms, args.users, args.bookings)
+            with uvicorn_server(db_file, env=env) as base_url:
+                results[name] = asyncio.run(run_load(base_url, args))
+
+    write_report("sqlite_profile", args, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+from sqlalchemy import insert
+from sqlmodel import SQLModel, Session, create_engine
+
+from app.models import Room, User, Booking
+
+# Společné pomůcky benchmarků: seed dat, spuštění uvicornu, percentily.
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+SEED_CHUNK_SIZE = 50_000
+
+
+def seed_database(db_file, rooms: int, users: int, bookings: int):
+    """Naplní SQLite soubor místnostmi, uživateli a minulými rezervacemi (po 1 h v pracovní dny)."""
+    engine = create_engine(f"sqlite:///{db_file}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.execute(insert(Room), [{"name": f"Room {i}", "capacity": 4 + i % 20} for i in range(rooms)])
+        session.execute(insert(User), [{"username": f"user{i}", "email": f"user{i}@bench.cz"} for i in range(users)])
+        rows, inserted = [], 0
+        for i, start in enumerate(past_slots(bookings // rooms + 1)):
+            for room_id in range(1, rooms + 1):
+                if inserted + len(rows) >= bookings:
+                    break
+                rows.append({"room_id": room_id, "user_id": 1 + (i * rooms + room_id) % users,
+                             "start_time": start, "end_time": start + timedelta(hours=1), "attendees": 2})
+            # po dávkách, ať seed milionů řádků nedrží vše v paměti
+            if len(rows) >= SEED_CHUNK_SIZE:
+                session.execute(insert(Booking), rows)
+                inserted += len(rows)
+                rows = []
+        if rows:
+            session.execute(insert(Booking), rows)
+        session.commit()
+    engine.dispose()
+
+
+def past_slots(count: int, first_day: datetime = datetime(2020, 1, 6, 8, 0)):
+    """Generuje `count` hodinových začátků v pracovní dny 8–18 h od `first_day` dál."""
+    slots = []
+    day = first_day
+    while len(slots) < count:
+        if day.weekday() < 5:
+            slots.extend(day + timedelta(hours=h) for h in range(10))
+        day += timedelta(days=1)
+    return slots[:count]
+
+
+def booking_payloads(count: int, rooms: int, users: int, first_day: datetime = datetime(2015, 1, 5, 8, 0)):
+    """Nekolidující minulé rezervace (nepočítají se do limitu uživatele)."""
+    payloads = []
+    for i, start in enumerate(past_slots(count // rooms + 1, first_day=first_day)):
+        for room_id in range(1, rooms + 1):
+            if len(payloads) >= count:
+                return payloads
+            payloads.append({
+                "room_id": room_id, "user_id": 1 + (i + room_id) % users, "attendees": 2,
+                "start_time": start.isoformat(),
+                "end_time": (start + timedelta(hours=1)).isoformat(),
+            })
+    return payloads
+
+
+async def fire(client: httpx.AsyncClient, requests, concurrency: int):
+    """
+    Pošle požadavky (method, url, json) přes `concurrency` souběžných klientů
+    a vrátí souhrn latencí a počty stavových kódů.
+    """
+    latencies, statuses = [], {}
+    queue = list(reversed(requests))
+
+    async def worker():
+        while queue:
+            method, url, payload = queue.pop()
+            started = time.perf_counter()
+            response = await client.request(method, url, json=payload)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {**latency_summary(latencies, elapsed), "statuses": statuses}
+
+
+def git_revision() -> str:
+    """Aktuální commit (pro porovnání výsledků mezi commity)."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_report(benchmark: str, args, results: dict):
+    """Vypíše (a s --output uloží) strojově čitelný JSON report."""
+    params = {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()}
+    report = {
+        "benchmark": benchmark,
+        "revision": git_revision(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "params": params,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    print(text)
+    return report
+
+
+def percentile(values, p: float):
+    """Percentil (nearest-rank) ze seznamu hodnot."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[k]
+
+
+def latency_summary(latencies, elapsed: float):
+    """Souhrn latencí (v ms) a propustnosti (req/s)."""
+    return {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def uvicorn_server(db_file, env: dict | None = None, workers: int = 1):
+    """Spustí aplikaci v lokálním uvicornu nad daným souborem DB a vrátí base URL."""
+    port = free_port()
+    process_env = {**os.environ, "SQLITE_FILE": str(db_file), **(env or {})}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=REPO_ROOT, env=process_env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(f"{base_url}/rooms/", params={"limit": 1}, timeout=1.0)
+                break
+            except httpx.TransportError:
+                if time.monotonic() > deadline or process.poll() is not None:
+                    raise RuntimeError("uvicorn did not start")
+                time.sleep(0.1)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
@@ -1,10 +1,20 @@
+import asyncio
+import json
 import pytest
+from fastapi.encoders import jsonable_encoder
 from fastapi.testclient import TestClient
-from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlalchemy import event
 from sqlalchemy.pool import StaticPool
 from app.main import app, get_session
-from app.models import Room, User
-from datetime import datetime
+from app.database import apply_sqlite_pragmas, read_sqlite_pragmas, begin_immediate
+from app.models import Room, User, Booking, BookingCreate, IdempotencyRecord
+from app.interval_index import booking_index
+from app.cache import reset_caches, idempotency_cache, table_versions
+from app.idempotency import idempotency_store, request_fingerprint, IdempotencyKeyTakenError, SESSION_INFO_KEY
+from app.events import event_bus, event_stream
+from app import stats, queries, ics
+from datetime import datetime, timedelta, timezone
 
 # Nastavení testovací in-memory databáze (aby se data neukládala do souboru)
 sqlite_url = "sqlite://" 
@@ -33,6 +43,7 @@ def session_fixture():
     create_db_and_tables()
     with Session(engine) as session:
         yield session
+    reset_caches()
     SQLModel.metadata.drop_all(engine)
 
 def test_create_room(session: Session):
@@ -389,4 +400,1292 @@ def test_list_bookings_with_data(session: Session):
     data = response.json()
     assert len(data) == 1
     assert data[0]["room_id"] == room.id
-    assert data[0]["user_id"] == user.id
\ No newline at end of file
+    assert data[0]["user_id"] == user.id
+
+# === In-memory index rezervací ===
+
+def test_create_booking_overlap_detected_by_loaded_index(session: Session):
+    """API test: po načtení indexu z DB se kolize odhalí bez SQL dotazu na rezervace."""
+    room = Room(name="Indexovaná", capacity=10)
+    user = User(username="indexer", email="i@i.cz")
+    session.add_all([room, user])
+    session.commit()
+    session.add(Booking(room_id=room.id, user_id=user.id, attendees=2,
+                        start_time=datetime(2025, 1, 1, 10, 0),
+                        end_time=datetime(2025, 1, 1, 11, 0)))
+    session.commit()
+    booking_index.load(session)
+
+    payload = {
+        "room_id": room.id,
+        "user_id": user.id,
+        "start_time": "2025-01-01T10:30:00",
+        "end_time": "2025-01-01T11:30:00",
+        "attendees": 2
+    }
+    response = client.post("/bookings/", json=payload)
+    assert response.status_code == 400
+    assert "Room is already booked" in response.json()["detail"]
+
+def test_create_booking_updates_loaded_index(session: Session):
+    """API test: úspěšná rezervace se po commitu zařadí do indexu."""
+    room = Room(name="Živá", capacity=10)
+    user = User(username="zivy", email="z@z.cz")
+    session.add_all([room, user])
+    session.commit()
+    booking_index.load(session)
+
+    payload = {
+        "room_id": room.id,
+        "user_id": user.id,
+        "start_time": "2025-01-01T10:00:00",
+        "end_time": "2025-01-01T11:00:00",
+        "attendees": 2
+    }
+    response = client.post("/bookings/", json=payload)
+    assert response.status_code == 200
+    assert booking_index.find_overlap(
+        room.id, datetime(2025, 1, 1, 10, 0), datetime(2025, 1, 1, 11, 0)
+    ) == response.json()["id"]
+
+def test_create_booking_with_utc_offset_is_stored_as_local_time(session: Session):
+    """API test: čas se zónou (…Z) se uloží jako lokální a kolize s ním se najde v indexu."""
+    room = Room(name="Zónová", capacity=10)
+    user = User(username="zonovy", email="zona@z.cz")
+    session.add_all([room, user])
+    session.commit()
+    booking_index.load(session)
+    start = datetime(2025, 1, 1, 10, 0, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+    response = client.post("/bookings/", json={"room_id": room.id, "user_id": user.id, "attendees": 2,
+                                               "start_time": "2025-01-01T10:00:00Z",
+                                               "end_time": "2025-01-01T11:00:00Z"})
+    again = client.post("/bookings/", json={"room_id": room.id, "user_id": user.id, "attendees": 2,
+                                            "start_time": start.isoformat(),
+                                            "end_time": (start + timedelta(hours=1)).isoformat()})
+
+    assert response.status_code == 200
+    assert response.json()["start_time"] == start.isoformat()
+    assert again.status_code == 400
+    assert "Room is already booked" in again.json()["detail"]
+
+# === Hromadný import rezervací ===
+
+def _bulk_item(room_id, user_id, start, end, attendees=2):
+    return {"room_id": room_id, "user_id": user_id, "start_time": start, "end_time": end, "attendees": attendees}
+
+def test_bulk_import_json_array(session: Session):
+    """API test: dávka platných rezervací se uloží celá a report obsahuje id."""
+    room = Room(name="Hromadná", capacity=10)
+    user = User(username="importer", email="imp@test.cz")
+    session.add_all([room, user])
+    session.commit()
+
+    items = [
+        _bulk_item(room.id, user.id, "2025-01-06T10:00:00", "2025-01-06T11:00:00"),
+        _bulk_item(room.id, user.id, "2025-01-06T11:00:00", "2025-01-06T12:00:00"),
+        _bulk_item(room.id, user.id, "2025-01-07T10:00:00", "2025-01-07T11:00:00"),
+    ]
+    response = client.post("/bookings/bulk", json=items)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["accepted"] == 3
+    assert data["rejected"] == 0
+    assert all(item["status"] == "accepted" and item["id"] for item in data["items"])
+    assert len(client.get("/bookings/").json()) == 3
+
+def test_bulk_import_ndjson_reports_rejections(session: Session):
+    """API test: NDJSON dávka – kolize v dávce, kolize s DB, víkend, neznámá místnost, nevalidní data."""
+    room = Room(name="Sdílená", capacity=10)
+    user = User(username="ndjson", email="nd@test.cz")
+    session.add_all([room, user])
+    session.commit()
+    session.add(Booking(room_id=room.id, user_id=user.id, attendees=2,
+                        start_time=datetime(2025, 1, 6, 8, 0), end_time=datetime(2025, 1, 6, 9, 0)))
+    session.commit()
+
+    items = [
+        _bulk_item(room.id, user.id, "2025-01-06T10:30:00", "2025-01-06T11:30:00"),  # kolize s položkou 1
+        _bulk_item(room.id, user.id, "2025-01-06T10:00:00", "2025-01-06T11:00:00"),  # dřívější začátek vyhrává
+        _bulk_item(room.id, user.id, "2025-01-06T08:30:00", "2025-01-06T09:30:00"),  # kolize s DB
+        _bulk_item(room.id, user.id, "2025-01-04T10:00:00", "2025-01-04T11:00:00"),  # sobota
+        _bulk_item(9999, user.id, "2025-01-07T10:00:00", "2025-01-07T11:00:00"),     # neznámá místnost
+        {"room_id": room.id, "user_id": user.id},                                     # chybí pole
+    ]
+    body = "\n".join(json.dumps(item) for item in items)
+    response = client.post("/bookings/bulk", content=body,
+                           headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    report = response.json()["items"]
+    assert [item["status"] for item in report] == [
+        "rejected", "accepted", "rejected", "rejected", "rejected", "rejected"
+    ]
+    assert "Room is already booked" in report[0]["detail"]
+    assert "Room is already booked" in report[2]["detail"]
+    assert "weekends" in report[3]["detail"]
+    assert "Room not found" in report[4]["detail"]
+    assert "Invalid booking data" in report[5]["detail"]
+    assert response.json()["accepted"] == 1
+
+def test_bulk_and_recurring_accept_utc_offsets(session: Session):
+    """API test: budoucí položky se zónou projdou limitem i kolizemi (porovnání s now()) bez chyby 500."""
+    room = Room(name="Zónová dávka", capacity=10)
+    user = User(username="zonova", email="zonova@test.cz")
+    other = User(username="zonova2", email="zonova2@test.cz")
+    session.add_all([room, user, other])
+    session.commit()
+
+    bulk = client.post("/bookings/bulk", json=[
+        _bulk_item(room.id, user.id, "2030-01-07T10:00:00+02:00", "2030-01-07T11:00:00+02:00"),
+        _bulk_item(room.id, user.id, "2030-01-07T10:30:00+02:00", "2030-01-07T11:30:00+02:00"),
+    ])
+    recurring = client.post("/bookings/recurring", json={
+        "room_id": room.id, "user_id": other.id, "attendees": 2, "frequency": "daily", "count": 2,
+        "start_time": "2030-01-08T08:00:00Z", "end_time": "2030-01-08T09:00:00Z"})
+
+    assert bulk.status_code == 200
+    assert [item["status"] for item in bulk.json()["items"]] == ["accepted", "rejected"]
+    assert recurring.status_code == 200
+    assert recurring.json()["accepted"] == 2
+
+def test_bulk_import_respects_user_limit(session: Session):
+    """API test: limit 2 budoucích rezervací platí i napříč dávkou."""
+    room = Room(name="Limitní", capacity=10)
+    user = User(username="hromadny", email="h@test.cz")
+    session.add_all([room, user])
+    session.commit()
+
+    items = [
+        _bulk_item(room.id, user.id, f"2099-06-0{day}T10:00:00", f"2099-06-0{day}T11:00:00")
+        for day in (1, 2, 3)
+    ]
+    response = client.post("/bookings/bulk", json=items)
+    statuses = [item["status"] for item in response.json()["items"]]
+    assert statuses == ["accepted", "accepted", "rejected"]
+    assert "too many bookings" in response.json()["items"][2]["detail"]
+
+def test_bulk_import_invalid_json(session: Session):
+    """API test: nečitelné tělo požadavku → 400."""
+    response = client.post("/bookings/bulk", content="{not json",
+                           headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
+
+# === Stránkování a streamování výpisů ===
+
+def test_list_rooms_keyset_pagination(session: Session):
+    """API test: stránky podle id navazují a odkaz na další stránku je v hlavičce Link."""
+    session.add_all([Room(name=f"R{i}", capacity=5) for i in range(5)])
+    session.commit()
+
+    first = client.get("/rooms/", params={"limit": 2})
+    assert [r["name"] for r in first.json()] == ["R0", "R1"]
+    assert 'rel="next"' in first.headers["link"]
+
+    after = first.json()[-1]["id"]
+    second = client.get("/rooms/", params={"limit": 2, "after": after})
+    assert [r["name"] for r in second.json()] == ["R2", "R3"]
+
+    last = client.get("/rooms/", params={"limit": 2, "after": second.json()[-1]["id"]})
+    assert [r["name"] for r in last.json()] == ["R4"]
+    assert "link" not in last.headers
+
+def test_list_rooms_limit_out_of_range(session: Session):
+    """API test: limit mimo povolený rozsah → 422."""
+    assert client.get("/rooms/", params={"limit": 0}).status_code == 422
+    assert client.get("/rooms/", params={"limit": 100000}).status_code == 422
+
+def test_list_users_ndjson_stream(session: Session):
+    """API test: ?format=ndjson vrátí jeden JSON objekt na řádek."""
+    session.add_all([User(username=f"u{i}", email=f"u{i}@test.cz") for i in range(3)])
+    session.commit()
+
+    response = client.get("/users/", params={"format": "ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["username"] for row in rows] == ["u0", "u1", "u2"]
+
+# === Filtrované výpisy rezervací ===
+
+def _seed_calendar(session):
+    room1 = Room(name="Kalendář 1", capacity=10)
+    room2 = Room(name="Kalendář 2", capacity=10)
+    alice = User(username="alice", email="alice@test.cz")
+    bob = User(username="bob", email="bob@test.cz")
+    session.add_all([room1, room2, alice, bob])
+    session.commit()
+    session.add_all([
+        Booking(room_id=room1.id, user_id=alice.id, attendees=2,
+                start_time=datetime(2025, 1, 6, 9, 0), end_time=datetime(2025, 1, 6, 10, 0)),
+        Booking(room_id=room1.id, user_id=bob.id, attendees=2,
+                start_time=datetime(2025, 1, 7, 9, 0), end_time=datetime(2025, 1, 7, 10, 0)),
+        Booking(room_id=room2.id, user_id=alice.id, attendees=2,
+                start_time=datetime(2025, 1, 8, 9, 0), end_time=datetime(2025, 1, 8, 10, 0)),
+    ])
+    session.commit()
+    return room1, room2, alice, bob
+
+def test_list_bookings_filtered_by_room_and_window(session: Session):
+    """API test: filtr místnosti a časového okna (from/to) vrátí jen překrývající se rezervace."""
+    room1, _, _, bob = _seed_calendar(session)
+
+    response = client.get("/bookings/", params={
+        "room_id": room1.id, "from": "2025-01-07T00:00:00", "to": "2025-01-08T00:00:00"
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 1
+    assert data[0]["user_id"] == bob.id
+
+def test_list_bookings_filtered_by_user(session: Session):
+    """API test: filtr uživatele."""
+    _, _, alice, _ = _seed_calendar(session)
+
+    data = client.get("/bookings/", params={"user_id": alice.id}).json()
+    assert len(data) == 2
+    assert all(b["user_id"] == alice.id for b in data)
+
+def test_list_bookings_window_with_utc_offset(session: Session):
+    """API test: okno se zónou se převede na lokální čas – překryv s rezervací se najde."""
+    room = Room(name="Zónový výpis", capacity=4)
+    user = User(username="zonovy_vypis", email="zv@test.cz")
+    session.add_all([room, user])
+    session.commit()
+    session.add(Booking(room_id=room.id, user_id=user.id, attendees=2,
+                        start_time=datetime(2025, 1, 6, 10, 0), end_time=datetime(2025, 1, 6, 11, 0)))
+    session.commit()
+    offset = timezone(timedelta(hours=5))
+    window = {"from": datetime(2025, 1, 6, 9, 30).astimezone(offset).isoformat(),
+              "to": datetime(2025, 1, 6, 10, 30).astimezone(offset).isoformat()}
+
+    for path in ("/bookings/", f"/rooms/{room.id}/bookings", f"/users/{user.id}/bookings"):
+        assert len(client.get(path, params=window).json()) == 1
+    assert client.get("/bookings/", params={
+        "from": datetime(2025, 1, 6, 11, 0).astimezone(offset).isoformat()}).json() == []
+
+def test_list_room_bookings(session: Session):
+    """API test: /rooms/{id}/bookings vrací rezervace dané místnosti, neznámá místnost → 404."""
+    _, room2, _, _ = _seed_calendar(session)
+
+    data = client.get(f"/rooms/{room2.id}/bookings").json()
+    assert [b["room_id"] for b in data] == [room2.id]
+    assert client.get("/rooms/9999/bookings").status_code == 404
+
+def test_list_user_bookings_with_window(session: Session):
+    """API test: /users/{id}/bookings s oknem from, neznámý uživatel → 404."""
+    _, _, alice, _ = _seed_calendar(session)
+
+    data = client.get(f"/users/{alice.id}/bookings", params={"from": "2025-01-07T00:00:00"}).json()
+    assert len(data) == 1
+    assert data[0]["start_time"] == "2025-01-08T09:00:00"
+    assert client.get("/users/9999/bookings").status_code == 404
+
+# === Volné termíny ===
+
+def test_availability_returns_free_slots(session: Session):
+    """API test: volné termíny po místnostech, bez malých místností a s vynechanou kolizí."""
+    small = Room(name="Malá", capacity=2)
+    big = Room(name="Velká", capacity=10)
+    user = User(username="hledac", email="hl@test.cz")
+    session.add_all([small, big, user])
+    session.commit()
+    session.add(Booking(room_id=big.id, user_id=user.id, attendees=5,
+                        start_time=datetime(2025, 1, 6, 10, 0), end_time=datetime(2025, 1, 6, 11, 0)))
+    session.commit()
+
+    response = client.get("/availability", params={
+        "from": "2025-01-06T09:00:00", "to": "2025-01-06T12:00:00",
+        "min_capacity": 5, "duration": 60
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert [room["room_id"] for room in data] == [big.id]
+    assert data[0]["slots"] == [
+        {"start_time": "2025-01-06T09:00:00", "end_time": "2025-01-06T10:00:00"},
+        {"start_time": "2025-01-06T11:00:00", "end_time": "2025-01-06T12:00:00"},
+    ]
+
+def test_availability_accepts_utc_offsets(session: Session):
+    """API test: okno zadané v UTC (+00:00) se převede na lokální čas, ve kterém jsou uložené rezervace."""
+    room = Room(name="Zónová volná", capacity=5)
+    user = User(username="zonhledac", email="zh@test.cz")
+    session.add_all([room, user])
+    session.commit()
+    session.add(Booking(room_id=room.id, user_id=user.id, attendees=2,
+                        start_time=datetime(2025, 1, 6, 10, 0), end_time=datetime(2025, 1, 6, 11, 0)))
+    session.commit()
+
+    response = client.get("/availability", params={
+        "from": datetime(2025, 1, 6, 9, 0).astimezone(timezone.utc).isoformat(),
+        "to": datetime(2025, 1, 6, 12, 0).astimezone(timezone.utc).isoformat(),
+    })
+
+    assert response.status_code == 200
+    assert response.json()[0]["slots"] == [
+        {"start_time": "2025-01-06T09:00:00", "end_time": "2025-01-06T10:00:00"},
+        {"start_time": "2025-01-06T11:00:00", "end_time": "2025-01-06T12:00:00"},
+    ]
+
+def test_availability_weekend_has_no_slots(session: Session):
+    """API test: o víkendu nejsou žádné volné termíny."""
+    session.add(Room(name="Víkendová", capacity=5))
+    session.commit()
+
+    response = client.get("/availability", params={"from": "2025-01-04T08:00:00", "to": "2025-01-05T18:00:00"})
+    assert response.status_code == 200
+    assert response.json() == []
+
+def test_availability_invalid_window(session: Session):
+    """API test: konec okna před začátkem → 400."""
+    response = client.get("/availability", params={"from": "2025-01-06T12:00:00", "to": "2025-01-06T08:00:00"})
+    assert response.status_code == 400
+    assert "End time must be after start time" in response.json()["detail"]
+
+# === Diagnostika SQLite ===
+
+def test_sqlite_diagnostics(session: Session):
+    """API test: diagnostika vrací nakonfigurovaný i aktivní profil."""
+    response = client.get("/diagnostics/sqlite")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["configured"]["journal_mode"] == "WAL"
+    assert set(data["active"]) == set(data["configured"])
+
+def test_sqlite_pragmas_applied_on_connect(tmp_path):
+    """Profil se nastaví na každém novém spojení (WAL, busy_timeout, synchronous=NORMAL)."""
+    file_engine = create_engine(f"sqlite:///{tmp_path / 'tuned.db'}")
+    event.listen(file_engine, "connect", apply_sqlite_pragmas)
+    with file_engine.connect() as conn:
+        active = read_sqlite_pragmas(conn)
+    file_engine.dispose()
+
+    assert active["journal_mode"] == "wal"
+    assert active["busy_timeout"] == 5000
+    assert active["synchronous"] == 1  # NORMAL
+
+# === Cache místností a uživatelů ===
+
+def test_create_booking_uses_entity_cache(session: Session):
+    """API test: opakovaná rezervace čte místnost a uživatele z cache, diagnostika hlásí zásahy."""
+    room = Room(name="Kešovaná", capacity=10)
+    user = User(username="kes", email="kes@test.cz")
+    session.add_all([room, user])
+    session.commit()
+
+    for hour in (10, 11):
+        payload = {"room_id": room.id, "user_id": user.id, "attendees": 2,
+                   "start_time": f"2025-01-06T{hour}:00:00", "end_time": f"2025-01-06T{hour}:30:00"}
+        assert client.post("/bookings/", json=payload).status_code == 200
+
+    stats = client.get("/diagnostics/cache").json()
+    assert stats["rooms"]["hits"] == 1
+    assert stats["users"]["hits"] == 1
+
+def test_create_room_invalidates_cached_not_found(session: Session):
+    """API test: místnost kešovaná jako neexistující je po create_room k dispozici."""
+    user = User(username="cekatel", email="cek@test.cz")
+    session.add(user)
+    session.commit()
+    payload = {"room_id": 1, "user_id": user.id, "attendees": 2,
+               "start_time": "2025-01-06T10:00:00", "end_time": "2025-01-06T11:00:00"}
+    assert client.post("/bookings/", json=payload).status_code == 404
+
+    room_id = client.post("/rooms/", json={"name": "Nová", "capacity": 5}).json()["id"]
+    assert room_id == 1
+    assert client.post("/bookings/", json=payload).status_code == 200
+
+# === HTTP cache výpisů (ETag / 304) ===
+
+def test_list_rooms_etag_not_modified(session: Session):
+    """API test: shodný If-None-Match → 304 bez těla."""
+    client.post("/rooms/", json={"name": "Etag", "capacity": 5})
+
+    first = client.get("/rooms/")
+    etag = first.headers["etag"]
+    second = client.get("/rooms/", headers={"If-None-Match": etag})
+
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["etag"] == etag
+
+def test_list_rooms_etag_changes_after_create(session: Session):
+    """API test: create_room zvýší verzi tabulky → nový ETag a nová data."""
+    client.post("/rooms/", json={"name": "První", "capacity": 5})
+    etag = client.get("/rooms/").headers["etag"]
+
+    client.post("/rooms/", json={"name": "Druhá", "capacity": 5})
+    response = client.get("/rooms/", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert len(response.json()) == 2
+
+def test_list_bookings_etag_depends_on_query(session: Session):
+    """API test: různé filtry = různé ETagy; create_booking zneplatní výpis rezervací."""
+    room = Room(name="Verze", capacity=5)
+    user = User(username="verze", email="verze@test.cz")
+    session.add_all([room, user])
+    session.commit()
+
+    all_etag = client.get("/bookings/").headers["etag"]
+    room_etag = client.get(f"/rooms/{room.id}/bookings").headers["etag"]
+    assert all_etag != room_etag
+
+    payload = {"room_id": room.id, "user_id": user.id, "attendees": 2,
+               "start_time": "2025-01-06T10:00:00", "end_time": "2025-01-06T11:00:00"}
+    client.post("/bookings/", json=payload)
+
+    response = client.get("/bookings/", headers={"If-None-Match": all_etag})
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+
+# === Opakované rezervace ===
+
+def test_recurring_weekly_booking_with_collision(session: Session):
+    """API test: týdenní řada – kolidující výskyt se odmítne, ostatní se uloží v jedné transakci."""
+    room = Room(name="Týdenní", capacity=10)
+    user = User(username="porada", email="porada@test.cz")
+    other = User(username="jiny", email="jiny@test.cz")
+    session.add_all([room, user, other])
+    session.commit()
+    session.add(Booking(room_id=room.id, user_id=other.id, attendees=2,
+                        start_time=datetime(2024, 1, 16, 10, 30), end_time=datetime(2024, 1, 16, 11, 30)))
+    session.commit()
+
+    payload = {"room_id": room.id, "user_id": user.id, "attendees": 4, "frequency": "weekly", "count": 4,
+               "start_time": "2024-01-09T10:00:00", "end_time": "2024-01-09T11:00:00"}
+    response = client.post("/bookings/recurring", json=payload)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["accepted"] == 3
+    assert [item["status"] for item in data["items"]] == ["accepted", "rejected", "accepted", "accepted"]
+    assert "Room is already booked" in data["items"][1]["detail"]
+    assert len(client.get(f"/rooms/{room.id}/bookings").json()) == 4
+
+def test_recurring_booking_counts_toward_user_limit(session: Session):
+    """API test: budoucí výskyty se počítají do limitu 2 budoucích rezervací."""
+    room = Room(name="Budoucí", capacity=10)
+    user = User(username="planovac", email="plan@test.cz")
+    session.add_all([room, user])
+    session.commit()
+
+    payload = {"room_id": room.id, "user_id": user.id, "attendees": 2, "frequency": "daily", "count": 5,
+               "start_time": "2099-06-01T10:00:00", "end_time": "2099-06-01T11:00:00"}
+    data = client.post("/bookings/recurring", json=payload).json()
+
+    # 2099-06-01 je pondělí – 5 pracovních dnů, přijaty jen první 2
+    assert data["skipped_weekends"] == 0
+    assert data["accepted"] == 2
+    assert all("too many bookings" in item["detail"] for item in data["items"][2:])
+
+def test_recurring_booking_capacity_and_unknown_room(session: Session):
+    """API test: kapacita se ověří pro všechny výskyty, neznámá místnost → 404."""
+    room = Room(name="Malá řada", capacity=2)
+    user = User(username="velky", email="velky@test.cz")
+    session.add_all([room, user])
+    session.commit()
+
+    payload = {"room_id": room.id, "user_id": user.id, "attendees": 5, "frequency": "weekly", "count": 2,
+               "start_time": "2024-01-09T10:00:00", "end_time": "2024-01-09T11:00:00"}
+    data = client.post("/bookings/recurring", json=payload).json()
+    assert data["accepted"] == 0
+    assert all("Capacity exceeded" in item["detail"] for item in data["items"])
+
+    response = client.post("/bookings/recurring", json={**payload, "room_id": 9999})
+    assert response.status_code == 404
+
+# === Statistiky obsazenosti ===
+
+def _seed_usage(session: Session):
+    room = Room(name="Statistická", capacity=10)
+    user = User(username="stat", email="stat@test.cz")
+    session.add_all([room, user])
+    session.commit()
+    return room, user
+
+def test_utilization_by_hour_with_peak_hours(session: Session):
+    """API test: rezervace 9:30–11:00 → 30 min v 9:00 a 60 min v 10:00, špička je 10:00."""
+    room, user = _seed_usage(session)
+    client.post("/bookings/", json={"room_id": room.id, "user_id": user.id, "attendees": 2,
+                                    "start_time": "2024-01-08T09:30:00", "end_time": "2024-01-08T11:00:00"})
+
+    response = client.get("/stats/utilization", params={"from": "2024-01-08T08:00:00",
+                                                         "to": "2024-01-08T12:00:00", "bucket": "hour"})
+
+    assert response.status_code == 200
+    data = response.json()
+    buckets = data["rooms"][0]["buckets"]
+    assert [(b["start"], b["booked_minutes"], b["occupancy"]) for b in buckets] == [
+        ("2024-01-08T09:00:00", 30, 0.5), ("2024-01-08T10:00:00", 60, 1.0)]
+    assert data["peak_hours"][0] == {"hour": 10, "booked_minutes": 60}
+
+@pytest.mark.parametrize("bucket", ["hour", "day", "week"])
+def test_utilization_sql_sums_match_split_interval(session: Session, bucket):
+    """Součty z SQL (usage_statement) odpovídají rozřezání rezervací v Pythonu (split_interval)."""
+    room, user = _seed_usage(session)
+    other = Room(name="Druhá", capacity=4)
+    session.add(other)
+    session.commit()
+    intervals = [
+        (room.id, datetime(2024, 1, 5, 22, 15), datetime(2024, 1, 8, 1, 45)),   # přes víkend a týden
+        (room.id, datetime(2024, 1, 8, 9, 30, 30), datetime(2024, 1, 8, 11, 0)),
+        (other.id, datetime(2024, 1, 7, 23, 0), datetime(2024, 1, 8, 0, 30)),    # neděle → pondělí
+        (other.id, datetime(2024, 1, 9, 10, 0), datetime(2024, 1, 9, 10, 20)),
+        (other.id, datetime(2024, 1, 20, 10, 0), datetime(2024, 1, 20, 11, 0)),  # mimo okno
+    ]
+    session.add_all([Booking(room_id=room_id, user_id=user.id, attendees=1, start_time=start, end_time=end)
+                     for room_id, start, end in intervals])
+    session.commit()
+    start, end = datetime(2024, 1, 6, 12, 0), datetime(2024, 1, 12, 0, 0)
+
+    expected = {}
+    for room_id, booked_start, booked_end in intervals:
+        for slot, seconds in stats.split_interval(max(booked_start, start), min(booked_end, end), bucket):
+            expected[(room_id, slot)] = expected.get((room_id, slot), 0) + seconds
+    rows = session.exec(stats.usage_statement([room.id, other.id], start, end, bucket)).all()
+
+    assert {(room_id, slot): seconds for room_id, slot, seconds in rows} == pytest.approx(expected)
+
+def test_utilization_rollups_match_raw(session: Session, monkeypatch):
+    """API test: se zapnutými denními souhrny vyjde týdenní obsazenost stejně jako z rezervací."""
+    monkeypatch.setattr(stats, "ROLLUPS_ENABLED", True)
+    room, user = _seed_usage(session)
+    for day in (8, 9, 10):
+        client.post("/bookings/", json={"room_id": room.id, "user_id": user.id, "attendees": 2,
+                                        "start_time": f"2024-01-{day:02d}T10:00:00",
+                                        "end_time": f"2024-01-{day:02d}T12:00:00"})
+    params = {"from": "2024-01-08T11:00:00", "to": "2024-01-15T00:00:00", "bucket": "week"}
+
+    with_rollups = client.get("/stats/utilization", params=params).json()
+    raw = stats.utilization(session, datetime(2024, 1, 8, 11), datetime(2024, 1, 15), "week")
+
+    assert with_rollups["rooms"][0]["buckets"][0]["booked_minutes"] == 60 + 120 + 120
+    assert with_rollups["rooms"] == jsonable_encoder(raw["rooms"])
+
+def test_utilization_rebuild_rollups(session: Session, monkeypatch):
+    """Souhrny přepočítané z tabulky booking odpovídají průběžně udržovaným."""
+    monkeypatch.setattr(stats, "ROLLUPS_ENABLED", True)
+    room, user = _seed_usage(session)
+    session.add(Booking(room_id=room.id, user_id=user.id, attendees=2,
+                        start_time=datetime(2024, 1, 8, 23, 0), end_time=datetime(2024, 1, 9, 1, 0)))
+    session.commit()
+
+    stats.ensure_rollups(session)
+
+    rows = session.exec(stats.rollup_statement(datetime(2024, 1, 1).date(), datetime(2024, 2, 1).date())).all()
+    assert sorted((day.day, seconds) for _, day, seconds in rows) == [(8, 3600), (9, 3600)]
+
+def test_utilization_accepts_utc_offsets(session: Session):
+    """API test: okno se zónou se převede na lokální čas, buckety vychází stejně jako bez zóny."""
+    room, user = _seed_usage(session)
+    client.post("/bookings/", json={"room_id": room.id, "user_id": user.id, "attendees": 2,
+                                    "start_time": "2024-01-08T09:30:00", "end_time": "2024-01-08T11:00:00"})
+
+    response = client.get("/stats/utilization", params={
+        "from": datetime(2024, 1, 8, 8, 0).astimezone(timezone.utc).isoformat(),
+        "to": datetime(2024, 1, 8, 12, 0).astimezone(timezone.utc).isoformat(), "bucket": "hour"})
+
+    assert response.status_code == 200
+    assert response.json()["from"] == "2024-01-08T08:00:00"
+    assert [b["booked_minutes"] for b in response.json()["rooms"][0]["buckets"]] == [30, 60]
+
+def test_utilization_includes_archived_bookings(session: Session, monkeypatch):
+    """Archivace obsazenost nezmění: raw výpočet i přepočtené souhrny čtou i booking_archive."""
+    monkeypatch.setattr(stats, "ROLLUPS_ENABLED", True)
+    room, user = _seed_usage(session)
+    for day in (8, 9):
+        client.post("/bookings/", json={"room_id": room.id, "user_id": user.id, "attendees": 2,
+                                        "start_time": f"2024-01-{day:02d}T10:00:00",
+                                        "end_time": f"2024-01-{day:02d}T11:00:00"})
+    window = (datetime(2024, 1, 8), datetime(2024, 1, 15))
+    before = stats.utilization(session, *window, "day")
+    rollups_before = session.exec(stats.rollup_statement(window[0].date(), window[1].date())).all()
+
+    client.post("/bookings/archive", params={"before": "2024-01-09T00:00:00"})
+    stats.rebuild_rollups(session)
+
+    assert stats.utilization(session, *window, "day") == before
+    assert stats.utilization(session, *window, "day", use_rollups=True)["rooms"] == before["rooms"]
+    assert session.exec(stats.rollup_statement(window[0].date(), window[1].date())).all() == rollups_before
+
+def test_utilization_invalid_window(session: Session):
+    response = client.get("/stats/utilization", params={"from": "2024-01-08T12:00:00", "to": "2024-01-08T08:00:00"})
+    assert response.status_code == 400
+    response = client.get("/stats/utilization", params={"from": "2020-01-01T00:00:00", "to": "2024-01-01T00:00:00",
+                                                        "bucket": "hour"})
+    assert response.status_code == 400
+    assert "Too many buckets" in response.json()["detail"]
+
+# === Metriky ===
+
+def test_metrics_expose_stages_sql_and_rejections(session: Session):
+    """API test: po rezervaci jsou v /metrics kroky, SQL dotazy i odmítnutí podle pravidla."""
+    room = Room(name="Měřená", capacity=2)
+    user = User(username="metrik", email="metrik@test.cz")
+    session.add_all([room, user])
+    session.commit()
+    payload = {"room_id": room.id, "user_id": user.id, "attendees": 2,
+               "start_time": "2024-01-08T10:00:00", "end_time": "2024-01-08T11:00:00"}
+    client.post("/bookings/", json=payload)
+    client.post("/bookings/", json={**payload, "attendees": 5})
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'booking_stage_duration_seconds_count{stage="availability"}' in text
+    assert 'booking_stage_duration_seconds_count{stage="commit"}' in text
+    assert 'booking_rejections_total{rule="capacity"}' in text
+    assert 'sql_statement_duration_seconds_bucket{operation="INSERT",le="+Inf"}' in text
+    assert 'http_request_duration_seconds_count{method="POST",route="/bookings/",status="400"}' in text
+    assert 'http_request_sql_statements_count{method="POST",route="/bookings/"}' in text
+
+# === Pořadí pravidel (levné kontroly bez DB) ===
+
+def _count_sql(statements: list):
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    return count
+
+@pytest.mark.parametrize("changes", [
+    {"attendees": 0},
+    {"start_time": "2024-01-08T11:00:00", "end_time": "2024-01-08T10:00:00"},
+    {"start_time": "2024-01-13T10:00:00", "end_time": "2024-01-13T11:00:00"},
+])
+def test_cheap_rejection_runs_no_sql(session: Session, changes):
+    """API test: nevalidní počet/čas/víkend se odmítne bez jediného SQL dotazu (i pro neznámou místnost)."""
+    payload = {"room_id": 999, "user_id": 999, "attendees": 2,
+               "start_time": "2024-01-08T10:00:00", "end_time": "2024-01-08T11:00:00", **changes}
+    statements = []
+    listener = _count_sql(statements)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        response = client.post("/bookings/", json=payload)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert response.status_code == 400
+    assert statements == []
+
+def test_cached_capacity_rejection_runs_no_sql(session: Session):
+    """API test: s místností v cache se překročená kapacita odmítne bez dotazu do DB."""
+    room = Room(name="Malá cache", capacity=2)
+    user = User(username="kapacita", email="kapacita@test.cz")
+    session.add_all([room, user])
+    session.commit()
+    payload = {"room_id": room.id, "user_id": user.id, "attendees": 5,
+               "start_time": "2024-01-08T10:00:00", "end_time": "2024-01-08T11:00:00"}
+    client.post("/bookings/", json=payload)  # naplní cache místnosti
+
+    statements = []
+    listener = _count_sql(statements)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        response = client.post("/bookings/", json=payload)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert response.status_code == 400
+    assert "Capacity exceeded" in response.json()["detail"]
+    assert statements == []
+
+def test_rules_diagnostics_report_rejection_rates(session: Session):
+    client.post("/bookings/", json={"room_id": 1, "user_id": 1, "attendees": 0,
+                                    "start_time": "2024-01-08T10:00:00", "end_time": "2024-01-08T11:00:00"})
+
+    rules = {rule["rule"]: rule for rule in client.get("/diagnostics/rules").json()}
+
+    assert rules["attendees"]["cost"] == "pure"
+    assert rules["attendees"]["rejected"] >= 1
+    assert rules["availability"]["cost"] == "db"
+
+# === Lehká serializace výpisů ===
+
+def _seed_bookings_for_listing(session: Session):
+    room = Room(name="Výpis", capacity=10)
+    user = User(username="vypis", email="vypis@test.cz")
+    session.add_all([room, user])
+    session.commit()
+    session.add_all([Booking(room_id=room.id, user_id=user.id, attendees=2,
+                             start_time=datetime(2024, 1, 8, 8 + i, 0, 30, 250),
+                             end_time=datetime(2024, 1, 8, 9 + i, 0)) for i in range(3)])
+    session.commit()
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_list_bookings_lean_json_matches_model_serialization(session: Session, monkeypatch, use_orjson):
+    """API test: sloupcové řádky zakódované orjson/json = stejný JSON jako serializace přes model."""
+    if not use_orjson:
+        monkeypatch.setattr(queries, "orjson", None)
+    _seed_bookings_for_listing(session)
+    expected = jsonable_encoder(session.exec(select(Booking).order_by(Booking.id)).all())
+
+    assert client.get("/bookings/").json() == expected
+    lines = client.get("/bookings/", params={"format": "ndjson"}).text.splitlines()
+    assert [json.loads(line) for line in lines] == expected
+
+def test_list_endpoints_keep_openapi_schema(session: Session):
+    """Vrácená Response obchází serializaci, schéma v OpenAPI ale zůstává."""
+    paths = client.get("/openapi.json").json()["paths"]
+
+    schema = paths["/bookings/"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+    assert schema["type"] == "array"
+    assert schema["items"]["$ref"].endswith("/Booking")
+    assert paths["/rooms/"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]["items"][
+        "$ref"].endswith("/Room")
+
+# === Archivace minulých rezervací ===
+
+def _seed_archivable(session: Session):
+    room = Room(name="Archiv", capacity=10)
+    user = User(username="archivar", email="archiv@test.cz")
+    session.add_all([room, user])
+    session.commit()
+    session.add_all([Booking(room_id=room.id, user_id=user.id, attendees=2,
+                             start_time=datetime(2020, 1, 6 + i, 10, 0), end_time=datetime(2020, 1, 6 + i, 11, 0))
+                     for i in range(3)])
+    session.add(Booking(room_id=room.id, user_id=user.id, attendees=2,
+                        start_time=datetime(2024, 1, 8, 10, 0), end_time=datetime(2024, 1, 8, 11, 0)))
+    session.commit()
+    return room, user
+
+def test_archive_moves_old_bookings_in_batches(session: Session):
+    """API test: rezervace skončené před hranicí se přesunou po dávkách a z výpisu zmizí."""
+    room, _ = _seed_archivable(session)
+    booking_index.load(session)
+
+    response = client.post("/bookings/archive", params={"before": "2021-01-01T00:00:00", "batch_size": 2})
+
+    assert response.status_code == 200
+    assert response.json()["archived"] == 3
+    assert response.json()["batches"] == 2
+    assert [b["start_time"] for b in client.get("/bookings/").json()] == ["2024-01-08T10:00:00"]
+    assert booking_index.find_overlap(room.id, datetime(2020, 1, 6, 10), datetime(2020, 1, 6, 11)) is None
+
+def test_list_bookings_include_archive(session: Session):
+    """API test: include_archive=true vrátí i archivované rezervace, seřazené podle id a stránkované."""
+    room, _ = _seed_archivable(session)
+    client.post("/bookings/archive", params={"before": "2021-01-01T00:00:00"})
+
+    everything = client.get("/bookings/", params={"include_archive": True, "room_id": room.id}).json()
+    first_page = client.get("/bookings/", params={"include_archive": True, "limit": 2})
+
+    assert [b["id"] for b in everything] == [1, 2, 3, 4]
+    assert [b["id"] for b in first_page.json()] == [1, 2]
+    assert "after=2" in first_page.headers["link"]
+
+def test_archive_does_not_reuse_booking_ids(session: Session):
+    """API test: po archivaci nejvyšší rezervace dostane nová jiné id, takže jde archivovat znovu."""
+    room, user = _seed_archivable(session)
+    client.post("/bookings/archive", params={"before": "2025-01-01T00:00:00"})
+    session.add(Booking(room_id=room.id, user_id=user.id, attendees=2,
+                        start_time=datetime(2024, 2, 5, 10, 0), end_time=datetime(2024, 2, 5, 11, 0)))
+    session.commit()
+
+    response = client.post("/bookings/archive", params={"before": "2025-01-01T00:00:00"})
+
+    assert response.status_code == 200
+    assert response.json()["archived"] == 1
+    ids = [b["id"] for b in client.get("/bookings/", params={"include_archive": True}).json()]
+    assert ids == [1, 2, 3, 4, 5]
+
+def test_archive_rejects_future_horizon(session: Session):
+    response = client.post("/bookings/archive", params={"before": "2999-01-01T00:00:00"})
+    assert response.status_code == 400
+
+def test_archive_accepts_utc_offset(session: Session):
+    """API test: hranice se zónou se porovná s lokálními časy rezervací (ne 500)."""
+    _seed_archivable(session)
+
+    response = client.post("/bookings/archive", params={"before": "2021-01-01T00:00:00+00:00"})
+    future = client.post("/bookings/archive", params={"before": "2999-01-01T00:00:00Z"})
+
+    assert response.status_code == 200
+    assert response.json()["archived"] == 3
+    assert response.json()["before"] == datetime(2021, 1, 1, tzinfo=timezone.utc).astimezone().replace(
+        tzinfo=None).isoformat()
+    assert future.status_code == 400
+
+# === ICS kalendáře ===
+
+def _seed_ics(session: Session):
+    room = Room(name="Kalendář, velká", capacity=10)
+    user = User(username="kalendar", email="kalendar@test.cz")
+    session.add_all([room, user])
+    session.commit()
+    session.add_all([
+        Booking(room_id=room.id, user_id=user.id, attendees=3,
+                start_time=datetime(2099, 1, 5, 10, 0), end_time=datetime(2099, 1, 5, 11, 0)),
+        Booking(room_id=room.id, user_id=user.id, attendees=2,
+                start_time=datetime(2099, 1, 6, 9, 0), end_time=datetime(2099, 1, 6, 9, 30)),
+        Booking(room_id=room.id, user_id=user.id, attendees=2,  # mimo okno (stará)
+                start_time=datetime(2020, 1, 6, 9, 0), end_time=datetime(2020, 1, 6, 10, 0)),
+    ])
+    session.commit()
+    return room, user
+
+def test_room_calendar_feed(session: Session):
+    """API test: ICS feed místnosti obsahuje VEVENT pro každou aktuální rezervaci."""
+    room, _ = _seed_ics(session)
+
+    response = client.get(f"/rooms/{room.id}/calendar.ics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/calendar")
+    body = response.text
+    assert body.startswith("BEGIN:VCALENDAR\r\n") and body.endswith("END:VCALENDAR\r\n")
+    assert body.count("BEGIN:VEVENT") == 2
+    assert "DTSTART:20990105T100000\r\n" in body
+    assert "SUMMARY:Kalendář\\, velká\r\n" in body
+    assert "UID:booking-1@" in body
+
+def test_calendar_feed_not_modified(session: Session, monkeypatch):
+    """API test: stejný ETag nebo If-Modified-Since → 304; nová rezervace ETag změní."""
+    room, user = _seed_ics(session)
+    etag = client.get(f"/users/{user.id}/calendar.ics").headers["etag"]
+    # poslední změna je starší než sekunda – Last-Modified se posílá (čerstvou změnu pokrývá test_cache)
+    changed = datetime.now(timezone.utc) - timedelta(seconds=5)
+    monkeypatch.setattr(table_versions, "last_modified", lambda table: changed)
+    last_modified = client.get(f"/users/{user.id}/calendar.ics").headers["last-modified"]
+
+    assert client.get(f"/users/{user.id}/calendar.ics", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/users/{user.id}/calendar.ics",
+                      headers={"If-Modified-Since": last_modified}).status_code == 304
+    changed += timedelta(seconds=1)
+    assert client.get(f"/users/{user.id}/calendar.ics",
+                      headers={"If-Modified-Since": last_modified}).status_code == 200
+
+    other = User(username="jiny_kalendar", email="jiny.kalendar@test.cz")
+    session.add(other)
+    session.commit()
+    created = client.post("/bookings/", json={"room_id": room.id, "user_id": other.id, "attendees": 2,
+                                              "start_time": "2099-01-07T10:00:00",
+                                              "end_time": "2099-01-07T11:00:00"})
+    assert created.status_code == 200
+    assert client.get(f"/users/{user.id}/calendar.ics", headers={"If-None-Match": etag}).status_code == 200
+
+def test_calendar_feed_reuses_cached_fragments(session: Session):
+    """Opakované generování feedu skládá VEVENT fragmenty z cache."""
+    room, _ = _seed_ics(session)
+    client.get(f"/rooms/{room.id}/calendar.ics")
+    hits = ics.fragment_cache.stats()["hits"]
+
+    client.get(f"/rooms/{room.id}/calendar.ics")
+
+    assert ics.fragment_cache.stats()["hits"] == hits + 2
+
+def test_calendar_unknown_room_and_user(session: Session):
+    assert client.get("/rooms/999/calendar.ics").status_code == 404
+    assert client.get("/users/999/calendar.ics").status_code == 404
+
+# === Automatický výběr místnosti ===
+
+def _seed_auto_rooms(session: Session):
+    rooms = [Room(name="Malá", capacity=4), Room(name="Střední", capacity=8), Room(name="Velká", capacity=12),
+             Room(name="Střední B", capacity=8)]
+    user = User(username="recepce", email="recepce@test.cz")
+    session.add_all([*rooms, user])
+    session.commit()
+    return rooms, user
+
+def _auto_payload(user, **changes):
+    # úterý odpoledne
+    return {"user_id": user.id, "attendees": 6, "duration": 60,
+            "earliest_start": "2024-01-09T13:00:00", "latest_end": "2024-01-09T17:00:00", **changes}
+
+def test_auto_booking_picks_smallest_free_room(session: Session):
+    """API test: 6 lidí → nejmenší místnost s kapacitou >= 6, nejdřívější volný termín."""
+    rooms, user = _seed_auto_rooms(session)
+    session.add(Booking(room_id=rooms[1].id, user_id=user.id, attendees=2,
+                        start_time=datetime(2024, 1, 9, 13, 0), end_time=datetime(2024, 1, 9, 14, 0)))
+    session.commit()
+
+    response = client.post("/bookings/auto", json=_auto_payload(user))
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["room_id"] == rooms[1].id
+    assert data["start_time"] == "2024-01-09T14:00:00"
+    assert data["end_time"] == "2024-01-09T15:00:00"
+
+def test_auto_booking_accepts_utc_offsets(session: Session):
+    """API test: okno se zónou se převede na lokální čas (ne 500)."""
+    rooms, user = _seed_auto_rooms(session)
+    start = datetime(2024, 1, 9, 13, 0).astimezone(timezone.utc)
+
+    response = client.post("/bookings/auto", json=_auto_payload(
+        user, earliest_start=start.isoformat(), latest_end=(start + timedelta(hours=4)).isoformat()))
+
+    assert response.status_code == 200
+    assert response.json()["start_time"] == "2024-01-09T13:00:00"
+
+def test_auto_booking_skips_fully_booked_rooms(session: Session):
+    """Obsazená nejmenší místnost se přeskočí, vybere se další podle kapacity a id."""
+    rooms, user = _seed_auto_rooms(session)
+    session.add(Booking(room_id=rooms[1].id, user_id=user.id, attendees=2,
+                        start_time=datetime(2024, 1, 9, 12, 0), end_time=datetime(2024, 1, 9, 18, 0)))
+    session.commit()
+
+    response = client.post("/bookings/auto", json=_auto_payload(user))
+
+    assert response.json()["room_id"] == rooms[3].id
+
+def test_auto_booking_retries_when_slot_taken_concurrently(session: Session):
+    """Termín obsazený mezi vyhledáním a zápisem (zde jen v indexu) → zkusí se další místnost."""
+    rooms, user = _seed_auto_rooms(session)
+    booking_index.load(session)
+    booking_index.add(Booking(id=999, room_id=rooms[1].id, user_id=user.id, attendees=2,
+                              start_time=datetime(2024, 1, 9, 13, 0), end_time=datetime(2024, 1, 9, 14, 0)))
+
+    response = client.post("/bookings/auto", json=_auto_payload(user))
+
+    assert response.status_code == 200
+    assert response.json()["room_id"] == rooms[3].id
+
+def test_auto_booking_rules_still_apply(session: Session):
+    """API test: víkendové okno, příliš velká skupina a neznámý uživatel."""
+    _, user = _seed_auto_rooms(session)
+
+    weekend = client.post("/bookings/auto", json=_auto_payload(
+        user, earliest_start="2024-01-13T08:00:00", latest_end="2024-01-14T18:00:00"))
+    too_big = client.post("/bookings/auto", json=_auto_payload(user, attendees=50))
+    unknown = client.post("/bookings/auto", json=_auto_payload(user, user_id=999))
+    too_long = client.post("/bookings/auto", json=_auto_payload(user, duration=600))
+
+    assert weekend.status_code == 400
+    assert too_big.status_code == 400
+    assert "No room" in too_big.json()["detail"]
+    assert unknown.status_code == 404
+    assert too_long.status_code == 400
+
+# === Události (SSE) ===
+
+def test_create_booking_publishes_event(session: Session):
+    """API test: po commitu rezervace dostane odběratel místnosti událost booking.created."""
+    room = Room(name="Vysílací", capacity=10)
+    user = User(username="posluchac", email="posluchac@test.cz")
+    session.add_all([room, user])
+    session.commit()
+    payload = {"room_id": room.id, "user_id": user.id, "attendees": 2,
+               "start_time": "2024-01-08T10:00:00", "end_time": "2024-01-08T11:00:00"}
+
+    async def scenario():
+        stream = event_stream(event_bus, room_id=room.id, heartbeat=60)
+        await anext(stream)  # retry – odběr je zaregistrovaný
+        response = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: client.post("/bookings/", json=payload))
+        frame = await asyncio.wait_for(anext(stream), timeout=5)
+        await stream.aclose()
+        return response, frame
+
+    response, frame = asyncio.run(scenario())
+
+    assert response.status_code == 200
+    assert b"event: booking.created" in frame
+    assert f'"id":{response.json()["id"]}'.encode() in frame
+
+# === Zrušení a úprava rezervací ===
+
+def _seed_editable(session: Session):
+    room = Room(name="Přesouvací", capacity=6)
+    user = User(username="presouvac", email="presouvac@test.cz")
+    session.add_all([room, user])
+    session.commit()
+    return room, user
+
+def _booking_payload(room, user, start, end, attendees=2):
+    return {"room_id": room.id, "user_id": user.id, "attendees": attendees, "start_time": start, "end_time": end}
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_patch_booking_can_overlap_its_own_slot(session: Session, indexed):
+    """API test: posun o půl hodiny se s původním časem té samé rezervace nepočítá jako kolize."""
+    room, user = _seed_editable(session)
+    if indexed:
+        booking_index.load(session)
+    created = client.post("/bookings/", json=_booking_payload(room, user, "2024-01-08T10:00:00",
+                                                              "2024-01-08T11:00:00")).json()
+
+    response = client.patch(f"/bookings/{created['id']}",
+                            json={"start_time": "2024-01-08T10:30:00", "end_time": "2024-01-08T11:30:00"})
+
+    assert response.status_code == 200
+    assert response.json()["start_time"] == "2024-01-08T10:30:00"
+    assert response.json()["attendees"] == 2
+    # původní čas je volný (index i DB)
+    assert client.post("/bookings/", json=_booking_payload(room, user, "2024-01-08T09:30:00",
+                                                           "2024-01-08T10:30:00")).status_code == 200
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_patch_booking_into_other_booking_fails(session: Session, indexed):
+    room, user = _seed_editable(session)
+    if indexed:
+        booking_index.load(session)
+    client.post("/bookings/", json=_booking_payload(room, user, "2024-01-08T10:00:00", "2024-01-08T11:00:00"))
+    moved = client.post("/bookings/", json=_booking_payload(room, user, "2024-01-08T12:00:00",
+                                                            "2024-01-08T13:00:00")).json()
+
+    response = client.patch(f"/bookings/{moved['id']}", json={"start_time": "2024-01-08T10:30:00",
+                                                              "end_time": "2024-01-08T11:30:00"})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Room is already booked"
+    assert session.get(Booking, moved["id"]).start_time == datetime(2024, 1, 8, 12, 0)
+
+def test_patch_booking_validates_like_create(session: Session):
+    room, user = _seed_editable(session)
+    created = client.post("/bookings/", json=_booking_payload(room, user, "2024-01-08T10:00:00",
+                                                              "2024-01-08T11:00:00")).json()
+
+    too_many = client.patch(f"/bookings/{created['id']}", json={"attendees": 7})
+    weekend = client.patch(f"/bookings/{created['id']}", json={"start_time": "2024-01-06T10:00:00",
+                                                               "end_time": "2024-01-06T11:00:00"})
+    missing_room = client.patch(f"/bookings/{created['id']}", json={"room_id": 999})
+    missing = client.patch("/bookings/999", json={"attendees": 3})
+
+    assert too_many.status_code == 400
+    assert weekend.status_code == 400
+    assert missing_room.status_code == 404
+    assert missing.status_code == 404
+
+def test_patch_booking_accepts_utc_offset(session: Session):
+    """API test: přesun na čas se zónou se uloží jako lokální čas (ne 500)."""
+    room, user = _seed_editable(session)
+    booking_index.load(session)
+    created = client.post("/bookings/", json=_booking_payload(room, user, "2099-01-05T10:00:00",
+                                                              "2099-01-05T11:00:00")).json()
+    start = datetime(2099, 1, 5, 14, 0, tzinfo=timezone.utc)
+
+    response = client.patch(f"/bookings/{created['id']}", json={
+        "start_time": start.isoformat(), "end_time": (start + timedelta(hours=1)).isoformat()})
+
+    assert response.status_code == 200
+    assert response.json()["start_time"] == start.astimezone().replace(tzinfo=None).isoformat()
+
+def test_patch_future_booking_does_not_hit_user_limit(session: Session):
+    """Přesun jedné ze dvou budoucích rezervací neubírá z limitu (rezervace už se započítává)."""
+    room, user = _seed_editable(session)
+    first = client.post("/bookings/", json=_booking_payload(room, user, "2099-06-01T10:00:00",
+                                                            "2099-06-01T11:00:00")).json()
+    client.post("/bookings/", json=_booking_payload(room, user, "2099-06-02T10:00:00", "2099-06-02T11:00:00"))
+
+    response = client.patch(f"/bookings/{first['id']}", json={"start_time": "2099-06-03T10:00:00",
+                                                              "end_time": "2099-06-03T11:00:00"})
+
+    assert response.status_code == 200
+
+def test_delete_booking_frees_slot_and_user_limit(session: Session):
+    """API test: zrušená budoucí rezervace uvolní termín i místo v limitu uživatele."""
+    room, user = _seed_editable(session)
+    booking_index.load(session)
+    first = client.post("/bookings/", json=_booking_payload(room, user, "2099-06-01T10:00:00",
+                                                            "2099-06-01T11:00:00")).json()
+    client.post("/bookings/", json=_booking_payload(room, user, "2099-06-02T10:00:00", "2099-06-02T11:00:00"))
+    over_limit = _booking_payload(room, user, "2099-06-03T10:00:00", "2099-06-03T11:00:00")
+    assert client.post("/bookings/", json=over_limit).status_code == 400
+
+    response = client.delete(f"/bookings/{first['id']}")
+
+    assert response.status_code == 204
+    assert client.delete(f"/bookings/{first['id']}").status_code == 404
+    assert client.post("/bookings/", json=over_limit).status_code == 200
+    assert client.post("/bookings/", json=_booking_payload(room, user, "2099-06-01T10:00:00",
+                                                           "2099-06-01T11:00:00")).status_code == 400  # limit
+    assert [b["id"] for b in client.get("/bookings/", params={"room_id": room.id}).json()] == [
+        first["id"] + 1, first["id"] + 2]
+
+def test_patch_and_delete_keep_rollups_in_sync(session: Session, monkeypatch):
+    """Denní souhrny po přesunu a zrušení odpovídají výpočtu z rezervací."""
+    monkeypatch.setattr(stats, "ROLLUPS_ENABLED", True)
+    room, user = _seed_editable(session)
+    moved = client.post("/bookings/", json=_booking_payload(room, user, "2024-01-08T10:00:00",
+                                                            "2024-01-08T12:00:00")).json()
+    cancelled = client.post("/bookings/", json=_booking_payload(room, user, "2024-01-09T10:00:00",
+                                                                "2024-01-09T11:00:00")).json()
+
+    client.patch(f"/bookings/{moved['id']}", json={"start_time": "2024-01-10T09:00:00",
+                                                   "end_time": "2024-01-10T10:00:00"})
+    client.delete(f"/bookings/{cancelled['id']}")
+
+    params = {"from": "2024-01-08T00:00:00", "to": "2024-01-15T00:00:00", "bucket": "day"}
+    with_rollups = client.get("/stats/utilization", params=params).json()
+    raw = stats.utilization(session, datetime(2024, 1, 8), datetime(2024, 1, 15), "day")
+    assert with_rollups["rooms"] == jsonable_encoder(raw["rooms"])
+    assert sum(bucket["booked_minutes"] for bucket in with_rollups["rooms"][0]["buckets"]) == 60
+
+def test_delete_booking_publishes_event(session: Session):
+    room, user = _seed_editable(session)
+    created = client.post("/bookings/", json=_booking_payload(room, user, "2024-01-08T10:00:00",
+                                                              "2024-01-08T11:00:00")).json()
+
+    async def scenario():
+        stream = event_stream(event_bus, room_id=room.id, heartbeat=60)
+        await anext(stream)
+        response = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: client.delete(f"/bookings/{created['id']}"))
+        frame = await asyncio.wait_for(anext(stream), timeout=5)
+        await stream.aclose()
+        return response, frame
+
+    response, frame = asyncio.run(scenario())
+
+    assert response.status_code == 204
+    assert b"event: booking.deleted" in frame
+    assert f'"id":{created["id"]}'.encode() in frame
+
+# === Idempotency-Key ===
+
+def _seed_idempotent(session: Session):
+    room = Room(name="Opakovaná", capacity=6)
+    user = User(username="opakovac", email="opakovac@test.cz")
+    session.add_all([room, user])
+    session.commit()
+    return {"room_id": room.id, "user_id": user.id, "attendees": 2,
+            "start_time": "2024-01-08T10:00:00", "end_time": "2024-01-08T11:00:00"}
+
+def test_booking_retry_with_same_key_replays_response(session: Session):
+    """API test: opakovaný POST se stejným klíčem vrátí původní rezervaci, ne „Room is already booked“."""
+    payload = _seed_idempotent(session)
+    headers = {"Idempotency-Key": "retry-1"}
+    first = client.post("/bookings/", json=payload, headers=headers)
+
+    retry = client.post("/bookings/", json=payload, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert len(session.exec(select(Booking)).all()) == 1
+
+def test_idempotent_replay_skips_rule_pipeline(session: Session):
+    """Opakování se obslouží z paměti – bez jediného SQL dotazu a bez pravidel."""
+    payload = _seed_idempotent(session)
+    headers = {"Idempotency-Key": "retry-2"}
+    client.post("/bookings/", json=payload, headers=headers)
+    statements = []
+    listener = _count_sql(statements)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        retry = client.post("/bookings/", json=payload, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert retry.status_code == 200
+    assert statements == []
+
+def test_idempotency_key_survives_memory_cache(session: Session):
+    """Bez položky v LRU (jiný worker, restart) se odpověď načte z tabulky idempotency_key."""
+    payload = _seed_idempotent(session)
+    headers = {"Idempotency-Key": "retry-3"}
+    first = client.post("/bookings/", json=payload, headers=headers)
+    idempotency_cache.clear()
+
+    retry = client.post("/bookings/", json=payload, headers=headers)
+
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+def test_idempotency_key_reused_for_other_request_fails(session: Session):
+    payload = _seed_idempotent(session)
+    headers = {"Idempotency-Key": "retry-4"}
+    client.post("/bookings/", json=payload, headers=headers)
+
+    other = client.post("/bookings/", json={**payload, "attendees": 3}, headers=headers)
+    other_endpoint = client.post("/rooms/", json={"name": "Jiná", "capacity": 3}, headers=headers)
+
+    assert other.status_code == 422
+    assert other_endpoint.status_code == 422
+
+def test_failed_request_is_not_stored(session: Session):
+    """Odmítnutý požadavek nic nezměnil – po opravě stavu projde opakování se stejným klíčem."""
+    payload = _seed_idempotent(session)
+    headers = {"Idempotency-Key": "retry-5"}
+    missing_room = {**payload, "room_id": payload["room_id"] + 1}
+    assert client.post("/bookings/", json=missing_room, headers=headers).status_code == 404
+
+    client.post("/rooms/", json={"name": "Dodatečná", "capacity": 6})
+    retry = client.post("/bookings/", json=missing_room, headers=headers)
+
+    assert retry.status_code == 200
+    assert "Idempotent-Replayed" not in retry.headers
+
+def test_expired_idempotency_key_runs_again(session: Session, monkeypatch):
+    payload = _seed_idempotent(session)
+    headers = {"Idempotency-Key": "retry-6"}
+    client.post("/bookings/", json=payload, headers=headers)
+    monkeypatch.setattr(idempotency_store, "ttl", timedelta(0))
+
+    retry = client.post("/bookings/", json=payload, headers=headers)
+
+    assert retry.status_code == 400
+    assert retry.json()["detail"] == "Room is already booked"
+
+def test_response_is_stored_with_the_booking(session: Session, monkeypatch):
+    """Odpověď se uloží v transakci zápisu – i když worker po commitu spadne, opakování ji přehraje."""
+    payload = _seed_idempotent(session)
+    headers = {"Idempotency-Key": "crash-1"}
+
+    def crash(key, stored):
+        raise RuntimeError("worker died after commit")
+    monkeypatch.setattr(idempotency_store, "complete", crash)
+    with pytest.raises(RuntimeError):
+        client.post("/bookings/", json=payload, headers=headers)
+    monkeypatch.undo()
+
+    record = session.get(IdempotencyRecord, "crash-1")
+    retry = client.post("/bookings/", json=payload, headers=headers)
+
+    booking = session.exec(select(Booking)).one()
+    assert record.status_code == 200
+    assert json.loads(record.body)["id"] == booking.id
+    assert retry.status_code == 200
+    assert retry.json()["id"] == booking.id
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+def test_key_reserved_by_other_worker_is_not_executed_again(session: Session, monkeypatch):
+    """Klíč rezervovaný jiným workerem (bez odpovědi) → po čekání 409, pravidla ani zápis se nespustí."""
+    payload = _seed_idempotent(session)
+    fingerprint = request_fingerprint("/bookings/", BookingCreate(**payload).model_dump_json())
+    session.add(IdempotencyRecord(key="elsewhere-1", fingerprint=fingerprint))
+    session.commit()
+    monkeypatch.setattr(idempotency_store, "wait", timedelta(0))
+
+    response = client.post("/bookings/", json=payload, headers={"Idempotency-Key": "elsewhere-1"})
+
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == "1"
+    assert session.exec(select(Booking)).all() == []
+
+def test_claim_rolls_back_when_key_is_taken(session: Session):
+    """claim() v transakci zápisu: platný záznam klíče → rollback a IdempotencyKeyTakenError."""
+    session.add(IdempotencyRecord(key="taken-1", fingerprint="f", status_code=200, body=b"{}"))
+    session.commit()
+    session.info[SESSION_INFO_KEY] = ("taken-1", "f")
+    begin_immediate(session)
+    session.add(Room(name="Nevložená", capacity=2))
+    session.flush()
+
+    with pytest.raises(IdempotencyKeyTakenError):
+        idempotency_store.claim(session)
+
+    session.info.pop(SESSION_INFO_KEY)
+    assert session.exec(select(Room)).all() == []
+    assert session.get(IdempotencyRecord, "taken-1").status_code == 200
+
+def test_room_and_user_creation_are_idempotent(session: Session):
+    """Opakované vytvoření uživatele neskončí 409 a místnost se nezdvojí."""
+    user = {"username": "jednou", "email": "jednou@test.cz"}
+    room = {"name": "Jednou", "capacity": 4}
+
+    users = [client.post("/users/", json=user, headers={"Idempotency-Key": "user-1"}) for _ in range(2)]
+    rooms = [client.post("/rooms/", json=room, headers={"Idempotency-Key": "room-1"}) for _ in range(2)]
+
+    assert [r.status_code for r in users + rooms] == [200] * 4
+    assert users[1].json() == users[0].json()
+    assert len(session.exec(select(Room)).all()) == 1
+
+def test_invalid_idempotency_key_is_rejected(session: Session):
+    response = client.post("/rooms/", json={"name": "Dlouhá", "capacity": 4}, headers={"Idempotency-Key": "x" * 256})
+
+    assert response.status_code == 400
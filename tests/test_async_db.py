@@ -0,0 +1,185 @@
+import asyncio
+import httpx
+import pytest
+from datetime import datetime
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlalchemy.pool import NullPool
+from app.database import get_async_session
+from app.main import create_booking_async
+from app.models import Room, User, Booking
+from app.services import BookingService
+from app.cache import reset_caches, FutureBookingCounter
+from app.interval_index import booking_index
+
+# Async vrstva (DATABASE_MODE=async) – bez aiosqlite se testy přeskočí
+pytest.importorskip("aiosqlite")
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+@pytest.fixture(name="db_file")
+def db_file_fixture(tmp_path):
+    db_file = tmp_path / "async.db"
+    sync_engine = create_engine(f"sqlite:///{db_file}")
+    SQLModel.metadata.create_all(sync_engine)
+    with Session(sync_engine) as session:
+        room = Room(name="Async", capacity=10)
+        user = User(username="async", email="async@test.cz")
+        session.add_all([room, user])
+        session.commit()
+        session.add(Booking(room_id=room.id, user_id=user.id, attendees=2,
+                            start_time=datetime(2025, 1, 6, 10, 0), end_time=datetime(2025, 1, 6, 11, 0)))
+        session.commit()
+    sync_engine.dispose()
+    return db_file
+
+def _async_engine(db_file):
+    return create_async_engine(f"sqlite+aiosqlite:///{db_file}", poolclass=NullPool)
+
+def test_check_availability_async(db_file):
+    """Async kontrola kolizí najde překryv stejně jako sync varianta."""
+    async def run():
+        engine = _async_engine(db_file)
+        async with AsyncSession(engine) as session:
+            with pytest.raises(ValueError, match="Room is already booked"):
+                await BookingService.check_availability_async(
+                    session, 1, datetime(2025, 1, 6, 10, 30), datetime(2025, 1, 6, 11, 30))
+            assert await BookingService.check_availability_async(
+                session, 1, datetime(2025, 1, 6, 10, 30), datetime(2025, 1, 6, 11, 30), exclude_id=1) is True
+            assert await BookingService.check_availability_async(
+                session, 1, datetime(2025, 1, 6, 11, 0), datetime(2025, 1, 6, 12, 0)) is True
+        await engine.dispose()
+    asyncio.run(run())
+
+def test_validate_user_limit_async(db_file):
+    """Async limit rezervací – minulé rezervace se nepočítají (s počítadlem i bez)."""
+    async def run():
+        engine = _async_engine(db_file)
+        counter = FutureBookingCounter()
+        async with AsyncSession(engine) as session:
+            assert await BookingService.validate_user_limit_async(session, 1) is True
+            assert await BookingService.validate_user_limit_async(session, 1, counter=counter) is True
+            assert await counter.count_async(session, 1) == 0
+        await engine.dispose()
+    asyncio.run(run())
+
+def test_create_booking_async_endpoint(db_file):
+    """API test: async handler uloží rezervaci a odmítne kolizi."""
+    engine = _async_engine(db_file)
+
+    async def get_test_async_session():
+        async with AsyncSession(engine) as session:
+            yield session
+
+    test_app = FastAPI()
+    test_app.post("/bookings/")(create_booking_async)
+    test_app.dependency_overrides[get_async_session] = get_test_async_session
+    client = TestClient(test_app)
+
+    payload = {"room_id": 1, "user_id": 1, "attendees": 2,
+               "start_time": "2025-01-06T11:00:00", "end_time": "2025-01-06T12:00:00"}
+    response = client.post("/bookings/", json=payload)
+    assert response.status_code == 200
+    assert response.json()["id"] is not None
+
+    response = client.post("/bookings/", json=payload)
+    assert response.status_code == 400
+    assert "Room is already booked" in response.json()["detail"]
+
+    response = client.post("/bookings/", json={**payload, "room_id": 9999})
+    assert response.status_code == 404
+
+def test_create_booking_async_replays_idempotency_key(db_file):
+    """API test: opakování se stejným Idempotency-Key vrátí uloženou rezervaci místo kolize."""
+    engine = _async_engine(db_file)
+
+    async def get_test_async_session():
+        async with AsyncSession(engine) as session:
+            yield session
+
+    test_app = FastAPI()
+    test_app.post("/bookings/")(create_booking_async)
+    test_app.dependency_overrides[get_async_session] = get_test_async_session
+    client = TestClient(test_app)
+    payload = {"room_id": 1, "user_id": 1, "attendees": 2,
+               "start_time": "2025-01-06T13:00:00", "end_time": "2025-01-06T14:00:00"}
+    headers = {"Idempotency-Key": "async-retry-1"}
+
+    first = client.post("/bookings/", json=payload, headers=headers)
+    retry = client.post("/bookings/", json=payload, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    reset_caches()
+
+def test_parallel_overlapping_async_bookings_exactly_one_succeeds(db_file):
+    """
+    Souběžné překrývající se rezervace přes async handler s načteným indexem
+    → projde právě jedna (kontrola, commit i zápis do indexu jsou pod zámkem).
+    """
+    engine = _async_engine(db_file)
+    sync_engine = create_engine(f"sqlite:///{db_file}")
+    with Session(sync_engine) as session:
+        booking_index.load(session)
+    sync_engine.dispose()
+
+    async def get_test_async_session():
+        async with AsyncSession(engine) as session:
+            yield session
+
+    test_app = FastAPI()
+    test_app.post("/bookings/")(create_booking_async)
+    test_app.dependency_overrides[get_async_session] = get_test_async_session
+    payloads = [{"room_id": 1, "user_id": 1, "attendees": 2,
+                 "start_time": f"2025-01-07T10:{i:02d}:00", "end_time": f"2025-01-07T11:{i:02d}:00"}
+                for i in range(16)]
+
+    async def run():
+        transport = httpx.ASGITransport(app=test_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = await asyncio.gather(*(client.post("/bookings/", json=p) for p in payloads))
+        await engine.dispose()
+        return [r.status_code for r in responses]
+
+    statuses = asyncio.run(run())
+
+    assert statuses.count(200) == 1
+    assert statuses.count(400) == len(payloads) - 1
+    reset_caches()
+
+def test_parallel_async_retries_with_same_key_create_one_booking(db_file):
+    """Souběžná opakování se stejným Idempotency-Key přes async handler → jedna rezervace, stejná odpověď."""
+    engine = _async_engine(db_file)
+
+    async def get_test_async_session():
+        async with AsyncSession(engine) as session:
+            yield session
+
+    test_app = FastAPI()
+    test_app.post("/bookings/")(create_booking_async)
+    test_app.dependency_overrides[get_async_session] = get_test_async_session
+    payload = {"room_id": 1, "user_id": 1, "attendees": 2,
+               "start_time": "2025-01-08T10:00:00", "end_time": "2025-01-08T11:00:00"}
+
+    async def run():
+        transport = httpx.ASGITransport(app=test_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = await asyncio.gather(*(
+                client.post("/bookings/", json=payload, headers={"Idempotency-Key": "async-parallel-1"})
+                for _ in range(8)))
+        await engine.dispose()
+        return responses
+
+    responses = asyncio.run(run())
+
+    assert [r.status_code for r in responses] == [200] * 8
+    assert len({r.json()["id"] for r in responses}) == 1
+    assert sum(r.headers.get("Idempotent-Replayed") == "true" for r in responses) == 7
+    sync_engine = create_engine(f"sqlite:///{db_file}")
+    with Session(sync_engine) as session:
+        assert len(session.exec(select(Booking)).all()) == 2  # výchozí + jedna nová
+    sync_engine.dispose()
+    reset_caches()
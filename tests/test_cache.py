@@ -0,0 +1,191 @@
+import time
+import pytest
+from datetime import datetime, timedelta, timezone
+from sqlmodel import Session, SQLModel, create_engine
+from sqlalchemy.pool import StaticPool
+from unittest.mock import Mock
+from app.cache import (FutureBookingCounter, LRUCache, EntityCache, TableVersions, etag_matches,
+                       last_modified_header, not_modified_since)
+from app.models import Room, User, Booking
+from app.services import BookingService
+
+# Testy in-memory cache proti skutečné (in-memory) SQLite databázi.
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool
+)
+
+NOW = datetime(2025, 1, 6, 12, 0)
+
+@pytest.fixture(name="session")
+def session_fixture():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all([Room(name="Cache", capacity=10), User(username="cache", email="c@c.cz")])
+        session.commit()
+        yield session
+    SQLModel.metadata.drop_all(engine)
+
+def _book(session, start: datetime):
+    booking = Booking(room_id=1, user_id=1, attendees=2, start_time=start, end_time=start + timedelta(hours=1))
+    session.add(booking)
+    session.commit()
+    return booking
+
+def _sql_count(session, now=NOW):
+    return session.exec(BookingService.user_limit_statement(1, now)).one()
+
+# ===== FutureBookingCounter =====
+
+def test_counter_matches_sql_count(session: Session):
+    """Počítadlo načtené z DB odpovídá SQL COUNT (minulé rezervace se nepočítají)."""
+    _book(session, NOW - timedelta(days=1))
+    _book(session, NOW + timedelta(days=1))
+    counter = FutureBookingCounter()
+
+    assert counter.count(session, 1, NOW) == _sql_count(session) == 1
+
+def test_counter_tracks_added_bookings(session: Session):
+    """Po add() se počítadlo drží v souladu s DB bez dalšího dotazu."""
+    counter = FutureBookingCounter()
+    assert counter.count(session, 1, NOW) == 0
+
+    booking = _book(session, NOW + timedelta(days=2))
+    counter.add(1, booking.start_time)
+
+    assert counter.count(session, 1, NOW) == _sql_count(session) == 1
+
+def test_counter_expires_started_bookings(session: Session):
+    """Rezervace, jejichž začátek uplynul, počítadlo samo odečte."""
+    _book(session, NOW + timedelta(hours=1))
+    _book(session, NOW + timedelta(days=1))
+    counter = FutureBookingCounter()
+    assert counter.count(session, 1, NOW) == 2
+
+    later = NOW + timedelta(hours=2)
+    assert counter.count(session, 1, later) == _sql_count(session, later) == 1
+
+def test_counter_boundary_start_equal_now_is_not_future(session: Session):
+    """Hraniční případ: start_time == now už není budoucí (stejně jako start_time > now v SQL)."""
+    _book(session, NOW + timedelta(hours=1))
+    counter = FutureBookingCounter()
+    counter.count(session, 1, NOW)
+
+    at_start = NOW + timedelta(hours=1)
+    assert counter.count(session, 1, at_start) == _sql_count(session, at_start) == 0
+
+def test_counter_remove(session: Session):
+    """Smazaná rezervace se odečte."""
+    booking = _book(session, NOW + timedelta(days=1))
+    counter = FutureBookingCounter()
+    assert counter.count(session, 1, NOW) == 1
+
+    counter.remove(1, booking.start_time)
+    assert counter.count(session, 1, NOW) == 0
+
+def test_validate_user_limit_with_counter_at_max_two(session: Session):
+    """Pravidlo „max 2“: se 2 budoucími rezervacemi odmítne, s 1 projde – stejně jako SQL varianta."""
+    counter = FutureBookingCounter()
+    _book(session, datetime(2099, 1, 5, 10, 0))
+    assert BookingService.validate_user_limit(session, 1, counter=counter) is True
+    assert BookingService.validate_user_limit(session, 1) is True
+
+    booking = _book(session, datetime(2099, 1, 6, 10, 0))
+    counter.add(1, booking.start_time)
+
+    with pytest.raises(ValueError, match="too many bookings"):
+        BookingService.validate_user_limit(session, 1, counter=counter)
+    with pytest.raises(ValueError, match="too many bookings"):
+        BookingService.validate_user_limit(session, 1)
+
+# ===== LRUCache =====
+
+def test_lru_evicts_least_recently_used():
+    """Při překročení velikosti vypadne nejdéle nepoužitá položka."""
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+def test_lru_expires_after_ttl():
+    """Položka starší než TTL se bere jako chybějící."""
+    cache = LRUCache(maxsize=10, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+def test_lru_counts_hits_and_misses():
+    cache = LRUCache(maxsize=10, ttl=60)
+    cache.get("a")
+    cache.set("a", 1)
+    cache.get("a")
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+# ===== EntityCache =====
+
+def test_entity_cache_reads_through_once(session: Session):
+    """Druhé čtení místnosti/uživatele jde z cache bez DB."""
+    cache = EntityCache(maxsize=10, ttl=60)
+
+    assert cache.get_room(session, 1).capacity == 10
+    assert cache.user_exists(session, 1) is True
+    no_db = Mock()
+    assert cache.get_room(no_db, 1).capacity == 10
+    assert cache.user_exists(no_db, 1) is True
+    no_db.get.assert_not_called()
+    assert cache.stats()["rooms"]["hits"] == 1
+    assert cache.stats()["users"]["hits"] == 1
+
+def test_entity_cache_caches_not_found_until_invalidated(session: Session):
+    """„Nenalezeno“ se kešuje; po invalidaci se nový záznam najde."""
+    cache = EntityCache(maxsize=10, ttl=60)
+    assert cache.get_room(session, 2) is None
+
+    session.add(Room(name="Nová", capacity=4))
+    session.commit()
+    assert cache.get_room(session, 2) is None
+
+    cache.invalidate_room(2)
+    assert cache.get_room(session, 2).capacity == 4
+
+# ===== TableVersions / ETag =====
+
+def test_table_version_bump_changes_etag():
+    versions = TableVersions()
+    etag = versions.etag("room", "/rooms/?")
+    assert versions.etag("room", "/rooms/?") == etag
+
+    versions.bump("room")
+    assert versions.etag("room", "/rooms/?") != etag
+    assert versions.get("room") == 1
+    assert versions.get("booking") == 0
+
+def test_last_modified_waits_for_end_of_second():
+    """
+    Last-Modified má přesnost na sekundy: během sekundy změny se neposílá,
+    jinak by další změna ve stejné sekundě prošla If-Modified-Since jako 304.
+    """
+    changed = datetime(2024, 1, 8, 10, 0, 0, 200000, tzinfo=timezone.utc)
+
+    assert last_modified_header(changed, now=changed + timedelta(milliseconds=300)) is None
+    header = last_modified_header(changed, now=changed + timedelta(seconds=1))
+
+    assert header == "Mon, 08 Jan 2024 10:00:00 GMT"
+    assert not_modified_since(header, changed)
+    assert not not_modified_since(header, changed + timedelta(seconds=1))
+
+def test_etag_matches_if_none_match_forms():
+    """If-None-Match: seznam, slabý ETag (W/) i `*`."""
+    assert etag_matches('"a", "b"', '"b"')
+    assert etag_matches('W/"b"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches(None, '"b"')
@@ -0,0 +1,144 @@
+import threading
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, create_engine, select
+from app.main import app, get_session
+from app.database import apply_sqlite_pragmas
+from app.interval_index import booking_index
+from app.cache import reset_caches
+from app.models import Room, User, Booking, BookingCreate, IdempotencyRecord
+from app.idempotency import idempotency_store, request_fingerprint, SESSION_INFO_KEY
+
+# Stress testy souběžných rezervací nad souborovou DB (skutečný pool spojení,
+# ne sdílené in-memory spojení jako v test_api).
+
+PARALLEL_REQUESTS = 16
+
+
+@pytest.fixture(name="file_engine")
+def file_engine_fixture(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'concurrency.db'}",
+                           connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    SQLModel.metadata.create_all(engine)
+
+    def get_file_session():
+        with Session(engine) as session:
+            yield session
+
+    previous = app.dependency_overrides.get(get_session)
+    app.dependency_overrides[get_session] = get_file_session
+    yield engine
+    if previous is None:
+        app.dependency_overrides.pop(get_session, None)
+    else:
+        app.dependency_overrides[get_session] = previous
+    reset_caches()
+    engine.dispose()
+
+
+def _seed(engine, users: int):
+    with Session(engine) as session:
+        room = Room(name="Souběžná", capacity=10)
+        session.add(room)
+        session.add_all([User(username=f"u{i}", email=f"u{i}@test.cz") for i in range(users)])
+        session.commit()
+        return room.id
+
+
+def _fire(payloads):
+    """Pošle všechny požadavky naráz (bariéra) a vrátí odpovědi."""
+    client = TestClient(app)
+    barrier = threading.Barrier(len(payloads))
+
+    def post(payload):
+        barrier.wait()
+        return client.post("/bookings/", json=payload)
+
+    with ThreadPoolExecutor(max_workers=len(payloads)) as pool:
+        return list(pool.map(post, payloads))
+
+
+def _overlapping_payloads(room_id):
+    # Každý požadavek od jiného uživatele, všechny se překrývají s 10:00–11:00
+    return [
+        {"room_id": room_id, "user_id": i + 1, "attendees": 2,
+         "start_time": f"2025-01-06T10:{i:02d}:00", "end_time": f"2025-01-06T11:{i:02d}:00"}
+        for i in range(PARALLEL_REQUESTS)
+    ]
+
+
+def test_parallel_overlapping_bookings_exactly_one_succeeds(file_engine):
+    """N souběžných překrývajících se rezervací téže místnosti → projde právě jedna."""
+    room_id = _seed(file_engine, PARALLEL_REQUESTS)
+
+    responses = _fire(_overlapping_payloads(room_id))
+
+    statuses = [r.status_code for r in responses]
+    assert statuses.count(200) == 1
+    assert statuses.count(400) == PARALLEL_REQUESTS - 1
+    assert all("Room is already booked" in r.json()["detail"] for r in responses if r.status_code == 400)
+
+
+def test_parallel_overlapping_bookings_with_loaded_index(file_engine):
+    """Totéž s in-memory indexem – kontrola i zápis do indexu jsou pod zámkem místnosti."""
+    room_id = _seed(file_engine, PARALLEL_REQUESTS)
+    with Session(file_engine) as session:
+        booking_index.load(session)
+
+    responses = _fire(_overlapping_payloads(room_id))
+
+    assert [r.status_code for r in responses].count(200) == 1
+
+
+def test_parallel_bookings_same_user_respect_limit(file_engine):
+    """Souběžné budoucí rezervace jednoho uživatele v různých časech → projdou max. 2."""
+    with Session(file_engine) as session:
+        rooms = [Room(name=f"R{i}", capacity=10) for i in range(PARALLEL_REQUESTS)]
+        user = User(username="spěchá", email="fast@test.cz")
+        session.add_all([*rooms, user])
+        session.commit()
+        payloads = [
+            {"room_id": room.id, "user_id": user.id, "attendees": 2,
+             "start_time": "2099-06-01T10:00:00", "end_time": "2099-06-01T11:00:00"}
+            for room in rooms
+        ]
+
+    responses = _fire(payloads)
+
+    assert [r.status_code for r in responses].count(200) == 2
+
+
+def test_retry_waits_for_response_of_request_in_progress(file_engine):
+    """
+    Klíč rezervoval jiný worker a ještě neuložil odpověď: opakování počká,
+    vrátí jeho odpověď a rezervaci nevytvoří podruhé.
+    """
+    room_id = _seed(file_engine, 1)
+    payload = {"room_id": room_id, "user_id": 1, "attendees": 2,
+               "start_time": "2025-01-06T10:00:00", "end_time": "2025-01-06T11:00:00"}
+    fingerprint = request_fingerprint("/bookings/", BookingCreate(**payload).model_dump_json())
+    with Session(file_engine) as session:
+        session.add(IdempotencyRecord(key="in-progress-1", fingerprint=fingerprint))
+        session.commit()
+
+    def finish_elsewhere():
+        time.sleep(0.2)
+        with Session(file_engine) as session:
+            session.info[SESSION_INFO_KEY] = ("in-progress-1", fingerprint)
+            idempotency_store.respond(session, {"id": 42})
+            session.commit()
+    worker = threading.Thread(target=finish_elsewhere)
+    worker.start()
+
+    response = TestClient(app).post("/bookings/", json=payload, headers={"Idempotency-Key": "in-progress-1"})
+    worker.join()
+
+    assert response.status_code == 200
+    assert response.json() == {"id": 42}
+    assert response.headers["Idempotent-Replayed"] == "true"
+    with Session(file_engine) as session:
+        assert session.exec(select(Booking)).all() == []
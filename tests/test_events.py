@@ -0,0 +1,79 @@
+import asyncio
+import threading
+from app.events import EventBus, event_stream
+
+# Testy pub/sub událostí rezervací (GET /events).
+
+def _run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, timeout=5))
+
+def test_publish_from_thread_reaches_subscriber():
+    """Událost publikovaná z jiného vlákna (threadpool) dorazí do fronty v event loopu."""
+    async def scenario():
+        bus = EventBus(queue_size=10)
+        subscriber = bus.subscribe()
+        worker = threading.Thread(target=bus.publish, args=("booking.created", 1, {"id": 7}))
+        worker.start()
+        worker.join()
+        return await subscriber.queue.get()
+
+    frame = _run(scenario())
+
+    assert frame.startswith(b"id: 1\nevent: booking.created\n")
+    assert b'data: {"id":7}\n\n' in frame
+
+def test_room_filter_delivers_only_matching_rooms():
+    async def scenario():
+        bus = EventBus(queue_size=10)
+        room_one, everything = bus.subscribe(room_id=1), bus.subscribe()
+        bus.publish("booking.created", 2, {"id": 1})
+        bus.publish("booking.created", 1, {"id": 2})
+        await asyncio.sleep(0)
+        return room_one.queue.qsize(), everything.queue.qsize()
+
+    assert _run(scenario()) == (1, 2)
+
+def test_slow_consumer_is_dropped():
+    """Plná fronta → odběratel dostane `dropped` a stream skončí; ostatní nic nebrzdí."""
+    async def scenario():
+        bus = EventBus(queue_size=2)
+        stream = event_stream(bus, heartbeat=60)
+        assert await anext(stream) == b"retry: 3000\n\n"
+        for i in range(5):
+            bus.publish("booking.created", 1, {"id": i})
+        await asyncio.sleep(0)
+        frames = [frame async for frame in stream]
+        return frames, bus
+
+    frames, bus = _run(scenario())
+
+    assert frames == [b'event: dropped\ndata: {"reason":"slow consumer"}\n\n']
+    assert bus.dropped_total == 1
+    assert bus.subscriber_count() == 0
+
+def test_stream_sends_heartbeat_when_idle():
+    async def scenario():
+        bus = EventBus(queue_size=2)
+        stream = event_stream(bus, heartbeat=0.01)
+        await anext(stream)
+        heartbeat = await anext(stream)
+        await stream.aclose()
+        return heartbeat, bus.subscriber_count()
+
+    assert _run(scenario()) == (b": keepalive\n\n", 0)
+
+def test_publish_without_subscribers_is_noop():
+    bus = EventBus(queue_size=2)
+    bus.publish("booking.created", 1, {"id": 1})
+    assert bus.subscriber_count() == 0
+
+def test_many_idle_subscribers():
+    """Tisíce nečinných odběratelů – jedna událost místnosti se doručí jen jejím odběratelům."""
+    async def scenario():
+        bus = EventBus(queue_size=4)
+        subscribers = [bus.subscribe(room_id=i % 100) for i in range(5000)]
+        bus.publish("booking.created", 7, {"id": 1})
+        await asyncio.sleep(0)
+        return sum(s.queue.qsize() for s in subscribers)
+
+    assert _run(scenario()) == 50
@@ -1,7 +1,12 @@
+import threading
 import pytest
-from app.models import Booking, Room
+from app.models import Booking, Room, RecurringBookingCreate, BookingCreate
 from datetime import datetime, timedelta
-from app.services import BookingService
+from app.services import BookingService, BookingCheck, BookingRule, RulePipeline, BOOKING_RULES, PURE, CACHED, DB
+from app.interval_index import RoomIntervalIndex
+from app.locks import KeyedLock
+from app.stats import split_interval, bucket_start
+from app.ics import fold_line, escape_text
 from unittest.mock import Mock
 
 # ===== validate_capacity =====
@@ -212,4 +217,299 @@ def test_attendees_cannot_be_negative():
 
 def test_attendees_valid():
     """Kladný počet = OK."""
-    assert BookingService.validate_booking_attendees(5) is True
\ No newline at end of file
+    assert BookingService.validate_booking_attendees(5) is True
+
+# ===== RoomIntervalIndex (in-memory kontrola kolizí) =====
+
+def _index_with(*bookings):
+    index = RoomIntervalIndex()
+    index.loaded = True
+    for booking in bookings:
+        index.add(booking)
+    return index
+
+def test_index_detects_overlap():
+    """Index najde rezervaci, která se překrývá s novým časem."""
+    index = _index_with(Booking(id=7, room_id=1, user_id=1, attendees=2,
+                                start_time=datetime(2025, 1, 1, 10, 0),
+                                end_time=datetime(2025, 1, 1, 11, 0)))
+
+    assert index.find_overlap(1, datetime(2025, 1, 1, 10, 30), datetime(2025, 1, 1, 11, 30)) == 7
+    assert index.find_overlap(1, datetime(2025, 1, 1, 9, 0), datetime(2025, 1, 1, 12, 0)) == 7
+
+def test_index_allows_adjacent_slots():
+    """Hraniční případ: navazující rezervace (11:00–12:00 po 10:00–11:00) nekolidují."""
+    index = _index_with(
+        Booking(id=1, room_id=1, user_id=1, attendees=2,
+                start_time=datetime(2025, 1, 1, 10, 0), end_time=datetime(2025, 1, 1, 11, 0)),
+        Booking(id=2, room_id=1, user_id=1, attendees=2,
+                start_time=datetime(2025, 1, 1, 12, 0), end_time=datetime(2025, 1, 1, 13, 0)),
+    )
+
+    assert index.find_overlap(1, datetime(2025, 1, 1, 11, 0), datetime(2025, 1, 1, 12, 0)) is None
+
+def test_index_ignores_other_rooms():
+    """Rezervace jiné místnosti kolizi nezpůsobí."""
+    index = _index_with(Booking(id=1, room_id=2, user_id=1, attendees=2,
+                                start_time=datetime(2025, 1, 1, 10, 0),
+                                end_time=datetime(2025, 1, 1, 11, 0)))
+
+    assert index.find_overlap(1, datetime(2025, 1, 1, 10, 0), datetime(2025, 1, 1, 11, 0)) is None
+
+def test_index_remove_frees_slot():
+    """Po vyřazení rezervace (smazání/archivace) je čas opět volný."""
+    index = _index_with(Booking(id=3, room_id=1, user_id=1, attendees=2,
+                                start_time=datetime(2025, 1, 1, 10, 0),
+                                end_time=datetime(2025, 1, 1, 11, 0)))
+
+    index.remove(1, datetime(2025, 1, 1, 10, 0), datetime(2025, 1, 1, 11, 0), 3)
+    index.remove(1, datetime(2025, 1, 1, 10, 0), datetime(2025, 1, 1, 11, 0), 3)  # podruhé nic
+
+    assert index.find_overlap(1, datetime(2025, 1, 1, 10, 0), datetime(2025, 1, 1, 11, 0)) is None
+
+def test_index_exclude_skips_moved_booking():
+    """Při přesunu rezervace nekoliduje sama se sebou, sousední rezervace ano."""
+    index = _index_with(
+        Booking(id=1, room_id=1, user_id=1, attendees=2,
+                start_time=datetime(2025, 1, 1, 9, 0), end_time=datetime(2025, 1, 1, 10, 30)),
+        Booking(id=2, room_id=1, user_id=1, attendees=2,
+                start_time=datetime(2025, 1, 1, 10, 30), end_time=datetime(2025, 1, 1, 11, 0)),
+    )
+
+    assert index.find_overlap(1, datetime(2025, 1, 1, 10, 30), datetime(2025, 1, 1, 11, 30), exclude=2) is None
+    assert index.find_overlap(1, datetime(2025, 1, 1, 10, 0), datetime(2025, 1, 1, 11, 0), exclude=2) == 1
+
+def test_index_add_is_idempotent():
+    """Opakované přidání stejné rezervace (např. změna převzatá od jiného workeru) ji nezdvojí."""
+    booking = Booking(id=4, room_id=1, user_id=1, attendees=2,
+                      start_time=datetime(2025, 1, 1, 10, 0), end_time=datetime(2025, 1, 1, 11, 0))
+    index = _index_with(booking, booking)
+
+    index.remove(1, booking.start_time, booking.end_time, 4)
+
+    assert index.find_overlap(1, booking.start_time, booking.end_time) is None
+
+def test_index_finds_overlap_hidden_behind_shorter_booking():
+    """Už překrývající se data (9–12 a uvnitř 10–10:30): kolize s 9–12 se najde i za kratší rezervací."""
+    index = _index_with(
+        Booking(id=1, room_id=1, user_id=1, attendees=2,
+                start_time=datetime(2025, 1, 1, 9, 0), end_time=datetime(2025, 1, 1, 12, 0)),
+        Booking(id=2, room_id=1, user_id=1, attendees=2,
+                start_time=datetime(2025, 1, 1, 10, 0), end_time=datetime(2025, 1, 1, 10, 30)),
+    )
+
+    assert index.find_overlap(1, datetime(2025, 1, 1, 11, 0), datetime(2025, 1, 1, 11, 30)) == 1
+    assert index.find_overlap(1, datetime(2025, 1, 1, 11, 0), datetime(2025, 1, 1, 11, 30), exclude=1) is None
+    assert index.find_overlap(1, datetime(2025, 1, 1, 12, 0), datetime(2025, 1, 1, 13, 0)) is None
+
+def test_check_availability_uses_loaded_index():
+    """S načteným indexem se kontrola kolizí obejde bez DB."""
+    index = _index_with(Booking(id=1, room_id=1, user_id=1, attendees=2,
+                                start_time=datetime(2025, 1, 1, 10, 0),
+                                end_time=datetime(2025, 1, 1, 11, 0)))
+    mock_session = Mock()
+
+    with pytest.raises(ValueError, match="Room is already booked"):
+        BookingService.check_availability(mock_session, 1, datetime(2025, 1, 1, 10, 0),
+                                          datetime(2025, 1, 1, 11, 0), index=index)
+    mock_session.exec.assert_not_called()
+
+def test_check_availability_falls_back_to_sql_without_loaded_index():
+    """Nenačtený index = použije se SQL dotaz."""
+    mock_session = Mock()
+    mock_session.exec.return_value.first.return_value = None
+
+    result = BookingService.check_availability(mock_session, 1, datetime(2025, 1, 1, 10, 0),
+                                               datetime(2025, 1, 1, 11, 0), index=RoomIntervalIndex())
+    assert result is True
+    mock_session.exec.assert_called_once()
+
+# ===== Hledání volných termínů =====
+
+def test_working_spans_skip_weekend():
+    """Okno Pá 12:00 – Po 12:00 = dva úseky, sobota a neděle vynechány."""
+    spans = BookingService.working_spans(datetime(2025, 1, 3, 12, 0), datetime(2025, 1, 6, 12, 0))
+    assert spans == [
+        (datetime(2025, 1, 3, 12, 0), datetime(2025, 1, 4, 0, 0)),
+        (datetime(2025, 1, 6, 0, 0), datetime(2025, 1, 6, 12, 0)),
+    ]
+
+def test_working_spans_merge_consecutive_days():
+    """Navazující pracovní dny tvoří jeden úsek."""
+    spans = BookingService.working_spans(datetime(2025, 1, 6, 8, 0), datetime(2025, 1, 7, 18, 0))
+    assert spans == [(datetime(2025, 1, 6, 8, 0), datetime(2025, 1, 7, 18, 0))]
+
+def test_working_spans_weekend_only_is_empty():
+    """Okno jen o víkendu = žádné termíny."""
+    assert BookingService.working_spans(datetime(2025, 1, 4, 8, 0), datetime(2025, 1, 5, 18, 0)) == []
+
+def test_free_slots_between_bookings():
+    """Volné úseky jsou mezery mezi rezervacemi v rámci okna."""
+    spans = [(datetime(2025, 1, 6, 8, 0), datetime(2025, 1, 6, 18, 0))]
+    intervals = [
+        (datetime(2025, 1, 6, 7, 0), datetime(2025, 1, 6, 9, 0)),
+        (datetime(2025, 1, 6, 10, 0), datetime(2025, 1, 6, 12, 0)),
+    ]
+    slots = BookingService.free_slots(intervals, spans, timedelta(minutes=30))
+    assert slots == [
+        (datetime(2025, 1, 6, 9, 0), datetime(2025, 1, 6, 10, 0)),
+        (datetime(2025, 1, 6, 12, 0), datetime(2025, 1, 6, 18, 0)),
+    ]
+
+def test_free_slots_respect_min_duration():
+    """Hraniční případ: mezera kratší než požadovaná délka se nevrací, stejně dlouhá ano."""
+    spans = [(datetime(2025, 1, 6, 8, 0), datetime(2025, 1, 6, 10, 0))]
+    intervals = [(datetime(2025, 1, 6, 8, 20), datetime(2025, 1, 6, 9, 30))]
+    slots = BookingService.free_slots(intervals, spans, timedelta(minutes=30))
+    assert slots == [(datetime(2025, 1, 6, 9, 30), datetime(2025, 1, 6, 10, 0))]
+
+def test_free_slots_booking_spanning_weekend():
+    """Rezervace přes víkend blokuje konec pátku i začátek pondělí."""
+    spans = BookingService.working_spans(datetime(2025, 1, 3, 16, 0), datetime(2025, 1, 6, 12, 0))
+    intervals = [(datetime(2025, 1, 3, 17, 0), datetime(2025, 1, 6, 9, 0))]
+    slots = BookingService.free_slots(intervals, spans, timedelta(minutes=30))
+    assert slots == [
+        (datetime(2025, 1, 3, 16, 0), datetime(2025, 1, 3, 17, 0)),
+        (datetime(2025, 1, 6, 9, 0), datetime(2025, 1, 6, 12, 0)),
+    ]
+
+# ===== KeyedLock (zámky podle místnosti/uživatele) =====
+
+def test_keyed_lock_releases_and_forgets_keys():
+    """Po uvolnění se zámek zahodí – slovník neroste s počtem klíčů."""
+    locks = KeyedLock()
+    with locks.hold(("room", 1), ("user", 2)):
+        assert set(locks._locks) == {("room", 1), ("user", 2)}
+    assert locks._locks == {}
+
+def test_keyed_lock_different_keys_do_not_block():
+    """Zámek jiné místnosti lze získat, i když je první držen."""
+    locks = KeyedLock()
+    acquired = threading.Event()
+
+    def other_room():
+        with locks.hold(("room", 2)):
+            acquired.set()
+
+    with locks.hold(("room", 1)):
+        worker = threading.Thread(target=other_room)
+        worker.start()
+        worker.join(timeout=1)
+        assert acquired.is_set()
+
+# ===== Opakované rezervace =====
+
+def _recurring(frequency, count, start=datetime(2025, 1, 7, 10, 0), hours=1):
+    return RecurringBookingCreate(room_id=1, user_id=1, attendees=2, frequency=frequency, count=count,
+                                  start_time=start, end_time=start + timedelta(hours=hours))
+
+def test_expand_weekly_recurrence():
+    """Každé úterý 10–11 po 52 týdnů = 52 výskytů po týdnu."""
+    occurrences, skipped = BookingService.expand_recurrence(_recurring("weekly", 52))
+    assert len(occurrences) == 52
+    assert skipped == 0
+    assert occurrences[1].start_time == datetime(2025, 1, 14, 10, 0)
+    assert occurrences[-1].end_time == datetime(2025, 12, 30, 11, 0)
+    assert all(o.start_time.weekday() == 1 for o in occurrences)
+
+def test_expand_daily_recurrence_skips_weekends():
+    """Denní opakování od pátku: sobota a neděle se vynechají."""
+    occurrences, skipped = BookingService.expand_recurrence(
+        _recurring("daily", 4, start=datetime(2025, 1, 3, 9, 0)))
+    assert [o.start_time.day for o in occurrences] == [3, 6]
+    assert skipped == 2
+
+def test_expand_recurrence_invalid_frequency():
+    with pytest.raises(ValueError, match="Frequency"):
+        BookingService.expand_recurrence(_recurring("monthly", 3))
+
+def test_expand_recurrence_count_out_of_range():
+    with pytest.raises(ValueError, match="Occurrence count"):
+        BookingService.expand_recurrence(_recurring("daily", 0))
+
+def test_expand_recurrence_occurrence_longer_than_interval():
+    """Výskyt delší než krok opakování by se překrýval sám se sebou."""
+    with pytest.raises(ValueError, match="recurrence interval"):
+        BookingService.expand_recurrence(_recurring("daily", 3, hours=25))
+
+# ===== Statistiky obsazenosti =====
+
+def test_split_interval_by_hour():
+    """Rezervace 9:30–11:15 → 30 + 60 + 15 minut v hodinových bucketech."""
+    parts = split_interval(datetime(2025, 1, 6, 9, 30), datetime(2025, 1, 6, 11, 15), "hour")
+    assert [(slot.hour, seconds / 60) for slot, seconds in parts] == [(9, 30), (10, 60), (11, 15)]
+
+def test_split_interval_across_midnight_by_day():
+    parts = split_interval(datetime(2025, 1, 6, 23, 0), datetime(2025, 1, 7, 1, 0), "day")
+    assert parts == [(datetime(2025, 1, 6), 3600), (datetime(2025, 1, 7), 3600)]
+
+def test_bucket_start_week_begins_on_monday():
+    assert bucket_start(datetime(2025, 1, 9, 15, 45), "week") == datetime(2025, 1, 6)
+
+# ===== Pipeline pravidel (levná pravidla první) =====
+
+def _booking_data(**changes):
+    data = {"room_id": 1, "user_id": 1, "attendees": 2,
+            "start_time": datetime(2025, 1, 6, 10, 0), "end_time": datetime(2025, 1, 6, 11, 0)}
+    return BookingCreate(**{**data, **changes})
+
+def test_booking_rules_ordered_by_cost():
+    """Čisté kontroly běží před cache a ty před dotazy do DB."""
+    costs = [rule.cost for rule in BOOKING_RULES.rules]
+    assert costs == sorted(costs)
+    assert [rule.name for rule in BOOKING_RULES.rules][:3] == ["attendees", "times", "working_days"]
+
+def test_pipeline_pure_rejection_never_touches_session():
+    """Víkendová rezervace se odmítne bez jediného volání session."""
+    session = Mock()
+    check = BookingCheck(_booking_data(start_time=datetime(2025, 1, 4, 10), end_time=datetime(2025, 1, 4, 11)),
+                         session)
+
+    with pytest.raises(ValueError, match="weekends"):
+        BOOKING_RULES.run(check)
+
+    assert session.mock_calls == []
+
+def test_pipeline_runs_only_requested_cost_range():
+    calls = []
+    pipeline = RulePipeline([
+        BookingRule("db", DB, lambda c: calls.append("db")),
+        BookingRule("pure", PURE, lambda c: calls.append("pure")),
+        BookingRule("cached", CACHED, lambda c: calls.append("cached")),
+    ])
+
+    pipeline.run(BookingCheck(_booking_data()), max_cost=CACHED)
+    pipeline.run(BookingCheck(_booking_data()), min_cost=DB)
+
+    assert calls == ["pure", "cached", "db"]
+
+def test_pipeline_records_rejection_rate_and_short_circuits():
+    """Odmítnutí se počítá pravidlu, které selhalo; další pravidla se nevyhodnotí."""
+    def reject(check):
+        raise ValueError("Rejected")
+    pipeline = RulePipeline([BookingRule("first", PURE, reject), BookingRule("second", DB, lambda c: None)])
+
+    with pytest.raises(ValueError):
+        pipeline.run(BookingCheck(_booking_data()))
+
+    first, second = pipeline.stats()
+    assert (first["evaluated"], first["rejected"], first["rejection_rate"]) == (1, 1, 1.0)
+    assert second["evaluated"] == 0
+
+# ===== ICS (iCalendar) =====
+
+def test_ics_escape_text():
+    assert escape_text("A, B; C\\D\nE") == "A\\, B\\; C\\\\D\\nE"
+
+def test_ics_fold_long_line_at_75_octets():
+    """Dlouhý řádek se zalomí po 75 oktetech, pokračování začíná mezerou."""
+    folded = fold_line("SUMMARY:" + "x" * 100)
+    lines = folded.split(b"\r\n")
+    assert len(lines[0]) == 75
+    assert lines[1].startswith(b" ")
+    assert folded.replace(b"\r\n ", b"") == b"SUMMARY:" + b"x" * 100 + b"\r\n"
+
+def test_ics_fold_does_not_split_utf8_characters():
+    folded = fold_line("SUMMARY:" + "č" * 60)
+    for line in folded.split(b"\r\n "):
+        line.decode()  # žádný rozdělený znak
@@ -0,0 +1,57 @@
+import pytest
+from app import metrics
+from app.metrics import Counter, Histogram
+
+# Unit testy metrik (histogramy, měření kroků, formát Prometheus).
+
+def test_histogram_renders_cumulative_buckets():
+    """Počty v bucketech jsou kumulativní, +Inf = celkový počet."""
+    histogram = Histogram("test_seconds", "Test.", ("stage",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "a")
+    histogram.observe(0.5, "a")
+    histogram.observe(3.0, "a")
+
+    lines = histogram.render()
+
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="a",le="1"} 2' in lines
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="a"} 3' in lines
+    assert 'test_seconds_sum{stage="a"} 3.550000' in lines
+
+def test_histogram_boundary_value_falls_into_bucket():
+    """Hodnota rovná hranici patří do bucketu (le = less or equal)."""
+    histogram = Histogram("edge_seconds", "Test.", buckets=(1.0,))
+    histogram.observe(1.0)
+    assert "edge_seconds_bucket{le=\"1\"} 1" in histogram.render()
+
+def test_counter_label_values_are_escaped():
+    counter = Counter("escaped_total", "Test.", ("rule",))
+    counter.inc('a"b')
+    assert 'escaped_total{rule="a\\"b"} 1' in counter.render()
+
+def test_stage_counts_rejection_per_rule(monkeypatch):
+    """ValueError uvnitř kroku se započítá jako odmítnutí daným pravidlem."""
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    before = metrics.booking_rejections.value("test_rule")
+
+    with pytest.raises(ValueError):
+        with metrics.stage("test_rule"):
+            raise ValueError("Rejected")
+    with metrics.stage("test_rule"):
+        pass
+
+    assert metrics.booking_rejections.value("test_rule") == before + 1
+    assert metrics.booking_stage_duration.count("test_rule") >= 2
+
+def test_stage_disabled_is_shared_noop(monkeypatch):
+    """Vypnuté metriky: stage() nic neměří ani nealokuje."""
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+
+    with pytest.raises(ValueError):
+        with metrics.stage("disabled_rule"):
+            raise ValueError("Rejected")
+
+    assert metrics.stage("disabled_rule") is metrics.stage("other")
+    assert metrics.booking_rejections.value("disabled_rule") == 0
+    assert metrics.booking_stage_duration.count("disabled_rule") == 0
@@ -0,0 +1,142 @@
+import pytest
+from datetime import datetime
+from sqlmodel import SQLModel, Session, create_engine, select
+from sqlalchemy import delete, inspect, text
+from sqlalchemy.pool import StaticPool
+from app.models import Room, User, Booking, ChangeLog, IdempotencyRecord
+from app.services import BookingService
+from app.database import migrate_indexes, migrate_booking_autoincrement
+from app.queries import page_statement, booking_page_statement
+from app.stats import rollup_statement, usage_statement
+from app.archive import archive_batch_statement
+
+# Regresní testy plánů dotazů: žádný dotaz služby nesmí číst celou tabulku (SCAN).
+
+engine = create_engine(
+    "sqlite://",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool
+)
+
+@pytest.fixture(autouse=True)
+def schema():
+    SQLModel.metadata.create_all(engine)
+    yield
+    SQLModel.metadata.drop_all(engine)
+
+def query_plan(statement):
+    """Vrátí řádky EXPLAIN QUERY PLAN pro daný SQLAlchemy dotaz."""
+    compiled = statement.compile(dialect=engine.dialect, compile_kwargs={"render_postcompile": True})
+    # na hodnotách parametrů plán (bez ANALYZE statistik) nezávisí
+    params = tuple(None for _ in compiled.positiontup)
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+    return [row[3] for row in rows]
+
+def assert_no_scan(statement):
+    plan = query_plan(statement)
+    scans = [step for step in plan if step.startswith("SCAN")]
+    assert not scans, f"Query falls back to a full scan: {plan}"
+    return plan
+
+START = datetime(2025, 1, 1, 10, 0)
+END = datetime(2025, 1, 1, 11, 0)
+
+SERVICE_QUERIES = {
+    "check_availability": lambda: BookingService.availability_statement(1, START, END),
+    "validate_user_limit": lambda: BookingService.user_limit_statement(1, START),
+    "room_by_id": lambda: select(Room).where(Room.id == 1),
+    "user_by_id": lambda: select(User).where(User.id == 1),
+    "user_by_email": lambda: select(User).where(User.email == "a@a.cz"),
+    "bulk_future_counts": lambda: BookingService.future_counts_statement([1, 2], START),
+    "bulk_intervals": lambda: BookingService.intervals_statement([1, 2], START, END),
+    "bulk_rooms": lambda: select(Room).where(Room.id.in_([1, 2])),
+    "list_rooms_page": lambda: page_statement(Room, 0).limit(100),
+    "list_users_page": lambda: page_statement(User, 0).limit(100),
+    "list_bookings_page": lambda: page_statement(Booking, 0).limit(100),
+    "list_bookings_by_room": lambda: booking_page_statement(0, room_id=1, start_time=START, end_time=END).limit(100),
+    "list_bookings_by_user": lambda: booking_page_statement(0, user_id=1, start_time=START).limit(100),
+    "usage_rollups": lambda: rollup_statement(START.date(), END.date()),
+    "rooms_by_capacity": lambda: BookingService.rooms_by_capacity_statement(8).limit(50),
+    "rooms_by_capacity_next_batch": lambda: BookingService.rooms_by_capacity_statement(8, (10, 3)).limit(50),
+    "archive_batch": lambda: archive_batch_statement(START, 1000),
+    "list_bookings_with_archive": lambda: booking_page_statement(0, room_id=1, start_time=START,
+                                                                 include_archive=True).limit(100),
+    "list_bookings_page_with_archive": lambda: booking_page_statement(0, include_archive=True).limit(100),
+    "change_log_since": lambda: select(ChangeLog).where(ChangeLog.id > 0).order_by(ChangeLog.id),
+    "change_log_prune": lambda: delete(ChangeLog).where(ChangeLog.created_at < START),
+    "idempotency_prune": lambda: delete(IdempotencyRecord).where(IdempotencyRecord.created_at < START),
+}
+
+@pytest.mark.parametrize("name", SERVICE_QUERIES)
+def test_service_query_does_not_scan(name):
+    """Každý dotaz služby musí jít přes index (SEARCH), ne přes SCAN."""
+    assert_no_scan(SERVICE_QUERIES[name]())
+
+def test_check_availability_uses_room_time_index():
+    plan = assert_no_scan(SERVICE_QUERIES["check_availability"]())
+    assert any("ix_booking_room_start_end" in step for step in plan)
+
+def test_validate_user_limit_uses_user_start_index():
+    plan = assert_no_scan(SERVICE_QUERIES["validate_user_limit"]())
+    assert any("ix_booking_user_start" in step for step in plan)
+
+def test_migrate_indexes_adds_missing_indexes_to_existing_db():
+    """Migrace: databáze vytvořená bez indexů je po migrate_indexes() dostane."""
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_booking_room_start_end"))
+        conn.execute(text("DROP INDEX ix_booking_user_start"))
+
+    migrate_indexes(engine)
+    migrate_indexes(engine)  # idempotentní
+
+    names = {index["name"] for index in inspect(engine).get_indexes("booking")}
+    assert {"ix_booking_room_start_end", "ix_booking_user_start"} <= names
+
+def test_migrate_booking_autoincrement_rebuilds_legacy_table():
+    """Migrace: booking bez AUTOINCREMENT se přestaví, řádky zůstanou a id nenavážou na archiv."""
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE booking"))
+        conn.execute(text("CREATE TABLE booking (id INTEGER NOT NULL PRIMARY KEY, room_id INTEGER NOT NULL, "
+                          "user_id INTEGER NOT NULL, start_time DATETIME NOT NULL, end_time DATETIME NOT NULL, "
+                          "attendees INTEGER NOT NULL)"))
+        conn.execute(text("INSERT INTO booking VALUES (1, 1, 1, '2025-01-06 10:00:00', '2025-01-06 11:00:00', 2)"))
+        conn.execute(text("INSERT INTO booking_archive VALUES "
+                          "(7, 1, 1, '2020-01-06 10:00:00', '2020-01-06 11:00:00', 2)"))
+
+    with engine.begin() as conn:
+        migrate_booking_autoincrement(conn)
+        migrate_booking_autoincrement(conn)  # idempotentní
+    with Session(engine) as session:
+        booking = Booking(room_id=1, user_id=1, attendees=2,
+                          start_time=datetime(2025, 1, 7, 10, 0), end_time=datetime(2025, 1, 7, 11, 0))
+        session.add(booking)
+        session.commit()
+        ids = session.exec(select(Booking.id).order_by(Booking.id)).all()
+
+    with engine.connect() as conn:
+        sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'booking'")).scalar()
+    names = {index["name"] for index in inspect(engine).get_indexes("booking")}
+    assert "AUTOINCREMENT" in sql
+    assert {"ix_booking_room_start_end", "ix_booking_user_start", "ix_booking_end"} <= names
+    assert ids == [1, 8]
+
+def test_filtered_booking_lists_use_booking_indexes():
+    plan = assert_no_scan(SERVICE_QUERIES["list_bookings_by_room"]())
+    assert any("ix_booking_room_start_end" in step for step in plan)
+    plan = assert_no_scan(SERVICE_QUERIES["list_bookings_by_user"]())
+    assert any("ix_booking_user_start" in step for step in plan)
+
+def test_rooms_by_capacity_uses_capacity_index():
+    """Výběr nejmenší místnosti jde po indexu kapacity bez řazení v paměti."""
+    plan = assert_no_scan(SERVICE_QUERIES["rooms_by_capacity"]())
+    assert any("ix_room_capacity" in step for step in plan)
+    assert not any("TEMP B-TREE" in step for step in plan)
+
+@pytest.mark.parametrize("bucket", ["hour", "day", "week"])
+def test_usage_statement_reads_bookings_by_room_time_index(bucket):
+    """Obsazenost se sčítá v SQL; booking i archiv se čtou přes index, SCAN je jen nad CTE parts."""
+    plan = query_plan(usage_statement([1, 2], START, END, bucket))
+    assert any("SEARCH booking " in step and "ix_booking_room_start_end" in step for step in plan)
+    assert any("SEARCH booking_archive" in step and "ix_booking_archive_room_start" in step for step in plan)
+    assert not any(step.startswith("SCAN") and "parts" not in step for step in plan)
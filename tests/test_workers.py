@@ -0,0 +1,260 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, create_engine, select
+from app import archive, database
+from app.database import apply_sqlite_pragmas
+from app.cache import FutureBookingCounter, EntityCache, TableVersions, LRUCache
+from app.changelog import ChangeFeed
+from app.config import CHANGE_LOG_RETENTION_HOURS
+from app.events import EventBus
+from app.interval_index import RoomIntervalIndex
+from app.models import Booking, ChangeLog, Room, User
+from benchmarks.common import uvicorn_server
+
+# Sdílení změn mezi workery: dva ChangeFeedy nad jednou souborovou DB
+# simulují dva procesy, závěrečný test spouští skutečný uvicorn --workers.
+
+SLOT = datetime(2024, 3, 4, 10, 0)
+
+
+def _engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'workers.db'}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Room(name="Sdílená", capacity=10))
+        session.add(User(username="worker", email="worker@test.cz"))
+        session.commit()
+    return engine
+
+
+def _feed(engine):
+    """ChangeFeed s vlastním stavem, jako by běžel v samostatném procesu."""
+    feed = ChangeFeed(index=RoomIntervalIndex(), counter=FutureBookingCounter(), entities=EntityCache(16, 60),
+                      versions=TableVersions(), responses=LRUCache(16, 60), bus=EventBus())
+    feed.start(engine)
+    with Session(engine) as session:
+        feed.index.load(session)
+    return feed
+
+
+def _book(engine, feed, start=SLOT):
+    with Session(engine) as session:
+        booking = Booking(room_id=1, user_id=1, start_time=start, end_time=start + timedelta(hours=1), attendees=2)
+        session.add(booking)
+        feed.record_bookings(session, "created", [booking])
+        session.commit()
+        return booking.id
+
+
+def test_booking_from_other_process_reaches_index(tmp_path):
+    """Rezervace zapsaná procesem A je po poll() v indexu procesu B; A své změny přeskočí."""
+    engine = _engine(tmp_path)
+    first, second = _feed(engine), _feed(engine)
+
+    booking_id = _book(engine, first)
+
+    assert second.poll() == 1
+    assert second.index.find_overlap(1, SLOT, SLOT + timedelta(minutes=30)) == booking_id
+    assert second.versions.get("booking") == 1
+    assert first.poll() == 0
+    assert first.last_id == second.last_id
+    engine.dispose()
+
+
+def test_moved_booking_from_other_process_updates_index(tmp_path):
+    """Přesun v procesu A: B vyřadí původní interval a zařadí nový."""
+    engine = _engine(tmp_path)
+    first, second = _feed(engine), _feed(engine)
+    booking_id = _book(engine, first)
+    second.poll()
+    with Session(engine) as session:
+        booking = session.get(Booking, booking_id)
+        before = Booking(**booking.model_dump())
+        booking.start_time, booking.end_time = SLOT + timedelta(hours=3), SLOT + timedelta(hours=4)
+        first.record_bookings(session, "updated", [booking], previous=[before])
+        session.commit()
+
+    second.poll()
+
+    assert second.index.find_overlap(1, SLOT, SLOT + timedelta(hours=1)) is None
+    assert second.index.find_overlap(1, SLOT + timedelta(hours=3), SLOT + timedelta(hours=4)) == booking_id
+    engine.dispose()
+
+
+def test_poll_without_commit_does_not_read_log(tmp_path):
+    """Beze změny data_version se change_log vůbec nečte."""
+    engine = _engine(tmp_path)
+    feed = _feed(engine)
+
+    assert feed.poll() == 0
+    assert feed.poll() == 0
+    assert feed.last_id == 0
+    engine.dispose()
+
+
+def test_room_created_elsewhere_invalidates_cached_not_found(tmp_path):
+    """Proces B si zapamatoval „místnost neexistuje“; po vytvoření v A ji B najde."""
+    engine = _engine(tmp_path)
+    first, second = _feed(engine), _feed(engine)
+    with Session(engine) as session:
+        assert second.entities.get_room(session, 2) is None
+
+        room = Room(name="Nová", capacity=4)
+        session.add(room)
+        session.flush()
+        first.record(session, "room", "created", room.id)
+        session.commit()
+
+        second.poll()
+        assert second.entities.get_room(session, 2).name == "Nová"
+    engine.dispose()
+
+
+def test_pruned_changes_trigger_resync(tmp_path):
+    """Když prune() smaže nepřevzaté změny, proces načte index znovu z DB."""
+    engine = _engine(tmp_path)
+    first, second = _feed(engine), _feed(engine)
+    _book(engine, first)
+    with Session(engine) as session:
+        first.prune(session, now=datetime.now() + timedelta(days=30))
+        assert session.exec(select(ChangeLog)).all() == []
+    booking_id = _book(engine, first, SLOT + timedelta(days=1))
+
+    second.poll()
+
+    assert second.resyncs == 1
+    assert second.index.find_overlap(1, SLOT, SLOT + timedelta(minutes=30)) is not None
+    assert second.index.find_overlap(1, SLOT + timedelta(days=1), SLOT + timedelta(days=1, minutes=30)) == booking_id
+    engine.dispose()
+
+
+def test_change_log_is_pruned_periodically(tmp_path):
+    """Proces promaže change_log nejvýš jednou za prune_interval, ne jen při startu."""
+    engine = _engine(tmp_path)
+    feed = _feed(engine)
+    expired = datetime.now() + timedelta(hours=CHANGE_LOG_RETENTION_HOURS, minutes=1)
+    _book(engine, feed)
+
+    assert feed.prune_if_due(now=expired) == 1
+    _book(engine, feed, SLOT + timedelta(days=1))
+    assert feed.prune_if_due(now=expired + feed.prune_interval / 2) == 0
+    assert feed.prune_if_due(now=expired + feed.prune_interval) == 1
+
+    with Session(engine) as session:
+        assert session.exec(select(ChangeLog)).all() == []
+    assert ChangeFeed().prune_if_due() == 0  # vypnutý feed nemaže
+    engine.dispose()
+
+
+def test_disabled_feed_records_nothing(tmp_path):
+    engine = _engine(tmp_path)
+    feed = ChangeFeed()
+
+    _book(engine, feed)
+
+    with Session(engine) as session:
+        assert session.exec(select(ChangeLog)).all() == []
+    assert feed.poll() == 0
+    engine.dispose()
+
+
+def test_archive_cli_shares_changes_with_workers(tmp_path, monkeypatch):
+    """python -m app.archive s MULTI_WORKER zapíše přesun do change_log – worker ho převezme."""
+    engine = _engine(tmp_path)
+    worker = _feed(engine)
+    _book(engine, worker, start=datetime(2020, 1, 6, 10, 0))
+    monkeypatch.setattr(archive, "MULTI_WORKER", True)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "create_db_and_tables", lambda: None)
+    monkeypatch.setattr("sys.argv", ["app.archive", "--before", "2021-01-01T00:00:00"])
+
+    archive.main()
+
+    assert worker.poll() == 1
+    assert worker.index.find_overlap(1, datetime(2020, 1, 6, 10, 0), datetime(2020, 1, 6, 11, 0)) is None
+    assert not archive.change_feed.enabled
+    engine.dispose()
+
+
+# === Skutečné procesy ===
+
+WORKERS = 3
+PARALLEL_REQUESTS = 24
+
+
+def _post_all(base_url, payloads):
+    """Všechny požadavky naráz, každý přes vlastní spojení (rozloží se mezi workery)."""
+    barrier = threading.Barrier(len(payloads))
+
+    def post(payload):
+        with httpx.Client(base_url=base_url, timeout=30.0) as client:
+            barrier.wait()
+            return client.post("/bookings/", json=payload).status_code
+
+    with ThreadPoolExecutor(max_workers=len(payloads)) as pool:
+        return list(pool.map(post, payloads))
+
+
+def test_workers_share_bookings_and_caches(tmp_path):
+    """
+    uvicorn --workers 3 nad prázdnou DB: schéma vytvoří jeden proces, souběžné
+    rezervace stejného termínu projde v celém clusteru právě jedna a místnost
+    vytvořená jedním workerem není pro ostatní „nenalezená“ z cache.
+    """
+    with uvicorn_server(tmp_path / "cluster.db", env={"MULTI_WORKER": "1"}, workers=WORKERS) as base_url:
+        with httpx.Client(base_url=base_url, timeout=30.0) as client:
+            assert client.post("/rooms/", json={"name": "Sdílená", "capacity": 10}).status_code == 200
+            for i in range(PARALLEL_REQUESTS):
+                client.post("/users/", json={"username": f"u{i}", "email": f"u{i}@test.cz"})
+            assert client.get("/diagnostics/workers").json()["enabled"] is True
+
+        payload = {"room_id": 2, "user_id": 1, "start_time": SLOT.isoformat(),
+                   "end_time": (SLOT + timedelta(hours=1)).isoformat(), "attendees": 2}
+        assert set(_post_all(base_url, [payload] * PARALLEL_REQUESTS)) == {404}
+        with httpx.Client(base_url=base_url, timeout=30.0) as client:
+            client.post("/rooms/", json={"name": "Pozdější", "capacity": 10})
+        later = [{**payload, "start_time": (SLOT + timedelta(weeks=i)).isoformat(),
+                  "end_time": (SLOT + timedelta(weeks=i, hours=1)).isoformat()} for i in range(PARALLEL_REQUESTS)]
+        assert set(_post_all(base_url, later)) == {200}
+
+        same_slot = [{**payload, "room_id": 1, "user_id": i + 1} for i in range(PARALLEL_REQUESTS)]
+        statuses = _post_all(base_url, same_slot)
+
+        assert statuses.count(200) == 1
+        assert statuses.count(400) == PARALLEL_REQUESTS - 1
+        with httpx.Client(base_url=base_url, timeout=30.0) as client:
+            for _ in range(WORKERS * 3):
+                assert len(client.get("/bookings/", params={"room_id": 1}).json()) == 1
+
+
+def test_workers_share_idempotency_keys(tmp_path):
+    """
+    Souběžná opakování se stejným Idempotency-Key rozložená mezi workery:
+    vznikne jedna rezervace a všechny odpovědi jsou stejné (rezervace klíče
+    je ve stejné transakci jako zápis, ne jen v zámku procesu).
+    """
+    with uvicorn_server(tmp_path / "idempotent.db", env={"MULTI_WORKER": "1"}, workers=WORKERS) as base_url:
+        with httpx.Client(base_url=base_url, timeout=30.0) as client:
+            client.post("/rooms/", json={"name": "Opakovaná", "capacity": 10})
+            client.post("/users/", json={"username": "retry", "email": "retry@test.cz"})
+        payload = {"room_id": 1, "user_id": 1, "start_time": SLOT.isoformat(),
+                   "end_time": (SLOT + timedelta(hours=1)).isoformat(), "attendees": 2}
+        barrier = threading.Barrier(PARALLEL_REQUESTS)
+
+        def post(_):
+            with httpx.Client(base_url=base_url, timeout=30.0) as client:
+                barrier.wait()
+                return client.post("/bookings/", json=payload, headers={"Idempotency-Key": "cluster-1"})
+
+        with ThreadPoolExecutor(max_workers=PARALLEL_REQUESTS) as pool:
+            responses = list(pool.map(post, range(PARALLEL_REQUESTS)))
+
+        assert [r.status_code for r in responses] == [200] * PARALLEL_REQUESTS
+        assert len({r.json()["id"] for r in responses}) == 1
+        with httpx.Client(base_url=base_url, timeout=30.0) as client:
+            assert len(client.get("/bookings/").json()) == 1